@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Diff of revisions computed by the API (action=compare).
+
+The API returns the diff as HTML table rows. The added lines and the inserted parts of changed lines
+are extracted from the table, which is much cheaper than fetching and diffing the full revision texts
+of large pages.
+"""
+import re
+try:
+    from html import unescape
+except ImportError:
+    from HTMLParser import HTMLParser
+    unescape = HTMLParser().unescape
+
+from pywikibot.data import api
+
+_row_re = re.compile(r'<tr[^>]*>(.*?)</tr>', re.S)
+_lineno_re = re.compile(r'<td [^>]*class="diff-lineno')
+_added_re = re.compile(r'<td class="diff-addedline[^"]*"[^>]*>(.*?)</td>', re.S)
+_deleted_re = re.compile(r'<td class="diff-deletedline[^"]*"[^>]*>(.*?)</td>', re.S)
+_context_re = re.compile(r'<td class="diff-context[^"]*"[^>]*>(.*?)</td>', re.S)
+_ins_re = re.compile(r'<ins class="diffchange[^"]*">(.*?)</ins>', re.S)
+_tag_re = re.compile(r'<[^>]+>')
+_ref_open_re = re.compile(r'<ref(\s[^>]*)?>', re.I)
+_ref_close_re = re.compile(r'</ref\s*>', re.I)
+_table_row_re = re.compile(r'^\s*[|!]')
+
+
+def _text(html):
+    return unescape(_tag_re.sub('', html))
+
+
+def compare(site, fromrev, torev, prop='diff|user|comment|timestamp'):
+    """
+    Comparison of fromrev -> torev: dict with the HTML diff table rows (body) and details of torev
+    (touser, tocomment, totimestamp)
+    """
+    params = {
+        'action': 'compare',
+        'fromrev': fromrev,
+        'torev': torev,
+        'prop': prop,
+        'formatversion': 2
+    }
+    data = api.Request(site=site, parameters=params).submit()
+    return data['compare']
+
+
+def _depth(line):
+    """
+    Change of the nesting of templates, tables and references by a line of wikitext
+    """
+    stripped = line.strip()
+    refs = [ref for ref in _ref_open_re.findall(line) if not ref.endswith('/')]  # <ref name=x /> is closed
+    return (line.count('{{') - line.count('}}') + stripped.startswith('{|') - stripped.startswith('|}') +
+            len(refs) - len(_ref_close_re.findall(line)))
+
+
+def _outside_markup(lines):
+    """
+    Whether each line of a hunk (lines of the new revision) is outside of templates, tables and references.
+    The hunk may start or end inside of them, so only the lines at the shallowest nesting of the hunk which
+    don't open or close anything are outside. Table rows and template parameters (lines starting with | or !)
+    are never outside
+    """
+    depths = [0]
+    for line in lines:
+        depths.append(depths[-1] + _depth(line))
+    base = min(depths)
+    return [depths[i] == base and depths[i + 1] == base and not _table_row_re.match(line)
+            for i, line in enumerate(lines)]
+
+
+def inserted_segments(diff_html, skip_markup=False):
+    """
+    Text inserted by the diff: added lines, and the inserted parts of changed lines.
+    Added lines that are identical to a deleted line (moved text) are skipped.
+
+    The diff has only the changed lines with a few lines of context, so the wikitext of the inserted text
+    can't be cleaned reliably if it is inside a template, table or reference that starts or ends on an
+    unchanged line. With skip_markup, such lines are skipped (by the nesting within the hunks of the diff)
+    """
+    hunks = [[]]  # lists of (line of the new revision, inserted text or None for context line, changed)
+    deleted_lines = set()
+    for row in _row_re.findall(diff_html):
+        if _lineno_re.search(row):
+            hunks.append([])
+            continue
+        added = _added_re.search(row)
+        deleted = _deleted_re.search(row)
+        if deleted is not None:
+            deleted_lines.add(_text(deleted.group(1)))
+        if added is None:
+            context = _context_re.findall(row)
+            if context:
+                hunks[-1].append((_text(context[-1]), None, False))
+            continue
+        line = _text(added.group(1))
+        if deleted is not None and _text(deleted.group(1)).strip():
+            inserted = [_text(part) for part in _ins_re.findall(added.group(1))]  # changed line
+            hunks[-1].append((line, ' '.join(inserted), True))
+        else:
+            hunks[-1].append((line, line, False))
+
+    segments = []
+    added_lines = []
+    for hunk in hunks:
+        outside = _outside_markup([line for line, _, _ in hunk]) if skip_markup else [True] * len(hunk)
+        for (line, inserted, changed), keep in zip(hunk, outside):
+            if inserted is None or not keep:
+                continue
+            if changed:
+                if inserted:
+                    segments.append(inserted)
+            elif line not in deleted_lines:
+                added_lines.append(line)
+    return added_lines + segments
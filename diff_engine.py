@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+Diff engines used to find the text inserted by an edit.
+
+The original engine runs difflib.SequenceMatcher over the whole article character by character,
+which is very slow for large articles. The line engine diffs lines using patience diff (unique
+lines are used as anchors) and refines replaced lines by a word level diff.
+
+Both engines return a list of inserted text segments.
+
+Benchmark:
+    python diff_engine.py old1.txt new1.txt [old2.txt new2.txt ...]
+"""
+import bisect
+import difflib
+import re
+import sys
+import time
+
+_token_re = re.compile(r'\s+|\w+|[^\w\s]', re.U)
+
+# above this size (product of token counts) the word level refinement uses difflib autojunk heuristic
+MAX_REFINE_SIZE = 4000000
+
+
+class CharDiffEngine(object):
+    """
+    Character level diff using difflib (the legacy engine)
+    """
+    name = 'char'
+
+    def inserted(self, old, new):
+        diffy = difflib.SequenceMatcher()
+        diffy.set_seqs(old, new)
+        return [new[after_start:after_end] for opcode, before_start, before_end, after_start, after_end in
+                diffy.get_opcodes() if opcode == 'insert']
+
+
+class LineDiffEngine(object):
+    """
+    Patience line diff with word level refinement of replaced lines
+    """
+    name = 'line'
+
+    def inserted(self, old, new):
+        a = old.split('\n')
+        b = new.split('\n')
+        segments = []
+        for tag, i1, i2, j1, j2 in line_opcodes(a, b):
+            if tag == 'insert':
+                segments.append('\n'.join(b[j1:j2]))
+            elif tag == 'replace':
+                segments += self._refine('\n'.join(a[i1:i2]), '\n'.join(b[j1:j2]))
+        return segments
+
+    def _refine(self, old, new):
+        old_tokens = _token_re.findall(old)
+        new_tokens = _token_re.findall(new)
+        autojunk = len(old_tokens) * len(new_tokens) > MAX_REFINE_SIZE
+        matcher = difflib.SequenceMatcher(None, old_tokens, new_tokens, autojunk=autojunk)
+        return [''.join(new_tokens[j1:j2]) for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag == 'insert']
+
+
+def _unique_anchors(a, b, alo, ahi, blo, bhi):
+    """
+    Pairs of indices of lines appearing exactly once in both ranges, in longest increasing order
+    """
+    counts = {}
+    for i in range(alo, ahi):
+        line = a[i]
+        entry = counts.get(line)
+        counts[line] = [1, i, None] if entry is None else [entry[0] + 1, i, None]
+    for j in range(blo, bhi):
+        entry = counts.get(b[j])
+        if entry is None or entry[0] != 1:
+            continue
+        if entry[2] is None:
+            entry[2] = j
+        else:
+            entry[0] = 2  # not unique in b
+    pairs = sorted((entry[1], entry[2]) for entry in counts.values() if entry[0] == 1 and entry[2] is not None)
+    if not pairs:
+        return []
+
+    # longest increasing subsequence on b indices (patience sorting)
+    tails = []
+    tails_idx = []
+    backlinks = [None] * len(pairs)
+    for k, (i, j) in enumerate(pairs):
+        pos = bisect.bisect_left(tails, j)
+        if pos > 0:
+            backlinks[k] = tails_idx[pos - 1]
+        if pos == len(tails):
+            tails.append(j)
+            tails_idx.append(k)
+        else:
+            tails[pos] = j
+            tails_idx[pos] = k
+    anchors = []
+    k = tails_idx[-1]
+    while k is not None:
+        anchors.append(pairs[k])
+        k = backlinks[k]
+    anchors.reverse()
+    return anchors
+
+
+def line_matching_blocks(a, b):
+    """
+    Matching blocks (i, j, size) of two lists of lines using patience diff
+    """
+    blocks = []
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        alo, ahi, blo, bhi = stack.pop()
+        # common prefix and suffix
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            blocks.append((alo, blo, 1))
+            alo += 1
+            blo += 1
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi -= 1
+            bhi -= 1
+            blocks.append((ahi, bhi, 1))
+        if alo == ahi or blo == bhi:
+            continue
+        anchors = _unique_anchors(a, b, alo, ahi, blo, bhi)
+        if not anchors:
+            # no unique lines - fallback to difflib for this (usually small) region
+            matcher = difflib.SequenceMatcher(None, a[alo:ahi], b[blo:bhi], autojunk=False)
+            for i, j, size in matcher.get_matching_blocks():
+                for k in range(size):
+                    blocks.append((alo + i + k, blo + j + k, 1))
+            continue
+        prev_i, prev_j = alo, blo
+        for i, j in anchors:
+            blocks.append((i, j, 1))
+            stack.append((prev_i, i, prev_j, j))
+            prev_i, prev_j = i + 1, j + 1
+        stack.append((prev_i, ahi, prev_j, bhi))
+
+    blocks.sort()
+    merged = []
+    for i, j, size in blocks:
+        if merged and merged[-1][0] + merged[-1][2] == i and merged[-1][1] + merged[-1][2] == j:
+            merged[-1] = (merged[-1][0], merged[-1][1], merged[-1][2] + size)
+        else:
+            merged.append((i, j, size))
+    merged.append((len(a), len(b), 0))
+    return merged
+
+
+def line_opcodes(a, b):
+    """
+    Opcodes in the format of difflib.SequenceMatcher.get_opcodes for two lists of lines
+    """
+    i = j = 0
+    opcodes = []
+    for ai, bj, size in line_matching_blocks(a, b):
+        tag = ''
+        if i < ai and j < bj:
+            tag = 'replace'
+        elif i < ai:
+            tag = 'delete'
+        elif j < bj:
+            tag = 'insert'
+        if tag:
+            opcodes.append((tag, i, ai, j, bj))
+        i, j = ai + size, bj + size
+        if size:
+            opcodes.append(('equal', ai, i, bj, j))
+    return opcodes
+
+
+diff_engines = {
+    CharDiffEngine.name: CharDiffEngine,
+    LineDiffEngine.name: LineDiffEngine,
+}
+
+
+def get_diff_engine(name):
+    if name not in diff_engines:
+        raise ValueError('Unknown diff engine "{}". Valid engines: {}'.format(name, ', '.join(sorted(diff_engines))))
+    return diff_engines[name]()
+
+
+def main(*args):
+    """
+    Compare the engines on pairs of revision texts given as files
+    """
+    if len(args) == 0 or len(args) % 2 != 0:
+        print(__doc__)
+        return
+    pairs = []
+    for old_file, new_file in zip(args[::2], args[1::2]):
+        with open(old_file, 'rb') as old_f, open(new_file, 'rb') as new_f:
+            pairs.append((old_f.read().decode('utf8'), new_f.read().decode('utf8')))
+    for name in sorted(diff_engines):
+        engine = get_diff_engine(name)
+        start = time.time()
+        added = sum(len(''.join(engine.inserted(old, new))) for old, new in pairs)
+        print('{}: {:.3f}s for {} pairs ({} inserted chars)'.format(name, time.time() - start, len(pairs), added))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
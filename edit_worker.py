@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+CPU bound part of checking an edit: cleaning the revision texts and finding the added text.
+
+The functions are module level and get and return plain texts, so they can run in worker processes
+(ProcessPoolExecutor) while the bot process does the network and reporting work.
+The worker processes are started by a fork server (see process_pool), as forking the multithreaded bot
+process may deadlock the workers.
+
+Benchmark of serial and process pool execution:
+    python edit_worker.py workers old1.txt new1.txt [old2.txt new2.txt ...]
+"""
+import multiprocessing
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pywikibot
+
+from diff_engine import get_diff_engine
+from wikitext_cleaner import remove_wikitext, WORDS_QUOTE
+
+_fact_re = re.compile('^(\S+(\s|$)){1,4}$')
+
+
+def added_text(old, new, diff_engine='line'):
+    """
+    Text added from the cleaned text old to the cleaned text new (before removing moved content)
+    """
+    diff = get_diff_engine(diff_engine).inserted(old, new)
+    diff = [new_t for new_t in u'\n'.join(diff).split(u'\n') if new_t not in old and ' ' in new_t] # remove text appeared in original or very small addition
+    # avoid reoccurence
+    added_set = set()
+    diff_clean = []
+    for new_line in diff:
+        if new_line in added_set: continue
+        diff_clean.append(new_line)
+        added_set.add(new_line)
+    diff = diff_clean
+
+    # remove list of facts
+    diff = [line for line in diff if not _fact_re.match(line.strip('* |'))]
+
+    # clean some html/wikitext from the text before sending to server...
+    # you may use mwparserfromhell to get cleaner text (but this requires dependency...)
+    return pywikibot.textlib.removeHTMLParts(u'\n'.join(diff), keeptags=[])
+
+
+def clean_and_diff(old_text, new_text, old=None, new=None, diff_engine='line', words_quote=WORDS_QUOTE):
+    """
+    Clean the revision texts (unless the cleaned texts old and new are given) and find the added text.
+    Returns tuple of cleaned old text, cleaned new text and the added text
+    """
+    if old is None:
+        old = remove_wikitext(old_text, words_quote)
+    if new is None:
+        new = remove_wikitext(new_text, words_quote)
+    return old, new, added_text(old, new, diff_engine)
+
+
+def process_pool(workers):
+    """
+    Process pool of workers for clean_and_diff. The workers are started by a fork server (or spawned where
+    it isn't available) and are started immediately, so create the pool before starting other threads
+    """
+    try:
+        context = multiprocessing.get_context('forkserver')
+    except ValueError:  # no fork server (windows)
+        context = multiprocessing.get_context('spawn')
+    except AttributeError:  # python 2
+        context = None
+    if context is None:
+        pool = ProcessPoolExecutor(max_workers=workers)
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+    list(pool.map(clean_and_diff, [''] * workers, [''] * workers))  # start the workers
+    return pool
+
+
+def main(*args):
+    """
+    Compare serial execution and process pool execution of cleaning and diffing pairs of texts given as files
+    """
+    if len(args) < 3 or len(args) % 2 == 0:
+        print(__doc__)
+        return
+    workers = int(args[0])
+    texts = []
+    for file_name in args[1:]:
+        with open(file_name, 'rb') as f:
+            texts.append(f.read().decode('utf8'))
+    pairs = list(zip(texts[::2], texts[1::2]))
+
+    start = time.time()
+    expected = [clean_and_diff(old_text, new_text) for old_text, new_text in pairs]
+    serial_time = time.time() - start
+
+    pool = process_pool(workers)
+    start = time.time()
+    result = list(pool.map(clean_and_diff, [old_text for old_text, _ in pairs], [new_text for _, new_text in pairs]))
+    pool_time = time.time() - start
+    pool.shutdown()
+
+    assert expected == result
+    print('{} edits'.format(len(pairs)))
+    print('serial: {:.3f}s ({:.1f} edits/s)'.format(serial_time, len(pairs) / serial_time))
+    print('{} workers: {:.3f}s ({:.1f} edits/s)'.format(workers, pool_time, len(pairs) / pool_time))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
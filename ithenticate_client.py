@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""
+Client for iThenticate XML-RPC API.
+
+The client shares a single login session between a bounded pool of worker threads.
+Each thread uses its own ServerProxy (ServerProxy objects are not thread safe).
+"""
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+try:
+    from xmlrpc import client as xmlrpclib
+except:
+    import xmlrpclib
+
+ITHENTICATE_URL = 'https://api.ithenticate.com/rpc'
+
+SUBMIT_TO_GENERATE_REPORT = 1
+SUBMIT_TO_STORE_IN_REPOSITORY = 2
+SUBMIT_TO_STORE_IN_REPOSITORY_AND_GENERATE_REPORT = 3
+
+
+class IThenticateError(Exception):
+    pass
+
+
+class IThenticateClient(object):
+    def __init__(self, username, password, url=ITHENTICATE_URL, concurrency=4, folder_name='Wikipedia'):
+        self.username = username
+        self.password = password
+        self.url = url
+        self.folder_name = folder_name
+        self.concurrency = concurrency
+        self.sid = None
+        self.folder = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.rpc_calls = Counter()  # number of calls per API method
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    def _proxy(self):
+        proxy = getattr(self._local, 'proxy', None)
+        if proxy is None:
+            proxy = xmlrpclib.ServerProxy(self.url)
+            self._local.proxy = proxy
+        return proxy
+
+    def call(self, method, **params):
+        """
+        Call an API method (e.g document.get) with the session id. Raises IThenticateError on invalid status
+        """
+        with self._lock:
+            self.rpc_calls[method] += 1
+        func = self._proxy()
+        for name in method.split('.'):
+            func = getattr(func, name)
+        params['sid'] = self.sid
+        response = func(params)
+        if response['status'] != 200:
+            raise IThenticateError('Invalid status from server for {}: {}'.format(method, response['status']))
+        return response
+
+    def login(self):
+        with self._lock:
+            self.rpc_calls['login'] += 1
+        login_response = self._proxy().login({'username': self.username, 'password': self.password})
+        if login_response['status'] != 200:
+            raise IThenticateError('Login failed. Response status: {}'.format(login_response['status']))
+        self.sid = login_response['sid']
+
+        folder_list_response = self.call('folder.list')
+        self.folder = None
+        for folder in folder_list_response['folders']:
+            if folder['name'] == self.folder_name:
+                self.folder = folder
+                break
+        if self.folder is None:
+            raise IThenticateError('No {} folder found!'.format(self.folder_name))
+
+    def upload(self, text, title, filename):
+        """
+        Upload text for generating report and returns the document id
+        """
+        submit_response = self.call('document.add',
+                                    submit_to=SUBMIT_TO_GENERATE_REPORT,
+                                    folder=self.folder['id'],
+                                    uploads=[{'title': title,
+                                              'author_first': 'Random',
+                                              'author_last': 'Author',
+                                              'filename': filename,
+                                              'upload': xmlrpclib.Binary(text)}])
+        try:
+            return submit_response['uploaded'][0]['id']
+        except (KeyError, IndexError):
+            raise IThenticateError('Invalid upload response: {}'.format(submit_response))
+
+    def document(self, document_id):
+        return self.call('document.get', id=document_id)['documents'][0]
+
+    def report(self, part_id):
+        """
+        Returns report.get and report.sources responses of a document part
+        """
+        return self.call('report.get', id=part_id), self.call('report.sources', id=part_id)
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Run func in the client thread pool and return future
+        """
+        return self.executor.submit(func, *args, **kwargs)
+
+    def map(self, func, *iterables):
+        """
+        Concurrent version of map bounded by the client concurrency
+        """
+        return list(self.executor.map(func, *iterables))
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+class DocumentStatusTracker(object):
+    """
+    Cached status table of uploaded documents.
+
+    Each poll cycle fetches only the documents that are still pending, and the fetched documents are kept
+    for report generation so no additional document.get is required. A document whose fetch failed stays
+    pending until it failed max_errors times in a row, and then the exception is kept as its result.
+    """
+
+    def __init__(self, client, max_errors=3):
+        self.client = client
+        self.max_errors = max_errors
+        self.documents = {}  # document id -> processed document, exception or None if pending
+        self.failures = {}  # document id -> number of failed fetches in a row
+
+    def add(self, document_id):
+        self.documents[document_id] = None
+
+    def remove(self, document_id):
+        self.documents.pop(document_id, None)
+        self.failures.pop(document_id, None)
+
+    def pending(self, document_ids=None):
+        if document_ids is None:
+            document_ids = list(self.documents)
+        return [document_id for document_id in document_ids if self.documents.get(document_id, False) is None]
+
+    def ready(self, document_ids=None):
+        return len(self.pending(document_ids)) == 0
+
+    def _fetch(self, document_id):
+        try:
+            return self.client.document(document_id)
+        except Exception as e:
+            return e
+
+    def poll(self, document_ids=None):
+        """
+        Fetch status of pending documents (all documents or only document_ids) and returns list of documents
+        that are still pending
+        """
+        pending = self.pending(document_ids)
+        for document_id, document in zip(pending, self.client.map(self._fetch, pending)):
+            if isinstance(document, Exception):
+                self.failures[document_id] = self.failures.get(document_id, 0) + 1
+                if self.failures[document_id] >= self.max_errors:
+                    self.documents[document_id] = document
+                continue
+            self.failures.pop(document_id, None)
+            if not document['is_pending']:
+                self.documents[document_id] = document
+        return self.pending(pending)
+
+    def failed(self, document_ids):
+        """
+        The documents of document_ids whose last fetch failed
+        """
+        return [document_id for document_id in document_ids if document_id in self.failures]
+
+    def document(self, document_id):
+        """
+        The processed document (dict). Raises the fetch exception if fetching the document failed
+        """
+        document = self.documents.get(document_id)
+        if isinstance(document, Exception):
+            raise document
+        return document
+
+
+def _median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+class PollScheduler(object):
+    """
+    Schedules polls of uploaded documents by the observed processing times.
+
+    Processing times are recorded per document size bucket (powers of 2 of the text length). The first poll
+    of a document is scheduled at the median processing time of its bucket, and further polls back off
+    exponentially. Polls of documents that are still pending are counted as wasted. Documents that failed
+    to be fetched are polled again on the next poll and aren't counted in the processing times.
+    """
+
+    def __init__(self, default_wait=30, min_backoff=5, max_backoff=120, history=100):
+        self.default_wait = default_wait
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.history = history
+        self.processing_times = {}  # size bucket -> recent processing times
+        self.scheduled = {}  # document id -> dict of upload time, size, next poll time, polls, last pending poll
+        self.polls = 0
+        self.wasted_polls = 0
+        self.ready_times = deque(maxlen=1000)  # time from upload until the poll that found the document processed
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def bucket(size):
+        return max(size, 1).bit_length()
+
+    def expected_time(self, size):
+        times = self.processing_times.get(self.bucket(size))
+        return _median(times) if times else self.default_wait
+
+    def add(self, document_id, size, upload_time=None):
+        upload_time = time.time() if upload_time is None else upload_time
+        with self._lock:
+            self.scheduled[document_id] = {
+                'upload_time': upload_time,
+                'size': size,
+                'next_poll': upload_time + self.expected_time(size),
+                'polls': 0,
+                'last_pending': upload_time
+            }
+
+    def remove(self, document_id):
+        with self._lock:
+            self.scheduled.pop(document_id, None)
+
+    def due(self, document_ids=None, now=None):
+        """
+        Documents (of all the scheduled documents or of document_ids) that should be polled now.
+        Documents that are not scheduled are always due
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            if document_ids is None:
+                document_ids = list(self.scheduled)
+            return [document_id for document_id in document_ids
+                    if document_id not in self.scheduled or self.scheduled[document_id]['next_poll'] <= now]
+
+    def next_poll(self, document_ids=None):
+        """
+        Time of the next due poll (of all the scheduled documents or of document_ids), or None
+        """
+        with self._lock:
+            if document_ids is None:
+                document_ids = list(self.scheduled)
+            times = [self.scheduled[document_id]['next_poll'] if document_id in self.scheduled else time.time()
+                     for document_id in document_ids]
+        return min(times) if times else None
+
+    def polled(self, document_ids, pending, failed=(), now=None):
+        """
+        Record poll results of document_ids, of which pending are still pending and failed couldn't be fetched
+        """
+        now = time.time() if now is None else now
+        pending = set(pending)
+        failed = set(failed)
+        with self._lock:
+            for document_id in document_ids:
+                entry = self.scheduled.get(document_id)
+                if entry is None:
+                    continue
+                self.polls += 1
+                if document_id in failed:
+                    if document_id in pending:
+                        entry['next_poll'] = now  # retry on the next poll
+                    else:
+                        del self.scheduled[document_id]  # gave up on the document
+                    continue
+                entry['polls'] += 1
+                if document_id in pending:
+                    self.wasted_polls += 1
+                    entry['last_pending'] = now
+                    entry['next_poll'] = now + min(self.max_backoff, self.min_backoff * 2 ** (entry['polls'] - 1))
+                    continue
+                # the document was processed sometime between the last pending poll and now
+                times = self.processing_times.setdefault(self.bucket(entry['size']), deque(maxlen=self.history))
+                times.append((entry['last_pending'] + now) / 2.0 - entry['upload_time'])
+                self.ready_times.append(now - entry['upload_time'])
+                del self.scheduled[document_id]
+
+    def format_stats(self):
+        with self._lock:
+            expected = ', '.join('<{}: {:.0f}s'.format(2 ** bucket, _median(times))
+                                 for bucket, times in sorted(self.processing_times.items()))
+            return 'Poll scheduler: {} polls ({} wasted), median time to processed report {:.0f}s [{}]'.format(
+                self.polls, self.wasted_polls, _median(self.ready_times) if self.ready_times else 0, expected)
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Measurements of the bot performance.
+
+Histogram keeps the recent samples of a measurement (e.g latency of a pipeline stage) for percentiles.
+MetricsRegistry collects named histograms and counters, which can be served over HTTP in Prometheus
+text format (start_metrics_server) or dumped periodically as JSON.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+
+class Histogram(object):
+    def __init__(self, max_samples=10000):
+        self.samples = deque(maxlen=max_samples)
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.samples.append(value)
+            self.count += 1
+            self.total += value
+
+    def percentiles(self, percents=(50, 90, 99)):
+        """
+        Dict of percent to the percentile of the recent samples (0 if there are no samples)
+        """
+        with self._lock:
+            samples = sorted(self.samples)
+        if len(samples) == 0:
+            return dict((percent, 0.0) for percent in percents)
+        return dict((percent, samples[min(len(samples) - 1, int(len(samples) * percent / 100.0))])
+                    for percent in percents)
+
+
+class Counter(object):
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _Timer(object):
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.histogram.observe(time.time() - self.start)
+        return False
+
+
+class MetricsRegistry(object):
+    """
+    Named histograms and counters, exported in Prometheus text format or as JSON
+    """
+
+    def __init__(self, prefix='plagiabot_'):
+        self.prefix = prefix
+        self.histograms = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name):
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            return self.histograms[name]
+
+    def register(self, name, metric):
+        """
+        Add an existing histogram or counter (e.g latency or errors of a pipeline stage)
+        """
+        with self._lock:
+            if isinstance(metric, Counter):
+                self.counters[name] = metric
+            else:
+                self.histograms[name] = metric
+
+    def counter(self, name):
+        with self._lock:
+            if name not in self.counters:
+                self.counters[name] = Counter()
+            return self.counters[name]
+
+    def timer(self, name):
+        """
+        Context manager that records the duration of its block in seconds to histogram name
+        """
+        return _Timer(self.histogram(name))
+
+    def inc(self, name, amount=1):
+        self.counter(name).inc(amount)
+
+    def to_dict(self):
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        result = {'counters': dict((name, counter.value) for name, counter in counters), 'histograms': {}}
+        for name, histogram in histograms:
+            percentiles = histogram.percentiles()
+            result['histograms'][name] = {'count': histogram.count, 'sum': histogram.total,
+                                          'p50': percentiles[50], 'p90': percentiles[90], 'p99': percentiles[99]}
+        return result
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), sort_keys=True)
+
+    def to_prometheus(self):
+        """
+        Metrics in Prometheus text exposition format (histograms are exported as summaries)
+        """
+        metrics = self.to_dict()
+        lines = []
+        for name, value in sorted(metrics['counters'].items()):
+            lines.append('# TYPE {}{}_total counter'.format(self.prefix, name))
+            lines.append('{}{}_total {}'.format(self.prefix, name, value))
+        for name, histogram in sorted(metrics['histograms'].items()):
+            lines.append('# TYPE {}{} summary'.format(self.prefix, name))
+            for percent in (50, 90, 99):
+                lines.append('{}{}{{quantile="{}"}} {}'.format(self.prefix, name, percent / 100.0,
+                                                              histogram['p{}'.format(percent)]))
+            lines.append('{}{}_sum {}'.format(self.prefix, name, histogram['sum']))
+            lines.append('{}{}_count {}'.format(self.prefix, name, histogram['count']))
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        """
+        Write the metrics as JSON to path (replacing it)
+        """
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(self.to_json())
+        os.rename(tmp_path, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registries = []
+
+    def do_GET(self):
+        if self.path.startswith('/metrics.json'):
+            body = json.dumps(dict((registry.prefix, registry.to_dict()) for registry in self.registries),
+                              sort_keys=True)
+            content_type = 'application/json'
+        else:
+            body = ''.join(registry.to_prometheus() for registry in self.registries)
+            content_type = 'text/plain; version=0.0.4'
+        body = body.encode('utf8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_metrics_server(registries, port, host='127.0.0.1'):
+    """
+    Serve the metrics of the registries on http://host:port/metrics (Prometheus) and /metrics.json in a daemon thread
+    """
+    handler = type('MetricsHandler', (_MetricsHandler,), {'registries': list(registries)})
+    server = HTTPServer((host, port), handler)
+    thread = threading.Thread(target=server.serve_forever, name='metrics-server')
+    thread.daemon = True
+    thread.start()
+    return server
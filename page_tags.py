@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+WikiProject tags of the reported pages.
+
+The tags are the WikiProject templates of the talk page. The talk pages of all the reports of an update
+are looked up together (prop=templates for many titles, following talk page redirects), and the tags
+are kept for ttl seconds, as the same popular articles are reported again and again.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import pywikibot
+from pywikibot.data import api
+
+_project_re = re.compile('WikiProject ')
+
+
+class PageTagResolver(object):
+    def __init__(self, site, ttl=24 * 3600, max_titles=10000, batch_size=50):
+        self.site = site
+        self.ttl = ttl
+        self.max_titles = max_titles
+        self.batch_size = batch_size
+        self.lookups = 0
+        self.hits = 0
+        self.requests = 0
+        self._tags = OrderedDict()  # title -> (projects, time)
+        self._lock = threading.Lock()
+
+    def tags(self, titles):
+        """
+        Dict of title to the list of WikiProjects of its talk page
+        """
+        now = time.time()
+        result = {}
+        missing = []
+        with self._lock:
+            for title in set(titles):
+                self.lookups += 1
+                if title in self._tags and now - self._tags[title][1] < self.ttl:
+                    self.hits += 1
+                    result[title] = self._tags[title][0]
+                else:
+                    missing.append(title)
+        if missing:
+            try:
+                fetched = self._fetch(missing)
+            except Exception as e:
+                pywikibot.output("Error occurred in fetching page tags: %s" % str(e))
+                fetched = {}
+            with self._lock:
+                for title, projects in fetched.items():
+                    self._tags.pop(title, None)
+                    self._tags[title] = (projects, now)
+                while len(self._tags) > self.max_titles:
+                    self._tags.popitem(last=False)
+            for title in missing:
+                result[title] = fetched.get(title, [])
+        return result
+
+    def _fetch(self, titles):
+        talk_titles = dict((pywikibot.Page(self.site, title).toggleTalkPage().title(), title) for title in titles)
+        projects = dict((title, []) for title in titles)
+        talk_list = sorted(talk_titles)
+        for i in range(0, len(talk_list), self.batch_size):
+            batch = talk_list[i:i + self.batch_size]
+            params = {
+                'action': 'query',
+                'prop': 'templates',
+                'titles': '|'.join(batch),
+                'redirects': 1,
+                'tlnamespace': 10,
+                'tllimit': 'max',
+                'formatversion': 2
+            }
+            normalized = {}
+            redirects = {}
+            templates = {}  # title of a page in the response -> WikiProjects
+            while True:
+                self.requests += 1
+                data = api.Request(site=self.site, parameters=params).submit()
+                normalized.update((entry['from'], entry['to']) for entry in data['query'].get('normalized', []))
+                redirects.update((entry['from'], entry['to']) for entry in data['query'].get('redirects', []))
+                for page in data['query'].get('pages', []):
+                    page_projects = templates.setdefault(page['title'], [])
+                    for template in page.get('templates', []):
+                        name = template['title'].split(':', 1)[1]
+                        if _project_re.match(name) and '/' not in name:
+                            page_projects.append(name)
+                if 'continue' not in data:
+                    break
+                params.update(data['continue'])
+            for talk_title in batch:
+                talk_title_normalized = normalized.get(talk_title, talk_title)
+                target = redirects.get(talk_title_normalized, talk_title_normalized)
+                projects[talk_titles[talk_title]] += templates.get(target, [])
+        return projects
+
+    def format_stats(self):
+        return 'Page tags: {} lookups, {} cached, {} requests'.format(self.lookups, self.hits, self.requests)
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Producer/consumer pipeline of stages connected by bounded queues.
+
+Each stage runs on its own worker thread(s), so a slow stage (e.g waiting for iThenticate)
+doesn't block the stages before it until its input queue is full.
+"""
+import sys
+import threading
+import time
+import traceback
+if sys.version_info[0] > 2:
+    from queue import Queue, Empty
+else:
+    from Queue import Queue, Empty
+
+import pywikibot
+
+from metrics import Counter, Histogram
+
+_STOP = object()
+
+
+class Stage(object):
+    """
+    A pipeline stage.
+
+    func is called with a single item and returns an iterable of items for the next stage (or None).
+    If batch is set, func is called with a list of all the items available in the queue (up to batch items),
+    and with an empty list if no item arrived within timeout seconds - this allows periodic work.
+    flush is called when the pipeline stops, and returns the remaining items for the next stage.
+    """
+
+    def __init__(self, name, func, workers=1, maxsize=100, batch=None, timeout=None, flush=None):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.batch = batch
+        self.timeout = timeout
+        self.flush = flush
+        self.queue = Queue(maxsize)
+        self.next_stage = None
+        self.processed = 0
+        self.errors = Counter()  # calls of func that raised an exception
+        self.latency = Histogram()  # seconds per call of func
+        self.start_time = None
+        self._threads = []
+        self._lock = threading.Lock()
+        self._running_workers = 0
+
+    def put(self, item):
+        self.queue.put(item)
+
+    def start(self):
+        self.start_time = time.time()
+        self._running_workers = self.workers
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name='{}-{}'.format(self.name, i))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _emit(self, results):
+        if results is None or self.next_stage is None:
+            return
+        for result in results:
+            self.next_stage.put(result)
+
+    def _get_items(self):
+        try:
+            item = self.queue.get(timeout=self.timeout)
+        except Empty:
+            return []
+        if not self.batch:
+            return [item]
+        items = [item]
+        while item is not _STOP and len(items) < self.batch:
+            try:
+                item = self.queue.get_nowait()
+            except Empty:
+                break
+            items.append(item)
+        return items
+
+    def _process(self, items):
+        if len(items) == 0 and not self.batch:
+            return
+        start = time.time()
+        try:
+            if self.batch:
+                results = self.func(items)
+            else:
+                results = self.func(items[0])
+            if len(items) > 0:
+                self.latency.observe(time.time() - start)  # without waiting for the queue of the next stage
+            self._emit(results)
+        except Exception as e:
+            self.errors.inc()
+            pywikibot.error('Error in stage {}: {}\n{}'.format(self.name, e, traceback.format_exc()))
+        with self._lock:
+            self.processed += len(items)
+
+    def _work(self):
+        while True:
+            items = self._get_items()
+            stop = _STOP in items
+            self._process([item for item in items if item is not _STOP])
+            if stop:
+                break
+        with self._lock:
+            self._running_workers -= 1
+            last_worker = self._running_workers == 0
+        if not last_worker:
+            self.queue.put(_STOP)  # let the other workers of this stage stop
+        else:
+            if self.flush is not None:
+                self._emit(self.flush())
+            if self.next_stage is not None:
+                self.next_stage.put(_STOP)
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def stats(self):
+        elapsed = time.time() - self.start_time if self.start_time else 0
+        latency = self.latency.percentiles()
+        return {
+            'stage': self.name,
+            'queue': self.queue.qsize(),
+            'processed': self.processed,
+            'errors': self.errors.value,
+            'throughput': self.processed / elapsed if elapsed > 0 else 0.0,
+            'p50': latency[50],
+            'p90': latency[90],
+            'p99': latency[99]
+        }
+
+
+class Pipeline(object):
+    def __init__(self, stages):
+        self.stages = stages
+        for stage, next_stage in zip(stages, stages[1:]):
+            stage.next_stage = next_stage
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    def put(self, item):
+        self.stages[0].put(item)
+
+    def stage(self, name):
+        return next(stage for stage in self.stages if stage.name == name)
+
+    def stop(self):
+        """
+        Stop accepting new items and wait for all the stages to process their pending items
+        """
+        self.stages[0].put(_STOP)
+        for stage in self.stages:
+            stage.join()
+
+    def stats(self):
+        return [stage.stats() for stage in self.stages]
+
+    def format_stats(self):
+        return ' | '.join('{stage}: queue {queue}, done {processed} ({throughput:.2f}/s), errors {errors}'.format(**stat)
+                          for stat in self.stats())
@@ -9,13 +9,36 @@ to find copyright violations.
 Output can be to console (default) or to wiki page 
 
 Command line options:
-    -report:Page            page name to write report to.
+    -report:Page            page name to write report to. With -sites, {dbname} and {lang} in the name are replaced by
+                                the wiki of the report (e.g. -report:"User:EranBot/Copyright/{dbname}")
     -talkTemplate:Foo       Run on diffs of a pages with talk page containing {{Foo}}
     -pagesLinkedFrom:Bar    Run on diffs of pages linked from the page [[Wikipedia:Bar]]
     -recentchanges:X        Number of days to fetch recent changes. For 12 hours set 0.5.
     -blacklist:Page         page containing a blacklist of sites to ignore (Wikipedia mirrors)
                                 [[User:EranBot/Copyright/Blacklist]] is collaboratively maintained
                                 blacklist for English Wikipedia.
+    -concurrency:N          maximal number of concurrent requests to iThenticate (default 4)
+    -cleancache:File        SQLite file for storing cleaned revision texts between runs
+    -sourcecache:File       SQLite file for storing classification of sources (mirrors, CC etc) between runs
+    -reportstore:File       SQLite file for storing uploaded texts and their reports, reused for identical texts
+    -workqueue:File         SQLite file for storing pending edits and uploads of the live bot. A restarted bot resumes
+                                the pending work and continues the recent changes stream from where it stopped
+    -recentindex[:File]     skip text that exists in recently changed pages of the wiki (optional file for
+                                keeping the index between runs). With -live, the content of the pages of all the
+                                article edits in the recent changes stream is indexed (the revision before the
+                                edit, fetched in batches); otherwise only the content of the checked edits
+    -sites:en,he,...        with -live, check several wikis (languages of the family) in a single process. -workqueue
+                                and -recentindex files are kept per wiki (the file name is suffixed by the wiki)
+    -workers:N              clean and diff the revisions in N worker processes (default 0 - in the bot process)
+    -metrics:Port           serve metrics (stage latency histograms and counters) on http://127.0.0.1:Port/metrics
+                                in Prometheus text format (and /metrics.json)
+    -metricsdump:File       dump the metrics as JSON to File periodically (per wiki with -sites)
+    -prefilter              with -live, reject edits with too little inserted text by the diff of the API (action=compare)
+                                before fetching and cleaning the full revision texts
+    -comparesize:Bytes      edits of pages of at least Bytes are diffed by the API (action=compare) instead of fetching
+                                and diffing the full revision texts (default 100000, 0 - never)
+    -diff:engine            diff engine for finding added text: line (default) or char (legacy difflib
+                                character diff)
 
 &params;
 
@@ -35,27 +58,35 @@ Report on possible violations in the top 100 recent changes (no DB access requir
 """
 import time
 import datetime
-import difflib
+from collections import OrderedDict
 try:
     import oursql as MySQLdb
 except:
     import MySQLdb
 import re
 import uuid
-try:
-    from xmlrpc import client as xmlrpclib
-except:
-    import xmlrpclib
+import traceback
 import requests
-try:
-    from urllib import quote as urllib_quote
-except ImportError:
-    from urllib.parse import quote as urllib_quote  # python3 compatibility
 
 import pywikibot
 from pywikibot import pagegenerators, config
 from plagiabot_config import ithenticate_user, ithenticate_password
 import report_logger
+from diff_engine import get_diff_engine
+from ithenticate_client import IThenticateClient, DocumentStatusTracker, PollScheduler, ITHENTICATE_URL
+from pipeline import Pipeline, Stage
+from revision_store import RevisionStore, CleanedTextCache
+from blacklist import BlacklistMatcher
+from shingles import ShingleIndex, RecentContentIndex
+from rollback import RollbackChecker
+from sources import SourceFetcher, PageClassifier, SourceClassificationCache
+from report_store import ReportStore
+from work_queue import WorkQueue
+from metrics import MetricsRegistry, start_metrics_server
+from page_tags import PageTagResolver
+import wikitext_cleaner
+import edit_worker
+import compare_diff
 
 docuReplacements = {
     '&params;':     pagegenerators.parameterHelp,
@@ -64,7 +95,9 @@ docuReplacements = {
 db_host='{0}.labsdb'  # host name of the db (default to format in wmflabs)
 
 MIN_SIZE = 500  # minimum length of added text for sending to server
+COMPARE_SIZE = 100000  # minimum page size (bytes) for diffing by the API instead of the full revision texts
 MIN_PERCENTAGE = 50
+MAX_SOURCES = 3  # maximal number of sources in a report
 WORDS_QUOTE = 50
 MAX_AGE = 1  # how many days worth of recent changes to check
 DIFF_URL = '//tools.wmflabs.org/eranbot/ithenticate.py?rid=%s'
@@ -117,280 +150,298 @@ messages = {
 
 }
 DEBUG_MODE = False
-ignore_sites = [re.compile('\.wikipedia\.org'), re.compile('he-free.info'),
-                re.compile('lrd.yahooapis.com')]
+ignore_sites = BlacklistMatcher(['\.wikipedia\.org', 'he-free.info', 'lrd.yahooapis.com'])
 wikiEd_pages = set()
 def log(msg):
     pywikibot.log(msg)
     #print(msg)
 
 class PlagiaBot(object):
-    def __init__(self, site, generator, report_page=None, report_log=report_logger.ReportLogger()):
+    def __init__(self, site, generator, report_page=None, report_log=report_logger.ReportLogger(), diff_engine='line',
+                 concurrency=4, clean_cache=None, source_cache=None, recent_content=None, report_store=None, workers=0,
+                 shared=None):
+        """
+        shared - bot of another wiki whose process pool, HTTP pool for sources and poll scheduler are used
+        """
         self.generator = generator
+        self.diff_engine = get_diff_engine(diff_engine)
+        self.owns_services = shared is None  # the shared services are closed by the bot that created them
+        if shared is None:
+            self.process_pool = edit_worker.process_pool(workers) if workers > 0 else None
+            self.poll_scheduler = PollScheduler()
+            self.source_fetcher = SourceFetcher()
+            self.page_classifier = PageClassifier()
+        else:
+            self.process_pool = shared.process_pool
+            self.poll_scheduler = shared.poll_scheduler
+            self.source_fetcher = shared.source_fetcher
+            self.page_classifier = shared.page_classifier
+        self.metrics = MetricsRegistry()
+        self.metrics_dump = None  # file for JSON dump of the metrics
 
         # variables for connecting to server
-        self.server = None
-        self.folder = None
-        self.sid = None
+        self.client = None
+        self.tracker = None
+        self.ithenticate_url = ITHENTICATE_URL
+        self.concurrency = concurrency
+        self.reported_edits = 0
         self.site = site
         self.report_page = None if report_page is None else pywikibot.Page(self.site, report_page)
         self.uploads = []
-        self.last_uploads_status = time.time()
+        self.max_pending_time = 3600  # seconds to wait for iThenticate to process an upload
         self.report_log = report_log
+        self.revisions = RevisionStore(site)
+        self.clean_cache = CleanedTextCache() if clean_cache is None else clean_cache
+        self.recent_content = recent_content
+        self.source_cache = SourceClassificationCache() if source_cache is None else source_cache
+        self.report_store = ReportStore() if report_store is None else report_store
+        self.tag_resolver = PageTagResolver(site)
+        self.prefetch_size = 50  # number of edits to fetch their revisions together
+        self.compare_size = COMPARE_SIZE  # None - always diff the full revision texts
+        self._compared = {}  # new revid -> API comparison fetched before loading the edit
+        local_messages = messages[self.site.lang] if self.site.lang in messages else messages['en']
+        self.ignore_regex = re.compile(local_messages['ignore_summary'], re.I)
+        self.rollback_checker = RollbackChecker(site, local_messages['rollback_of_summary'])
 
     def _init_server(self):
-        self.server = xmlrpclib.ServerProxy("https://api.ithenticate.com/rpc")
-
-        pywikibot.output("Logging in to ithenticate...")
-        login_response = self.server.login({"username": ithenticate_user, "password": ithenticate_password})
-        assert (login_response['status'] == 200)
-        self.sid = login_response['sid']
-
-        pywikibot.output("Finding folder to upload into, with name 'Wikipedia'...")
-        folder_list_response = self.server.folder.list({'sid': self.sid})
-        assert (folder_list_response['status'] == 200)
-
-        for folder in folder_list_response['folders']:
-            if folder['name'] == 'Wikipedia':
-                self.folder = folder
-                break
-
-        if self.folder is None:
-            raise Exception('No Wikipedia folder found!')
+        if self.client is not None:
+            self.client.close()
+        self.client = IThenticateClient(ithenticate_user, ithenticate_password, url=self.ithenticate_url,
+                                        concurrency=self.concurrency)
+        if self.tracker is None:
+            self.tracker = DocumentStatusTracker(self.client)
         else:
-            pywikibot.output("\tFound")
+            self.tracker.client = self.client
+
+        pywikibot.output("Logging in to ithenticate and finding folder to upload into, with name 'Wikipedia'...")
+        self.client.login()
+        pywikibot.output("\tFound")
 
     def upload_diff(self, plagiatext, title, diff_id):
-        if self.server is None:
+        if self.client is None:
             self._init_server()
         pywikibot.output("\tUpload text to server...")
-
-        SUBMIT_TO_GENERATE_REPORT = 1
-        SUBMIT_TO_STORE_IN_REPOSITORY = 2
-        SUBMIT_TO_STORE_IN_REPOSITORY_AND_GENERATE_REPORT = 3
-
-        submit_response = self.server.document.add({
-            'sid': self.sid,
-            'submit_to': SUBMIT_TO_GENERATE_REPORT,
-            'folder': self.folder['id'],
-            'uploads': [{'title': '{}{}'.format(title, diff_id),#'%s - %i' % (title, uuid.uuid4()),
-                         'author_first': 'Random',
-                         'author_last': 'Author',
-                         'filename': diff_id,
-                         'upload': xmlrpclib.Binary(plagiatext)}]
-        })
-        if submit_response['status'] != 200:
-            pywikibot.output(submit_response)
-            raise Exception("Invalid status from server")
-        try:
-            upload = submit_response['uploaded'][0]
-            return upload['id']
-        except:
-            print(submit_response)
-            raise
+        self.metrics.inc('uploads')
+        with self.metrics.timer('upload_seconds'):
+            return self.client.upload(plagiatext, '{}{}'.format(title, diff_id), diff_id)
+
+    def poll_due(self, upload_ids):
+        """
+        Poll the uploads that are due by the poll scheduler. Returns the uploads that are still pending
+        """
+        due = self.poll_scheduler.due(self.tracker.pending(upload_ids))
+        if len(due) > 0:
+            self.metrics.inc('polls', len(due))
+            with self.metrics.timer('poll_seconds'):
+                pending = self.tracker.poll(due)
+            self.poll_scheduler.polled(due, pending, self.tracker.failed(due))
+        return self.tracker.pending(upload_ids)
 
     def uploads_ready(self):
-        if time.time()-self.last_uploads_status < 45:
-            return False
         pywikibot.output('Checking uploads ({}). '.format(len(self.uploads)), newline=False)
 
+        if len(self.uploads) == 0:
+            pywikibot.output('ready')
+            return True
+        pending = set(self.poll_due([upload_id for _, upload_id, _ in self.uploads]))
         for rev_details, upload_id, added_lines in self.uploads[::-1]:
-            document_get_response = self.server.document.get({'id': upload_id, 'sid': self.sid})
-            if (document_get_response['status'] != 200):
-                raise Exception('Error retreving document {}. Response status: {}'.format(upload_id, document_get_response['status']))
-            document = document_get_response['documents'][0]
-            pending = document['is_pending']
-            if pending:
+            if upload_id in pending:
                 pywikibot.output('Waiting for upload id {} for {} rev {}'.format(upload_id, rev_details['title'], rev_details['new']))
-                self.last_uploads_status = time.time()
                 return False
         pywikibot.output('ready')
         return True
 
-
-    def poll_response(self, upload_id, article_title, added_lines, rev_id):
-        global MIN_PERCENTAGE, DIFF_URL
-        pywikibot.output("Polling iThenticate until document has been processed...", newline=False)
-
-        retries = 0
-        retry_wait = pywikibot.config.retry_wait
-        while True:
-            try:
-                document_get_response = self.server.document.get({'id': upload_id, 'sid': self.sid})
-            except xmlrpclib.ProtocolError as e:
-                # silently drop this entry
-                pywikibot.output('Err ' + str(e))
-                return '', 0 
-            assert (document_get_response['status'] == 200)
-            document = document_get_response['documents'][0]
-            pending = document['is_pending']
-            if not pending:
-                break
-            if retry_wait > pywikibot.config.retry_max or retries == pywikibot.config.max_retries:
-                pywikibot.error('iThenticate pending after {} retries. Skipping.'.format(retries))
-                return '', 0
+    def wait_uploads(self, uploads):
+        """
+        Poll iThenticate until all the uploads have been processed or max_pending_time passed
+        """
+        pywikibot.output("Polling iThenticate until documents have been processed...", newline=False)
+        upload_ids = [upload_id for _, upload_id, _ in uploads]
+        deadline = time.time() + self.max_pending_time
+        pending = self.poll_due(upload_ids)
+        while len(pending) > 0:
+            if time.time() > deadline:
+                pywikibot.error('iThenticate pending for {} seconds. Skipping.'.format(self.max_pending_time))
+                for upload_id in pending:
+                    self.poll_scheduler.remove(upload_id)
+                return
             pywikibot.output('.', newline=False)
-            pywikibot.sleep(retry_wait)
-            retries += 1
-            retry_wait += pywikibot.config.retry_wait
+            pywikibot.sleep(max(0, min(self.poll_scheduler.next_poll(pending), deadline) - time.time()))
+            pending = self.poll_due(upload_ids)
         pywikibot.output('.')
+        pywikibot.output(self.poll_scheduler.format_stats())
+
+    def fetch_report(self, upload_id, rev_id):
+        """
+        Get the report of a processed upload. Returns tuple of document part and its (non ignored) sources, or None
+        """
+        stored_report = self.report_store.report(upload_id)
+        if stored_report is not None:
+            pywikibot.output('Reusing report of upload id {}'.format(upload_id))
+            return stored_report
+        try:
+            document = self.tracker.document(upload_id)
+        except Exception as e:
+            # silently drop this entry
+            pywikibot.output('Err ' + str(e))
+            self.report_store.forget(upload_id)
+            return None
+        if document is None:
+            return None  # still pending
         if 'parts' not in document:
             pywikibot.output('Error getting parts of document. Rev id: ' + str(rev_id))
-            return '', 0
+            return None
         for part in document['parts']:
             # not sure if there is always a single part, so looping over it instead.
             pywikibot.output("Part #%i has a %i%% match. Getting details..." % (part['id'], part['score']))
 
             try:
-                report_get_response = self.server.report.get({'id': part['id'], 'sid': self.sid})
-                assert (report_get_response['status'] == 200)
+                report_get_response, report_sources_response = self.client.report(part['id'])
                 pywikibot.output("Details are available on %s" % (report_get_response['report_url']))
-                report_sources_response = self.server.report.sources({'id': part['id'], 'sid': self.sid})
-                assert (report_sources_response['status'] == 200)
             except Exception as e:
                 # silently drop this entry
                 pywikibot.output('Err ' + str(e))
-                return '', 0
+                return None
 
-            report = []
             sources = [cp_source for cp_source in report_sources_response['sources'] if
-                       'linkurl' in cp_source and not any([ig.search(cp_source['linkurl']) for ig in ignore_sites])]
-            num_sources = 0
+                       'linkurl' in cp_source and not ignore_sites.search(cp_source['linkurl'])]
             pywikibot.output("%i non ignore sites found" % (len(sources)))
-            for source in sources:
-                pywikibot.output(source['linkurl'])
-                if int(source['percent']) < MIN_PERCENTAGE:
-                    pywikibot.output('Not enough similarity ({}%; Words: {})'.format(source['percent'],
-                                                                                     source['word_count']
-                                                                                     ))
-                    continue
-                
-                hint_text = ''
-                try:
-                    if source['linkurl'].lower() in added_lines.lower():  # the source is mentioned in the added text
-                        hint_text = '<span class="success">citation</span>'
+            self.report_store.put_report(upload_id, part, sources)
+            return part, sources
+        return None
+
+    def source_urls(self, sources, added_lines, article_title):
+        """
+        Urls of sources that should be fetched for verifying them. As the report has up to MAX_SOURCES sources,
+        only the first sources are fetched (sources that turn out to be skipped are replaced by fetching further
+        sources in poll_response)
+        """
+        global MIN_PERCENTAGE, MAX_SOURCES
+        urls = []
+        accepted = 0
+        for source in sources:
+            if int(source['percent']) < MIN_PERCENTAGE:
+                continue
+            if accepted + len(urls) >= MAX_SOURCES:
+                break
+            if source['linkurl'].lower() in added_lines.lower():
+                accepted += 1  # citation
+                continue
+            classification = self.source_cache.get(source['linkurl'], article_title)
+            if classification is None:
+                urls.append(source['linkurl'])
+            elif classification[0] != 'skip':
+                accepted += 1
+        return urls
+
+    def poll_response(self, upload_id, article_title, added_lines, rev_id, part_sources=None, source_pages=None):
+        """
+        Create report for upload. part_sources and source_pages are fetched if not given (see fetch_report and
+        SourceFetcher.fetch_all)
+        """
+        global MIN_PERCENTAGE, MAX_SOURCES, DIFF_URL
+        if part_sources is None:
+            part_sources = self.fetch_report(upload_id, rev_id)
+        if part_sources is None:
+            return '', 0
+        part, sources = part_sources
+        if source_pages is None:
+            source_pages = self.source_fetcher.fetch_all(self.source_urls(sources, added_lines, article_title))
+        report = []
+        num_sources = 0
+        for source in sources:
+            pywikibot.output(source['linkurl'])
+            if int(source['percent']) < MIN_PERCENTAGE:
+                pywikibot.output('Not enough similarity ({}%; Words: {})'.format(source['percent'],
+                                                                                 source['word_count']
+                                                                                 ))
+                continue
+            
+            hint_text = ''
+            try:
+                if source['linkurl'].lower() in added_lines.lower():  # the source is mentioned in the added text
+                    hint_text = '<span class="success">citation</span>'
+                else:
+                    classification = self.source_cache.get(source['linkurl'], article_title)
+                    if classification is None:
+                        req_source = source_pages.get(source['linkurl'])
+                        if req_source is None:
+                            req_source = self.source_fetcher.fetch(source['linkurl'])
+                        if isinstance(req_source, Exception):
+                            raise req_source
+                        verdict, hint_text, level = self.page_classifier.classify(req_source, article_title)
+                        if level is not None:
+                            self.source_cache.put(source['linkurl'], article_title, verdict, hint_text, level)
                     else:
-                        req_source = requests.get(source['linkurl'])
-                        if req_source.status_code == 200:
-                            title_encode = urllib_quote(article_title)
-                            mirror_re = re.compile('(wikipedia.org/w(iki/|/index.php\?title=)(%s|%s)|material from the Wikipedia article|From Wikipedia|source: wikipedia)' % (
-                                re.sub('[ _]', '[ _]', re.escape(article_title)), title_encode), re.I)
-                            if any(mirror_re.findall(req_source.text)):
-                                hint_text = '<span class="success">Mirror?</span>'
-                            elif any(
-                                    re.findall('under (the terms of the Creative Commons Attribution License)|<a href="http://creativecommons.org/licenses/',
-                                               req_source.text, re.I)):
-                                if any(re.findall('<a href="http://creativecommons.org/licenses/(.+?)/', req_source.text, re.I)):
-                                    cc_type = re.search('<a href="http://creativecommons.org/licenses/(.+?)/', req_source.text, re.I)
-                                    hint_text = '<span class="success">(CC-'+cc_type.group(1)+')</span>'
-                                else:
-                                    hint_text = '<span class="success">(CC) (is it NC?)</span>'
-                            elif len(req_source.text)<5 or any(re.findall('domain is for sale|buy this domain|get your domain name', req_source.text, re.I)) or \
-                                    (re.search('<html', req_source.text, re.I) and
-                                        len(re.findall('<a [^>]*>', req_source.text, re.I)) < 10):
-                                hint_text = '<span class="error">Low quality site</span>'
-                                pywikibot.output('Low quality site')
-                                continue  #  low quality sites
-                        elif req_source.status_code in [403,404, 500]:
-                            continue  # low quality source - ignore
-                    num_sources += 1
-                except requests.exceptions.ConnectionError:
-                    hint_text = '<span class="error">connection error</span>'
-                    pywikibot.output('Connection error to site')
-                    continue  # we trust it enough by now to just skip those results
-                except Exception as e:
-                    pywikibot.output('Err ' + str(e))
-                    num_sources += 1
-                    pass
-                compare_link = '//tools.wmflabs.org/copyvios?lang={{subst:CONTENTLANG}}&project={{lc:{{ns:Project}}}}&title=&oldid='+str(rev_id)+'&action=compare&url='+source['linkurl']
-                report.append("* %s % 3i%% %i words at [%s %s] %s<div class=\"mw-ui-button\">[%s Compare]</div>" % (
-                    source['collection'][0], source['percent'], source['word_count'], source['linkurl'], source['linkurl'][:80], hint_text, compare_link))
-                if num_sources == 3:
-                        break
-            report = '<div class="mw-ui-button">[%s report]</div>\n'%DIFF_URL%part['id']+'\n'.join(report) if len(report)>0 else ''
-            pywikibot.output(report)
-            return report, part['id']
+                        verdict, hint_text = classification
+                    if verdict == 'skip':
+                        if hint_text:
+                            pywikibot.output('Low quality site')
+                        continue  # low quality source - ignore
+                num_sources += 1
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                hint_text = '<span class="error">connection error</span>'
+                pywikibot.output('Connection error to site')
+                continue  # we trust it enough by now to just skip those results
+            except Exception as e:
+                pywikibot.output('Err ' + str(e))
+                num_sources += 1
+                pass
+            compare_link = '//tools.wmflabs.org/copyvios?lang={{subst:CONTENTLANG}}&project={{lc:{{ns:Project}}}}&title=&oldid='+str(rev_id)+'&action=compare&url='+source['linkurl']
+            report.append("* %s % 3i%% %i words at [%s %s] %s<div class=\"mw-ui-button\">[%s Compare]</div>" % (
+                source['collection'][0], source['percent'], source['word_count'], source['linkurl'], source['linkurl'][:80], hint_text, compare_link))
+            if num_sources == MAX_SOURCES:
+                    break
+        report = '<div class="mw-ui-button">[%s report]</div>\n'%DIFF_URL%part['id']+'\n'.join(report) if len(report)>0 else ''
+        pywikibot.output(report)
+        return report, part['id']
 
     def remove_wikitext(self, text):
-        # clean some html/wikitext from the text before sending to server...
-        # you may use mwparserfromhell to get cleaner text (but this requires dependency...)
         global WORDS_QUOTE
-        #remove refis
-        if text is None or len(text) == 0: return ''
-        refs = re.findall('<ref(?: .+?)?>(.*?)</ref>', text)
-        for ref in refs:
-            if ref.count(' ') < WORDS_QUOTE:
-                text = text.replace(ref, '')
-        clean_text = pywikibot.textlib.removeHTMLParts(text, keeptags=[])
-        clean_text  =re.sub("\[\[Category:.+?\]\]", "", clean_text)  # categories
-        clean_text = re.sub("\[\[[^\[\]]+\|([^\[\]]+)\]\]", "\\1", clean_text)  # [[link|textlink]]
-        clean_text = re.sub("\[\[(.+?)\]\]", "\\1", clean_text)  # [[links]]
-        clean_text = re.sub("\n(==+)\s*([^=]+)\s*\\1","\n\\2", clean_text) # remove == from titles
-        clean_text = re.sub("'''([^']+)'''","\\1", clean_text) # remove ''' bold
-        clean_text = re.sub("''([^']+)''","\\1", clean_text) # remove '' italics
-        clean_text = re.sub("(align|class|style)\s*=\s*(\".+?\"|[^\"].+? )", "", clean_text)  # common in wikitables (align|class|style) etc
-        clean_text = re.sub("\n\\|-.{0,20}","", clean_text) # clean wikitables new lines
-        clean_text = re.sub("(\n\\|}|\n\\{\\| *[^\n]*)","", clean_text) # clean open/end of wikitables
-        clean_text = re.sub("\n![^\\|]+\\|","\n", clean_text) # clean table headers
-        clean_text = re.sub("\s*\\| *\w+ *= *(\"?#?[A-Za-z0-9]+\"?|\n)","", clean_text) # clean technical definitions (in templates and tables)
-        clean_text = re.sub("(?:\\| *)+","|", clean_text) # compact
-        clean_text = re.sub("\\n\\| *","\\n", clean_text) # trim |
-        clean_text = re.sub("(File|Image):[^\\.]+?\\.(jpg|png|pdf|svg)","", clean_text, re.I) # file names
-
-        orig = clean_text
-        same = False
-        while not same:
-            clean_text = re.sub("\{\{[^\{]*?\}\}", "", clean_text, re.M)  # templates
-            same = clean_text == orig
-            orig = clean_text
-        clean_text = re.sub("\[https?:.*?\]", "", clean_text)  # external links
-
-        return clean_text
+        with self.metrics.timer('clean_seconds'):
+            return wikitext_cleaner.remove_wikitext(text, WORDS_QUOTE)
 
-    def was_rolledback(self, page, new_rev, added_lines):
-        rolledback = False
-        
-        self.site.loadrevisions(page, startid=new_rev,rvdir=True)
-
-        #Check whether the add lines exists in the current version or not
-        current_text = pywikibot.textlib.removeHTMLParts(self.remove_wikitext(page.text))
-        current_check = difflib.SequenceMatcher(None, added_lines, current_text)
-        current_match = current_check.find_longest_match(0,len(added_lines),0,len(current_text))
-        if float(current_match.size)/len(added_lines) > 0.8:
-            pywikibot.output("Added lines don't exist in current version - skipping")
-            return True
+    def clean_revision(self, revid, get_text):
+        """
+        Cleaned text of a revision. get_text is called for the revision text if it isn't cached
+        """
+        return self.clean_cache.get_or_clean((self.site.dbName(), revid), get_text, self.remove_wikitext)
 
-        # alternatively, look for rollback of that revision
-        editor = page._revisions[new_rev].user
-        local_messages = messages[self.site.lang] if self.site.lang in messages else messages['en']
-        try:
-            reverted_edit = re.compile(local_messages['rollback_of_summary'].format(editor, new_rev))
-            for rev in page._revisions:
-                user = page._revisions[rev].user
-                comment = page._revisions[rev].comment
-                is_the_editor = editor in comment
-                is_revert = reverted_edit.match(comment)
-                if is_revert and is_the_editor:
-                    #print('Was rolledback by {}: {}'.format(user,comment))
-                    rolledback = True
-        except:
-            pass
+    def was_rolledback(self, page, new_rev, added_lines):
+        def current_text(revid):
+            prefetched = revid in self.revisions.revisions
+            revision = self.revisions.get(revid)
+            if not prefetched:
+                self.revisions.discard([revid])
+            text = page.text if revision is None else revision['text']
+            return pywikibot.textlib.removeHTMLParts(self.clean_revision(revid, lambda: text))
+
+        with self.metrics.timer('rollback_check_seconds'):
+            rolledback = self.rollback_checker.was_rolledback(page.title(), new_rev, added_lines, current_text)
+        if rolledback:
+            pywikibot.output("Added lines exist in current version or the edit was reverted - skipping")
         return rolledback
 
-    def remove_moved_content(self, page, prev_rev, content, comment):
+    def remove_moved_content(self, page, prev_rev, content, comment, check_history=True):
+        """
+        Remove content that exists in older revisions of the page (if check_history) or in pages linked
+        from the edit summary
+        """
         global MIN_SIZE
-        if prev_rev != 0:
+        if prev_rev != 0 and check_history:
             self.site.loadrevisions(page, startid=prev_rev, getText=True, total=3)
+            index = ShingleIndex()
             for rev in page._revisions:
                 if rev>=prev_rev: continue
-                old_content = self.remove_wikitext(page.getOldVersion(rev))
-                content = u'\n'.join([line for line in content.split(u'\n') if line not in old_content])
+                index.add(self.clean_revision(rev, lambda: page.getOldVersion(rev)))
+            content = index.remove_existing_lines(content)
 
         if len(content) < MIN_SIZE:
             return content
 
         # moved content indicated from the comment itself
         possible_articles = re.findall('\[\[(.+?)\]\]', comment)
+        index = ShingleIndex()
         for pos_article in possible_articles:
             pos_page = pywikibot.Page(self.site, pos_article)
             try:
@@ -398,98 +449,329 @@ class PlagiaBot(object):
                 self.site.loadrevisions(pos_page, getText=True, total=2)
 
                 for rev in pos_page._revisions:
-                    old_content = self.remove_wikitext(pos_page.getOldVersion(rev))
-                    content = u'\n'.join([line for line in content.split(u'\n') if line not in old_content])
+                    index.add(self.clean_revision(rev, lambda: pos_page.getOldVersion(rev)))
             except:
                 pass
+        if len(index.texts) > 0:
+            content = index.remove_existing_lines(content)
 
         # also invoke search to look in other articles?
         return content
 
-    def process_changes(self):
-        global MIN_SIZE, DEBUG_MODE, WORDS_QUOTE
-        local_messages = messages[self.site.lang] if self.site.lang in messages else messages['en']
-        ignore_regex = re.compile(local_messages['ignore_summary'], re.I)
-        for p, new_rev, prev_rev in self.generator:
-            pywikibot.output('Title: %s' % p.title())
-            pywikibot.output('\tPrev: %i\tNew:%i' % (prev_rev, new_rev))
+    def compare_changes(self, changes):
+        """
+        New revisions of the changes to pages of at least compare_size bytes, which are diffed by the API.
+        The size is taken from the recent change entry, or fetched (for all the changes together)
+        """
+        if self.compare_size is None:
+            return set()
+        sizes = {}
+        unknown = []
+        for page, new_rev, prev_rev in changes:
+            if prev_rev == 0:
+                continue  # new page
+            rcinfo = getattr(page, '_rcinfo', None)
+            if rcinfo is not None and 'length' in rcinfo:
+                sizes[new_rev] = rcinfo['length']['new']
+            else:
+                unknown.append(new_rev)
+        if unknown:
             try:
-                self.site.loadrevisions(p,
-                                        getText=True,
-                                        revids=[new_rev, prev_rev])
-                old = "" if prev_rev == 0 else self.remove_wikitext(p.getOldVersion(prev_rev))
-                new = self.remove_wikitext(p.getOldVersion(new_rev))
-                editor = p._revisions[new_rev].user  # TODO: is there a non private access to user in revisions?
-                comment = p._revisions[new_rev].comment
-                diff_date = p._revisions[new_rev].timestamp
-                # skip edits with specific comments
-                if ignore_regex.match(comment):
-                    continue
+                self.revisions.prefetch_sizes(unknown)
             except Exception as e:
-                pywikibot.output("Error occurred - skipping: %s" % str(e))
+                pywikibot.output("Error occurred in fetching revision sizes: %s" % str(e))
+            sizes.update((revid, self.revisions.sizes[revid]) for revid in unknown if revid in self.revisions.sizes)
+        return set(revid for revid, size in sizes.items() if size >= self.compare_size)
+
+    def compare_revisions(self, prev_rev, new_rev):
+        """
+        Comparison of the revisions by the API (see compare_diff.compare)
+        """
+        comparison = self._compared.pop(new_rev, None)
+        if comparison is not None:
+            return comparison
+        with self.metrics.timer('compare_seconds'):
+            return compare_diff.compare(self.site, prev_rev, new_rev)
+
+    def revids_to_fetch(self, changes):
+        """
+        Revisions to fetch for changes. The old revision is needed only if its cleaned text isn't cached.
+        Changes that are diffed by the API need no revisions
+        """
+        revids = []
+        compared = self.compare_changes(changes)
+        for _, new_rev, prev_rev in changes:
+            if new_rev in compared:
                 continue
-
-            diffy = difflib.SequenceMatcher()
-            diffy.set_seqs(old, new)
-            diff = [''.join(new[after_start:after_end]) for opcode, before_start, before_end, after_start, after_end in
-                    diffy.get_opcodes() if opcode in ['insert']]
-            diff = [new_t for new_t in u'\n'.join(diff).split(u'\n') if new_t not in old and ' ' in new_t] # remove text appeared in original or very small addition
-            # avoid reoccurence
-            added_set = set()
-            diff_clean = []
-            for new in diff:
-                if new in added_set: continue
-                diff_clean.append(new)
-                added_set.add(new)
-            diff = diff_clean
-
-            # remove list of facts
-            diff = [line for line in diff if not re.match('^(\S+(\s|$)){1,4}$', line.strip('* |'))]
-
-            # clean some html/wikitext from the text before sending to server...
-            # you may use mwparserfromhell to get cleaner text (but this requires dependency...)
-            added_lines = pywikibot.textlib.removeHTMLParts(u'\n'.join(diff), keeptags=[])
-
-            #pywikibot.output(added_lines)
-            if len(added_lines) < MIN_SIZE:
-                pywikibot.output('\tDelta too small (after removing HTML)')
+            revids.append(new_rev)
+            if prev_rev != 0 and (self.site.dbName(), prev_rev) not in self.clean_cache:
+                revids.append(prev_rev)
+        return revids
+
+    def load_edits(self, changes):
+        """
+        Load the edits of changes (list of (page, new revision, previous revision)) - see load_edit.
+        With process pool, the texts are cleaned and diffed in the worker processes
+        """
+        global WORDS_QUOTE
+        compared = self.compare_changes(changes)
+        if self.process_pool is None:
+            return [self.load_compared_edit(*change) if change[1] in compared else self.load_edit(*change)
+                    for change in changes]
+        edits = [self.load_compared_edit(*change) if change[1] in compared else self.load_edit(*change, clean=False)
+                 for change in changes]
+        start = time.time()
+        futures = [None if edit is None or 'old_text' not in edit else
+                   self.process_pool.submit(edit_worker.clean_and_diff, edit.pop('old_text'), edit.pop('new_text'),
+                                            edit['old'], edit['new'], self.diff_engine.name, WORDS_QUOTE)
+                   for edit in edits]
+        for i, (edit, future) in enumerate(zip(edits, futures)):
+            if future is None:
                 continue
+            cached_old, cached_new = edit['old'], edit['new']
+            try:
+                edit['old'], edit['new'], edit['added'] = future.result()
+            except Exception as e:
+                pywikibot.output("Error occurred - skipping: %s" % str(e))
+                edits[i] = None
+                continue
+            if cached_old is None:
+                self.clean_cache.put((self.site.dbName(), edit['prev_rev']), edit['old'])
+            if cached_new is None:
+                self.clean_cache.put((self.site.dbName(), edit['new_rev']), edit['new'])
+        self.metrics.histogram('process_pool_seconds').observe(time.time() - start)
+        return edits
+
+    def load_edit(self, p, new_rev, prev_rev, clean=True):
+        """
+        Load the revisions of an edit. Returns dict with the cleaned texts and details of the edit or None to skip it.
+        If clean is False, the texts that aren't cleaned already (old or new is None) are returned as old_text and
+        new_text for cleaning them elsewhere
+        """
+        pywikibot.output('Title: %s' % p.title())
+        pywikibot.output('\tPrev: %i\tNew:%i' % (prev_rev, new_rev))
+        try:
+            with self.metrics.timer('load_revisions_seconds'):
+                self.revisions.prefetch(self.revids_to_fetch([(p, new_rev, prev_rev)]))
+            new_revision = self.revisions.get(new_rev)
+            old_text = new_text = None
+            if clean:
+                old = "" if prev_rev == 0 else self.clean_revision(prev_rev, lambda: self.revisions.get(prev_rev)['text'])
+                new = self.clean_revision(new_rev, lambda: new_revision['text'])
+            else:
+                old = "" if prev_rev == 0 else self.clean_cache.get((self.site.dbName(), prev_rev))
+                new = self.clean_cache.get((self.site.dbName(), new_rev))
+                if old is None:
+                    old_text = self.revisions.get(prev_rev)['text']
+                if new is None:
+                    new_text = new_revision['text']
+            editor = new_revision['user']
+            comment = new_revision['comment']
+            diff_date = new_revision['timestamp']
+            # skip edits with specific comments
+            if self.ignore_regex.match(comment):
+                return None
+        except Exception as e:
+            pywikibot.output("Error occurred - skipping: %s" % str(e))
+            return None
+        edit = {
+            'page': p,
+            'new_rev': new_rev,
+            'prev_rev': prev_rev,
+            'old': old,
+            'new': new,
+            'editor': editor,
+            'comment': comment,
+            'diff_date': diff_date
+        }
+        if not clean:
+            edit['old_text'] = old_text
+            edit['new_text'] = new_text
+        return edit
+
+    def load_compared_edit(self, p, new_rev, prev_rev):
+        """
+        Load edit of a large page by the diff of the API instead of the full revisions (see load_edit).
+        The old text is empty and the new text is the cleaned inserted text, so the added text is found
+        without the full revision texts
+        """
+        pywikibot.output('Title: %s' % p.title())
+        pywikibot.output('\tPrev: %i\tNew:%i (compare)' % (prev_rev, new_rev))
+        try:
+            comparison = self.compare_revisions(prev_rev, new_rev)
+            comment = comparison.get('tocomment', '')
+            # skip edits with specific comments
+            if self.ignore_regex.match(comment):
+                return None
+            inserted = compare_diff.inserted_segments(comparison.get('body', ''), skip_markup=True)
+            edit = {
+                'page': p,
+                'new_rev': new_rev,
+                'prev_rev': prev_rev,
+                'old': '',
+                'new': self.remove_wikitext(u'\n'.join(inserted)),
+                'editor': comparison['touser'],
+                'comment': comment,
+                'diff_date': pywikibot.Timestamp.fromISOformat(comparison['totimestamp']),
+                'compared': True
+            }
+        except Exception as e:
+            pywikibot.output("Error occurred - skipping: %s" % str(e))
+            return None
+        finally:
+            self.revisions.discard([new_rev])
+        self.metrics.inc('compared_edits')
+        return edit
+
+    def find_added_text(self, edit):
+        """
+        Text added in the edit that should be checked, or None if there is not enough added text
+        """
+        global MIN_SIZE, WORDS_QUOTE
+        p, new_rev, prev_rev, old = edit['page'], edit['new_rev'], edit['prev_rev'], edit['old']
+        self.metrics.inc('edits_checked')
+        if edit.get('added') is not None:
+            added_lines = edit['added']  # found by process pool (see load_edits)
+        else:
+            with self.metrics.timer('diff_seconds'):
+                added_lines = edit_worker.added_text(old, edit['new'], self.diff_engine.name)
+
+        #pywikibot.output(added_lines)
+        if len(added_lines) < MIN_SIZE:
+            pywikibot.output('\tDelta too small (after removing HTML)')
+            return None
+
+        # remove moved content (also avoids mirrors)
+        with self.metrics.timer('moved_content_seconds'):
+            # the older revisions of a page diffed by the API are not fetched, as they are as large as the page
+            added_lines = self.remove_moved_content(p, prev_rev, added_lines, edit['comment'],
+                                                    check_history=not edit.get('compared', False))
+        if self.recent_content is not None:
+            # remove content copied from other recently changed pages
+            added_lines = self.recent_content.remove_existing_lines(added_lines, p.title())
+
+        added_lines = u'. '.join([new_t for new_t in added_lines.split(u'. ') if new_t not in old]) # remove text appeared in original
+        # remove quotation (for small quotes)
+        quotes = re.findall('".*?"[ ,\.;:<\{]', added_lines)
+        for quote in quotes:
+            if quote.count(' ') < WORDS_QUOTE:
+                added_lines = added_lines.replace(quote, '')
+
+        if len(added_lines) > MIN_SIZE and (prev_rev==0 or not self.was_rolledback(p, new_rev, added_lines) and len(re.split('\s', added_lines)) > 20):
+            self.metrics.inc('edits_added_text')
+            return added_lines
+        pywikibot.output('\tDelta too small - skipping')
+        return None
+
+    def index_recent_content(self, edit):
+        """
+        Add the content that existed before an edit (its old text) to the index of recent content.
+        The new text isn't indexed, as the added text may be copied and should be checked when it is added again
+        """
+        if self.recent_content is not None:
+            self.recent_content.add(edit['old'], edit['page'].title())
+
+    def track_upload(self, upload, upload_time=None):
+        """
+        Track processing status of upload, unless its report is already stored
+        """
+        _, upload_id, added_lines = upload
+        if not self.report_store.has_report(upload_id):
+            self.tracker.add(upload_id)
+            self.poll_scheduler.add(upload_id, len(added_lines), upload_time)
+
+    def upload_edit(self, edit, added_lines):
+        """
+        Upload the added text of an edit. Returns upload entry of (revision details, upload id, added text)
+        """
+        p, new_rev = edit['page'], edit['new_rev']
+        upload_id = self.report_store.document_id(added_lines)
+        if upload_id is None:
+            upload_id = self.upload_diff(added_lines.encode('utf8'), p.title(), "/%i" % new_rev)
+            self.report_store.put_document(added_lines, upload_id)
+        else:
+            pywikibot.output('\tSame text was already uploaded (upload id {})'.format(upload_id))
+        return ({
+                u'title': p.title(),
+                u'user': edit['editor'],
+                u'new': new_rev,
+                u'old': edit['prev_rev'],
+                u'ns': int(p.namespace()),
+                u'title_no_ns': p.title(withNamespace=False),
+                u'diff_date': edit['diff_date']}, upload_id, added_lines)
 
-            # remove moved content (also avoids mirrors)
-            added_lines = self.remove_moved_content(p, prev_rev, added_lines, comment) 
-
-            added_lines = u'. '.join([new_t for new_t in added_lines.split(u'. ') if new_t not in old]) # remove text appeared in original
-            # remove quotation (for small quotes)
-            quotes = re.findall('".*?"[ ,\.;:<\{]', added_lines)
-            for quote in quotes:
-                if quote.count(' ') < WORDS_QUOTE:
-                    added_lines = added_lines.replace(quote, '')
-
-            if len(added_lines) > MIN_SIZE and (prev_rev==0 or not self.was_rolledback(p, new_rev, added_lines) and len(re.split('\s', added_lines)) > 20):
-                if DEBUG_MODE:  # dont upload to server in debug mode
+    def process_changes(self):
+        global DEBUG_MODE
+        pending_uploads = []
+        changes = list(self.generator)
+        for i in range(0, len(changes), self.prefetch_size):
+            batch = changes[i:i + self.prefetch_size]
+            batch_revids = self.revids_to_fetch(batch)
+            try:
+                with self.metrics.timer('load_revisions_seconds'):
+                    self.revisions.prefetch(batch_revids)
+            except Exception as e:
+                pywikibot.output("Error occurred in fetching revisions: %s" % str(e))
+            for edit in self.load_edits(batch):
+                if edit is None:
                     continue
-                try:
-                    upload_id = self.upload_diff(added_lines.encode('utf8'), p.title(), "/%i" % new_rev)
-                    self.uploads.append(({
-                                        u'title': p.title(),
-                                        u'user': editor,
-                                        u'new': new_rev,
-                                        u'old': prev_rev,
-                                        u'ns': p.namespace(),
-                                        u'title_no_ns': p.title(withNamespace=False),
-                                        u'diff_date': diff_date}, upload_id, added_lines))
-                except Exception as ex:
-                    print('Skipping - due to error: {}'.format(ex))
-                    # TODO: reconnect to server?
+                added_lines = self.find_added_text(edit)
+                self.index_recent_content(edit)
+                if added_lines is None or DEBUG_MODE:  # dont upload to server in debug mode
                     continue
-            else:
-                pywikibot.output('\tDelta too small - skipping')
+                if self.client is None:
+                    self._init_server()
+                pending_uploads.append(self.client.submit(self.upload_edit, edit, added_lines))
+            self.revisions.discard(batch_revids)
+
+        # wait for the concurrent uploads
+        for upload_future in pending_uploads:
+            try:
+                upload = upload_future.result()
+            except Exception as ex:
+                print('Skipping - due to error: {}'.format(ex))
+                # TODO: reconnect to server?
+                continue
+            self.track_upload(upload)
+            self.uploads.append(upload)
+        pywikibot.output(self.clean_cache.format_stats())
+        pywikibot.output(self.report_store.format_stats())
+
+    def page_tags(self, titles):
+        """
+        Dict of title to the tags of the page: WikiProjects of its talk page (and WikiEd)
+        """
+        global wikiEd_pages
+        with self.metrics.timer('page_tags_seconds'):
+            projects = self.tag_resolver.tags(titles)
+        return dict((title, ';'.join(projects[title] + (['WikiEd'] if title in wikiEd_pages else [])))
+                    for title in titles)
 
-    def report_uploads(self):
+    def report_uploads(self, uploads=None):
         local_messages = messages[self.site.lang] if self.site.lang in messages else messages['en']
+        uploads = self.uploads if uploads is None else uploads
 
         pywikibot.output('Polling uploads')
-        reports_source = [self.poll_response(upload_id, rev_details['title'], added_lines, rev_details['new']) for rev_details, upload_id, added_lines in self.uploads]
+        if len(uploads) == 0:
+            pywikibot.output('No violation found!')
+            return
+        self.wait_uploads(uploads)
+        parts_sources = self.client.map(lambda upload: self.fetch_report(upload[1], upload[0]['new']), uploads)
+        # verify the sources of all the uploads concurrently
+        with self.metrics.timer('source_check_seconds'):
+            source_pages = self.source_fetcher.fetch_all(
+                [url for (rev_details, _, added_lines), part_sources in zip(uploads, parts_sources)
+                 if part_sources is not None for url in self.source_urls(part_sources[1], added_lines, rev_details['title'])])
+            reports_source = [self.poll_response(upload_id, rev_details['title'], added_lines, rev_details['new'],
+                                                 part_sources, source_pages)
+                              for (rev_details, upload_id, added_lines), part_sources in zip(uploads, parts_sources)]
+        for rev_details, upload_id, added_lines in uploads:
+            self.tracker.remove(upload_id)
+        self.reported_edits += len(uploads)
+        rpc_calls = self.client.rpc_calls
+        pywikibot.output('iThenticate RPC calls: {} for {} edits ({:.1f} per edit) [{}]'.format(
+            sum(rpc_calls.values()), self.reported_edits, float(sum(rpc_calls.values())) / self.reported_edits,
+            ', '.join('{}: {}'.format(method, count) for method, count in sorted(rpc_calls.items()))))
         reports_source = [{'report_id': report_id, 'source': report_source} for report_source, report_id in reports_source] 
         # Define the format of an individual report row.
         report_template = u"""
@@ -500,11 +782,12 @@ class PlagiaBot(object):
 == ==
 """
         reports_details = [dict(list(details[0].items()) + list(source.items()))
-                           for details, source in zip(self.uploads, reports_source)
+                           for details, source in zip(uploads, reports_source)
                            if len(source['source']) > 0]
         # add tags by associated wikiprojects
+        tags = self.page_tags([report['title'] for report in reports_details])
         for report in reports_details:
-            report['tags'] = get_page_tags(self.site, report['title'])
+            report['tags'] = tags[report['title']]
 
         for rep in reports_details:
             self.report_log.add_report(rep['new'], rep['diff_date'], rep['title_no_ns'], rep['ns'], rep['report_id'], rep['source'])
@@ -544,7 +827,8 @@ class PlagiaBot(object):
         while try_save:
             try:
                 try_save = False
-                self.report_page.put(reports, "Update")
+                with self.metrics.timer('report_save_seconds'):
+                    self.report_page.put(reports, "Update")
             except pywikibot.SpamfilterError:
                 pywikibot.output('spam filter error')
             except pywikibot.PageSaveRelatedError:
@@ -559,23 +843,58 @@ class PlagiaBot(object):
                     reports = orig_report[0] + reports
 
 
+    def save_state(self):
+        self.source_cache.purge()
+        self.report_store.purge()
+        if self.recent_content is not None and self.recent_content.path is not None:
+            self.recent_content.save()
+
+    def close(self):
+        """
+        Shut down the services the bot created (the process pool and the iThenticate client)
+        """
+        if not self.owns_services:
+            return
+        if self.process_pool is not None:
+            self.process_pool.shutdown(wait=False)
+        if self.client is not None:
+            self.client.close()
+
+    def dump_metrics(self):
+        if self.metrics_dump is not None:
+            self.metrics.dump(self.metrics_dump)
+
     def run(self): 
         self.process_changes()
         self.report_uploads()
+        self.save_state()
+        self.close()
+        self.dump_metrics()
 
 class PlagiaBotLive(PlagiaBot):
-    def __init__(self, site, report_page=None, use_stream=True, report_log=report_logger.ReportLogger(), run_timeout = 14400):
-        super(PlagiaBotLive, self).__init__(site, [], report_page, report_log)
-        self.rcthreshold = 10
+    def __init__(self, site, report_page=None, use_stream=True, report_log=report_logger.ReportLogger(), run_timeout = 14400,
+                 diff_engine='line', concurrency=4, clean_cache=None, source_cache=None, recent_content=None,
+                 report_store=None, work_queue=None, workers=0, shared=None):
+        super(PlagiaBotLive, self).__init__(site, [], report_page, report_log, diff_engine, concurrency, clean_cache,
+                                            source_cache, recent_content, report_store, workers, shared)
+        self.rcthreshold = 10  # maximal number of reports in a single update of the report page
+        self.stats_interval = 300  # seconds between logging pipeline statistics
+        self.coalesce_window = 60  # seconds to wait for further edits of the same user to a page
+        self.poll_interval = 5  # maximal seconds between checks of the poll scheduler
+        self.coalesced_edits = 0  # edits merged into a later edit (checks and uploads saved)
+        self.work_queue = work_queue
+        self.prefilter = False  # reject edits by the API diff before fetching the revisions
+        self.resume_revid = 0  # changes up to this revision were recorded before restart
+        self.index_revisions = RevisionStore(site)  # revisions of unchecked edits for the recent content index
+        self.index_pipeline = None
         self.use_stream = use_stream
-        local_messages = messages[self.site.lang] if self.site.lang in messages else messages['en']
-        self.ignore_regex = re.compile(local_messages['ignore_summary'], re.I)
         self.end_time = datetime.datetime.now() + datetime.timedelta(0, run_timeout)
 
     def page_filter(self, page):
         global wikiEd_pages
         rcinfo = page._rcinfo
         if rcinfo['type'] != 'edit' and rcinfo['type'] != 'new': return False  # only edits and new pages
+        if rcinfo['revision']['new'] <= self.resume_revid: return False  # already recorded before restart
         if rcinfo['bot']: return False # skip bot edits
         if (rcinfo['namespace'] not in [0, 118]) and page.title() not in wikiEd_pages: return False  # only articles+drafts
         if 'length' in rcinfo:
@@ -588,54 +907,431 @@ class PlagiaBotLive(PlagiaBot):
         if self.ignore_regex.match(rcinfo['comment']): return False  # skip rollbacks
         return True
    
+    def filter_stage(self, page):
+        self.metrics.inc('rc_events')
+        if not self.page_filter(page):
+            self.index_change(page)
+            return None
+        self.metrics.inc('rc_accepted')
+        return [page]
+
+    def index_change(self, page):
+        """
+        Queue the content of an article changed by an edit that isn't checked (e.g small edit) for indexing
+        in the recent content index. The changes are dropped if the indexing falls behind
+        """
+        rcinfo = page._rcinfo
+        if self.index_pipeline is None or rcinfo['type'] != 'edit' or rcinfo['bot'] or rcinfo['namespace'] != 0:
+            return
+        prev_rev = rcinfo['revision'].get('old', 0)
+        if not prev_rev:
+            return
+        stage = self.index_pipeline.stages[0]
+        if stage.queue.full():
+            self.metrics.inc('recent_index_dropped')
+            return
+        stage.put((page.title(), prev_rev))
+
+    def index_stage(self, changes):
+        """
+        Add the content of pages (the revision before an unchecked edit) to the recent content index
+        """
+        if len(changes) == 0:
+            return None
+        revids = [revid for _, revid in changes]
+        try:
+            with self.metrics.timer('index_revisions_seconds'):
+                self.index_revisions.prefetch(revids)
+        except Exception as e:
+            pywikibot.output("Error occurred in fetching revisions: %s" % str(e))
+        for title, revid in changes:
+            revision = self.index_revisions.revisions.get(revid)
+            if revision is None or revision['text'] is None:
+                continue
+            self.recent_content.add(self.clean_revision(revid, lambda: revision['text']), title)
+            self.metrics.inc('recent_indexed_pages')
+        self.index_revisions.discard(revids)
+        return None
+
+    def coalesce_stage(self, pages):
+        """
+        Merges consecutive edits of the same user to a page within coalesce_window seconds into a single change
+        (first old revision -> last new revision), as db_changes_generator does. Returns the changes that are ready
+        """
+        ready = []
+        for page in pages:
+            title = page.title()
+            new_rev, prev_rev = page._rcinfo['revision']['new'], page._rcinfo['revision'].get('old', 0)
+            user = page._rcinfo['user']
+            if title in self._coalescing:
+                change, change_user, first_seen = self._coalescing[title]
+                if change_user == user and change[1] == prev_rev:
+                    self._coalescing[title] = ((page, new_rev, change[2]), user, first_seen)
+                    self.coalesced_edits += 1
+                    if self.work_queue is not None:
+                        self.work_queue.remove_edit(change[1])
+                        self.work_queue.add_edit(title, new_rev, change[2], page._rcinfo.get('timestamp'))
+                    continue
+                ready.append(change)
+                del self._coalescing[title]
+            self._coalescing[title] = ((page, new_rev, prev_rev), user, time.time())
+            if self.work_queue is not None:
+                self.work_queue.add_edit(title, new_rev, prev_rev, page._rcinfo.get('timestamp'))
+        for title, (change, _, first_seen) in list(self._coalescing.items()):
+            if time.time() - first_seen < self.coalesce_window:
+                break  # ordered by first_seen
+            ready.append(change)
+            del self._coalescing[title]
+        return ready
+
+    def flush_coalescing(self):
+        changes = [change for change, _, _ in self._coalescing.values()]
+        self._coalescing.clear()
+        return changes
+
+    def prefilter_stage(self, change):
+        """
+        Rejects change if the text inserted by the API diff is too small, before fetching the revision texts.
+        The inserted wikitext is not cleaned, so its length is an upper estimate of the added text
+        """
+        page, new_rev, prev_rev = change
+        if prev_rev == 0:
+            return [change]  # new page
+        self.metrics.inc('prefilter_checked')
+        try:
+            comparison = self.compare_revisions(prev_rev, new_rev)
+            inserted = compare_diff.inserted_segments(comparison.get('body', ''))
+        except Exception as e:
+            pywikibot.output("Error occurred in comparing revisions: %s" % str(e))
+            return [change]
+        if len(u'\n'.join(inserted)) < MIN_SIZE:
+            self.metrics.inc('prefilter_rejected')
+            self.edit_done(new_rev)
+            return None
+        if new_rev in self.compare_changes([change]):
+            self._compared[new_rev] = comparison  # reused for loading the edit
+        return [change]
+
+    def fetch_stage(self, changes):
+        revids = self.revids_to_fetch(changes)
+        try:
+            with self.metrics.timer('load_revisions_seconds'):
+                self.revisions.prefetch(revids)
+        except Exception as e:
+            pywikibot.output("Error occurred in fetching revisions: %s" % str(e))
+        edits = self.load_edits(changes)
+        self.revisions.discard(revids)
+        for change, edit in zip(changes, edits):
+            if edit is None:
+                self.edit_done(change[1])
+        return [edit for edit in edits if edit is not None]
+
+    def edit_done(self, new_rev):
+        """
+        Remove an edit that was checked without upload (or skipped) from the work queue
+        """
+        if self.work_queue is not None:
+            self.work_queue.remove_edit(new_rev)
+
+    def diff_stage(self, edit):
+        global DEBUG_MODE
+        added_lines = self.find_added_text(edit)
+        self.index_recent_content(edit)
+        if added_lines is None or DEBUG_MODE:  # dont upload to server in debug mode
+            self.edit_done(edit['new_rev'])
+            return None
+        return [(edit, added_lines)]
+
+    def upload_stage(self, edit_added_lines):
+        try:
+            upload = self.upload_edit(*edit_added_lines)
+            if self.work_queue is not None:
+                self.work_queue.add_upload(upload)
+        except Exception as ex:
+            pywikibot.error('Skipping - due to error: {}\n{}'.format(ex, traceback.format_exc()))
+            self.metrics.inc('upload_errors')
+            self.edit_done(edit_added_lines[0]['new_rev'])
+            return None
+        return [upload]
+
+    def poll_stage(self, uploads):
+        """
+        Keeps the uploads until iThenticate processed them, and passes the processed uploads to reporting
+        """
+        for upload in uploads:
+            self.track_upload(upload)
+            self._polling.append((upload, time.time()))
+        if len(self._polling) == 0:
+            return None
+        pending = set(self.poll_due([upload_id for (_, upload_id, _), _ in self._polling]))
+        ready = []
+        polling = []
+        for upload, upload_time in self._polling:
+            if upload[1] not in pending:
+                ready.append(upload)
+            elif time.time() - upload_time > self.max_pending_time:
+                pywikibot.error('iThenticate pending upload id {} for too long. Skipping.'.format(upload[1]))
+                self.tracker.remove(upload[1])
+                self.poll_scheduler.remove(upload[1])
+                self.report_store.forget(upload[1])
+                if self.work_queue is not None:
+                    self.work_queue.remove_uploads([upload])
+            else:
+                polling.append((upload, upload_time))
+        self._polling = polling
+        return ready
+
+    def flush_polls(self):
+        uploads = [upload for upload, _ in self._polling]
+        self.wait_uploads(uploads)
+        self._polling = []
+        return uploads
+
+    def report_stage(self, uploads):
+        pywikibot.output('reporting uploads')
+        self.report_uploads(uploads)  # report checked edits
+        if self.work_queue is not None:
+            self.work_queue.remove_uploads(uploads)
+        self._reconnect_index -= 1
+        if self._reconnect_index == 0:
+            pywikibot.output('Reconnect after many uploads')
+            self.client.login()
+            self._reconnect_index = 100
+        return None
+
+    def build_pipeline(self):
+        """
+        Pipeline of: filter -> coalesce edits -> [prefilter] -> fetch revisions -> clean/diff -> upload -> poll -> report
+        """
+        stages = [
+            Stage('filter', self.filter_stage, maxsize=1000),
+            Stage('coalesce', self.coalesce_stage, batch=100, timeout=self.poll_interval, flush=self.flush_coalescing),
+            Stage('fetch', self.fetch_stage, batch=self.prefetch_size),
+            Stage('diff', self.diff_stage),
+            Stage('upload', self.upload_stage, workers=self.concurrency),
+            Stage('poll', self.poll_stage, batch=100, timeout=self.poll_interval, flush=self.flush_polls),
+            Stage('report', self.report_stage, batch=self.rcthreshold)
+        ]
+        if self.prefilter:
+            stages.insert(2, Stage('prefilter', self.prefilter_stage, workers=self.concurrency))
+        pipeline = Pipeline(stages)
+        for stage in pipeline.stages:
+            self.metrics.register('stage_{}_seconds'.format(stage.name), stage.latency)
+            self.metrics.register('stage_{}_errors'.format(stage.name), stage.errors)
+        return pipeline
+
+    def build_index_pipeline(self):
+        """
+        Pipeline of indexing the content of unchecked edits in the recent content index (see index_change)
+        """
+        stage = Stage('index', self.index_stage, maxsize=1000, batch=self.prefetch_size, timeout=self.poll_interval)
+        self.metrics.register('stage_index_seconds', stage.latency)
+        self.metrics.register('stage_index_errors', stage.errors)
+        return Pipeline([stage])
+
+    def resume(self, pipeline):
+        """
+        Continue polling the uploads of the previous run
+        """
+        for upload, upload_time in self.work_queue.uploads():
+            self.track_upload(upload, upload_time)
+            self._polling.append((upload, upload_time))
+        pywikibot.output('Resuming: ' + self.work_queue.format_stats())
+
+    def checkpoint(self):
+        """
+        Timestamp of the last recorded recent change of the previous run (or None) to continue the stream from
+        """
+        if self.work_queue is None or self.work_queue.checkpoint() is None:
+            return None
+        since, self.resume_revid = self.work_queue.checkpoint()
+        return since
+
+    def share_services(self, other):
+        """
+        Use the iThenticate session pool of other bot (of another wiki, which was constructed with shared=other)
+        """
+        self.client = other.client
+        self.tracker = other.tracker
+
+    def start(self):
+        """
+        Start the pipeline (and resume the pending work of the previous run)
+        """
+        if self.client is None:
+            self._init_server()
+        self._polling = []
+        self._coalescing = OrderedDict()
+        self._reconnect_index = 100
+        self.pipeline = self.build_pipeline()
+        if self.recent_content is not None:
+            self.index_pipeline = self.build_index_pipeline()
+            self.index_pipeline.start()
+        if self.work_queue is not None:
+            self.resume(self.pipeline)
+        self.pipeline.start()
+        if self.work_queue is not None:
+            for title, new_rev, prev_rev in self.work_queue.pending_edits():
+                self.pipeline.stage('fetch').put((pywikibot.Page(self.site, title), new_rev, prev_rev))
+
+    def format_rejects(self):
+        """
+        Rejected edits out of the edits that reached each check: recent changes metadata, API diff (with -prefilter)
+        and full text
+        """
+        def rate(rejected, total):
+            return '{}/{} ({:.1f}%)'.format(rejected, total, 100.0 * rejected / total if total else 0)
+        counters = dict((name, self.metrics.counter(name).value)
+                        for name in ('rc_events', 'rc_accepted', 'prefilter_checked', 'prefilter_rejected',
+                                     'edits_checked', 'edits_added_text'))
+        stats = ['metadata ' + rate(counters['rc_events'] - counters['rc_accepted'], counters['rc_events'])]
+        if self.prefilter:
+            stats.append('compare ' + rate(counters['prefilter_rejected'], counters['prefilter_checked']))
+        stats.append('full text ' + rate(counters['edits_checked'] - counters['edits_added_text'],
+                                         counters['edits_checked']))
+        return 'Rejected edits: ' + ', '.join(stats)
+
+    def log_stats(self):
+        pywikibot.output(self.pipeline.format_stats())
+        if self.index_pipeline is not None:
+            pywikibot.output('Recent content index: {} | {} pages indexed, {} dropped'.format(
+                self.index_pipeline.format_stats(), self.metrics.counter('recent_indexed_pages').value,
+                self.metrics.counter('recent_index_dropped').value))
+        pywikibot.output(self.clean_cache.format_stats())
+        pywikibot.output('Coalesced edits (uploads saved): {}'.format(self.coalesced_edits))
+        pywikibot.output(self.format_rejects())
+        pywikibot.output(self.report_store.format_stats())
+        pywikibot.output(self.poll_scheduler.format_stats())
+        pywikibot.output(self.tag_resolver.format_stats())
+        self.source_cache.purge()
+        self.report_store.purge()
+        if self.work_queue is not None:
+            pywikibot.output(self.work_queue.format_stats())
+        self.dump_metrics()
+
+    def stop(self):
+        if self.index_pipeline is not None:
+            self.index_pipeline.stop()
+        if self.work_queue is not None:
+            # the pending work is resumed by the next run
+            pywikibot.output(self.work_queue.format_stats())
+            self.save_state()
+            self.dump_metrics()
+            return
+        pywikibot.output('handling uploaded changes')
+        self.pipeline.stop()
+        pywikibot.output(self.pipeline.format_stats())
+        pywikibot.output('Coalesced edits (uploads saved): {}'.format(self.coalesced_edits))
+        pywikibot.output(self.format_rejects())
+        self.save_state()
+        self.dump_metrics()
+
     def run(self):
-        global MIN_SIZE
-        self.generator = []
         log('Starting live bot')
-        filter_gen = lambda gen: (p for p in gen if self.page_filter(p))
+        since = self.checkpoint()
         if self.use_stream:
-            live_gen = pagegenerators.LiveRCPageGenerator(self.site)
-            live_gen = filter_gen(live_gen)
+            live_gen = live_rc_generator(self.site, since)
         else:
             from IRCRCListener import irc_rc_listener
-            live_gen = (p for p in irc_rc_listener(self.site, filter_gen))
-        pending_checks = []
-        reconnect_index = 100
+            live_gen = irc_rc_listener(self.site)
+        self.start()
+        last_stats = time.time()
         try:
             for page in live_gen:
-                rcinfo = page._rcinfo
-                #log('Adding page:' + page.title())
-                # TODO: remove rolledback edits from generator
-                pywikibot.output('Page in buffer: {}'.format(len(pending_checks)))
-                pending_checks.append((page, rcinfo['revision']['new'], rcinfo['revision'].get('old', 0)))
+                self.pipeline.put(page)  # ingest
                 if self.end_time < datetime.datetime.now():
                     raise KeyboardInterrupt
-                if len(pending_checks) < self.rcthreshold or not self.uploads_ready(): continue # move to next edit if not enough edits accomulated
-                # handle uploads or send new changes to process
-                if len(self.uploads) > 0:
-                    pywikibot.output('reporting uploads')
-                    self.report_uploads()  # report checked edits
-                    print('reported')
-                    self.uploads = []
-                    reconnect_index -= 1
-                    if reconnect_index == 0:
-                        pywikibot.output('Reconnect after many uploads' )
-                        self._init_server()
-                        reconnect_index = 100
-                else:
-                    pywikibot.output('checking pending')
-                    self.generator = pending_checks
-                    log('checking pending')
-                    self.process_changes()
-                    pending_checks = []
+                if time.time() - last_stats > self.stats_interval:
+                    self.log_stats()
+                    last_stats = time.time()
         except KeyboardInterrupt:
-            pywikibot.output('handling uploaded changes')
-            while not self.uploads_ready(): continue
-            # handle uploads or send new changes to process
-            if len(self.uploads) > 0:
-                self.report_uploads()  # report checked edits
-                raise
- 
+            self.stop()
+            self.close()
+            raise
+
+
+class MultiSiteLive(object):
+    """
+    Live bots of several wikis in a single process.
+
+    A single recent changes stream (filtered to the wikis) is dispatched to the pipelines of the bots,
+    and the bots share the iThenticate session pool and the HTTP pool for fetching sources (the bots of
+    the other wikis are constructed with shared=the first bot).
+    """
+
+    def __init__(self, bots, run_timeout=14400):
+        self.bots = dict((bot.site.dbName(), bot) for bot in bots)
+        self.end_time = datetime.datetime.now() + datetime.timedelta(0, run_timeout)
+        self.stats_interval = 300
+
+    def log_stats(self):
+        for dbname, bot in sorted(self.bots.items()):
+            pywikibot.output('[{}]'.format(dbname))
+            bot.log_stats()
+        try:
+            import resource
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
+        except ImportError:
+            max_rss = 0
+        first = next(iter(self.bots.values()))
+        pywikibot.output('Multi-site live: {} wikis, 1 stream, {} iThenticate logins, max RSS {} MB'.format(
+            len(self.bots), first.client.rpc_calls['login'], max_rss))
+
+    def stop(self):
+        """
+        Stop the bots, and then close the services they share (the other bots may still use the process pool
+        while a bot stops)
+        """
+        for bot in self.bots.values():
+            bot.stop()
+        for bot in self.bots.values():
+            bot.close()
+
+    def run(self):
+        log('Starting live bot for {}'.format(', '.join(sorted(self.bots))))
+        checkpoints = [bot.checkpoint() for bot in self.bots.values()]
+        since = min(checkpoints) if None not in checkpoints else None
+        bots = list(self.bots.values())
+        bots[0].start()
+        for bot in bots[1:]:
+            bot.share_services(bots[0])
+            bot.start()
+        last_stats = time.time()
+        try:
+            for page in rc_stream_generator([bot.site for bot in bots], since):
+                self.bots[page.site.dbName()].pipeline.put(page)  # dispatch to the wiki pipeline
+                if self.end_time < datetime.datetime.now():
+                    raise KeyboardInterrupt
+                if time.time() - last_stats > self.stats_interval:
+                    self.log_stats()
+                    last_stats = time.time()
+        except KeyboardInterrupt:
+            self.stop()
+            raise
+
+def live_rc_generator(site, since=None):
+    """
+    Pages of recent changes from the stream. If since (unix timestamp) is given, the stream starts at that time
+    """
+    if since is None:
+        return pagegenerators.LiveRCPageGenerator(site)
+    return rc_stream_generator([site], since)
+
+def rc_stream_generator(sites, since=None):
+    """
+    Pages of recent changes of several wikis from a single stream subscription
+    """
+    from pywikibot.comms.eventstreams import EventStreams
+    if since is not None:
+        since = datetime.datetime.utcfromtimestamp(since).strftime('%Y-%m-%dT%H:%M:%SZ')
+    stream = EventStreams(streams='recentchange', since=since)
+    sites = dict((site.hostname(), site) for site in sites)
+    stream.register_filter(server_name=list(sites))
+    for entry in stream:
+        page = pywikibot.Page(sites[entry['server_name']], entry['title'], ns=entry['namespace'])
+        page._rcinfo = entry
+        yield page
+
 def articles_from_talk_template(talk_template):
     """
     Given a page in the Project: (Wikipedia:) namespace, compose the sql query for finding all articles linked from the page. The output can then be joined with additional sql queries to select recent changes to those articles.
@@ -750,17 +1446,6 @@ def db_changes_generator(site, talk_template=None, page_of_pages=None, days=1, n
     pywikibot.output('Num changes: %i' % len(changes))
     return changes
 
-def get_page_tags(site, page_name):
-    global wikiEd_pages
-    page = pywikibot.Page(site, page_name)
-    talk_page = page.toggleTalkPage()
-    talk_templates = [tp.title(withNamespace=False) for tp in talk_page.templates()]
-    projects = [tp for tp in talk_templates if re.match('WikiProject ', tp) and '/' not in tp]
-    if page.title() in wikiEd_pages:
-        projects.append('WikiEd')
-    return ';'.join(projects)
-
-
 def parse_blacklist(page_name):
     """
     Backlist format: # to end is comment. every line is regex.
@@ -775,11 +1460,12 @@ def parse_blacklist(page_name):
     reblacklist = []
     for ig_site in blacklist_sites:
         try:
-            reblacklist.append(re.compile(ig_site))
+            re.compile(ig_site)
+            reblacklist.append(ig_site)
         except Exception as e:
             print('Error for regex:' + ig_site)
             print(e)
-    return reblacklist
+    return BlacklistMatcher(reblacklist)
 
 def fill_wikiEd_pages(site):
     global wikiEd_pages
@@ -803,6 +1489,19 @@ def main(*args):
     genFactory = pagegenerators.GeneratorFactory()
     report_log = report_logger.ReportLogger()
     page_triage = False
+    diff_engine = 'line'
+    concurrency = 4
+    clean_cache = None
+    source_cache = None
+    report_store = None
+    work_queue = None
+    recent_content = None
+    sites = None
+    workers = 0
+    metrics_port = None
+    metrics_dump = None
+    prefilter = False
+    compare_size = COMPARE_SIZE
     for arg in pywikibot.handle_args(args):
         site = pywikibot.Site()
         if arg.startswith('-talkTemplate:'):
@@ -831,6 +1530,32 @@ def main(*args):
         elif arg.startswith('-pagetriagetag'):
             page_triage = True
             print('using pagetriage')
+        elif arg.startswith('-concurrency:'):
+            concurrency = int(arg[len("-concurrency:"):])
+        elif arg.startswith('-cleancache:'):
+            clean_cache = CleanedTextCache(path=arg[len("-cleancache:"):])
+        elif arg.startswith('-sourcecache:'):
+            source_cache = SourceClassificationCache(arg[len("-sourcecache:"):])
+        elif arg.startswith('-reportstore:'):
+            report_store = ReportStore(arg[len("-reportstore:"):])
+        elif arg.startswith('-workqueue:'):
+            work_queue = arg[len("-workqueue:"):]
+        elif arg.startswith('-recentindex'):
+            recent_content = arg[len("-recentindex:"):]
+        elif arg.startswith('-sites:'):
+            sites = [pywikibot.Site(code, site.family) for code in arg[len("-sites:"):].split(',')]
+        elif arg.startswith('-metrics:'):
+            metrics_port = int(arg[len("-metrics:"):])
+        elif arg.startswith('-metricsdump:'):
+            metrics_dump = arg[len("-metricsdump:"):]
+        elif arg.startswith('-prefilter'):
+            prefilter = True
+        elif arg.startswith('-comparesize:'):
+            compare_size = int(arg[len("-comparesize:"):]) or None
+        elif arg.startswith('-workers:'):
+            workers = int(arg[len("-workers:"):])
+        elif arg.startswith('-diff:'):
+            diff_engine = arg[len("-diff:"):]
         elif arg.startswith('-blacklist:'):
             ignore_sites = parse_blacklist(arg[len("-blacklist:"):])
         elif genFactory.handleArg(arg):
@@ -847,12 +1572,55 @@ def main(*args):
         pywikibot.showHelp()
     else:
         report_log.page_triage = page_triage
-        if live_check:
+        if live_check and sites:
+            log('running live on {} wikis'.format(len(sites)))
+            bots = []
+            for live_site in sites:
+                site_report_page = None if report_page is None else report_page.format(dbname=live_site.dbName(),
+                                                                                       lang=live_site.code)
+                if isinstance(report_log, report_logger.DbReportLogger):
+                    site_report_log = report_logger.DbReportLogger(live_site)
+                else:
+                    site_report_log = report_logger.ReportLogger(live_site)
+                site_report_log.page_triage = page_triage
+                bots.append(PlagiaBotLive(
+                    live_site, site_report_page, report_log=site_report_log, diff_engine=diff_engine,
+                    concurrency=concurrency, clean_cache=clean_cache, source_cache=source_cache,
+                    recent_content=None if recent_content is None else RecentContentIndex(
+                        path='{}.{}'.format(recent_content, live_site.dbName()) if recent_content else None),
+                    report_store=report_store,
+                    work_queue=None if work_queue is None else WorkQueue('{}.{}'.format(work_queue, live_site.dbName())),
+                    workers=workers, shared=bots[0] if bots else None))
+            for site_bot in bots:
+                site_bot.prefilter = prefilter
+                site_bot.compare_size = compare_size
+                site_bot.metrics.prefix = 'plagiabot_{}_'.format(site_bot.site.dbName())
+                if metrics_dump is not None:
+                    site_bot.metrics_dump = '{}.{}'.format(metrics_dump, site_bot.site.dbName())
+            if metrics_port is not None:
+                start_metrics_server([site_bot.metrics for site_bot in bots], metrics_port)
+            bot = MultiSiteLive(bots)
+        elif live_check:
             log('running live')
-            bot = PlagiaBotLive(pywikibot.Site(), report_page , report_log=report_log)
+            bot = PlagiaBotLive(pywikibot.Site(), report_page , report_log=report_log, diff_engine=diff_engine,
+                                concurrency=concurrency, clean_cache=clean_cache, source_cache=source_cache,
+                                recent_content=None if recent_content is None else RecentContentIndex(
+                                    path=recent_content or None),
+                                report_store=report_store,
+                                work_queue=None if work_queue is None else WorkQueue(work_queue), workers=workers)
+            bot.prefilter = prefilter
         else:
             log('running non live')
-            bot = PlagiaBot(pywikibot.Site(), generator, report_page, report_log=report_log)
+            bot = PlagiaBot(pywikibot.Site(), generator, report_page, report_log=report_log, diff_engine=diff_engine,
+                            concurrency=concurrency, clean_cache=clean_cache, source_cache=source_cache,
+                            recent_content=None if recent_content is None else RecentContentIndex(
+                                path=recent_content or None),
+                            report_store=report_store, workers=workers)
+        if not isinstance(bot, MultiSiteLive):
+            bot.compare_size = compare_size
+            bot.metrics_dump = metrics_dump
+            if metrics_port is not None:
+                start_metrics_server([bot.metrics], metrics_port)
         bot.run()
 
 
@@ -860,7 +1628,6 @@ if __name__ == "__main__":
     try:
         main()
     except:
-        import traceback
         traceback.print_exc()
         pywikibot.stopme()
 
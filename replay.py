@@ -0,0 +1,505 @@
+# -*- coding: utf-8 -*-
+"""
+Offline replay of recorded recent changes through the live bot pipeline.
+
+The recent changes and the revision texts are read from a JSONL corpus file instead of the stream and
+the API, and the uploads go to a local fake iThenticate XML-RPC server with configurable latency.
+The source pages of the reports are served by the fake server as well, so a replay requires no network.
+The moved content check (older revisions and linked pages) and the WikiProject tags are skipped.
+
+Each line of the corpus is an edit:
+    {"title": ..., "namespace": 0, "user": ..., "comment": ..., "timestamp": "2017-01-01T00:00:00Z",
+     "type": "edit", "bot": false, "old_rev": 1, "new_rev": 2, "old_text": ..., "new_text": ...,
+     "current_rev": 3, "current_text": ...,
+     "compare": {"body": ..., "touser": ..., "tocomment": ..., "totimestamp": ...}}
+The optional current_rev and current_text are the latest revision of the page when the corpus was recorded.
+The rollback check compares the added text with the latest revision, so without them (and later edits of the
+page in the corpus) the latest revision is the edit itself.
+The optional compare is the recorded response of the API diff (action=compare), used for edits of pages
+of at least -comparesize bytes (default as the bot, 0 - never) if all the edits of the corpus have it.
+
+Benchmark of a corpus (edits/sec, latency percentiles of the stages and iThenticate RPC counts):
+    python replay.py corpus.jsonl [-latency:0.1] [-processing:2] [-concurrency:4] [-workers:0] [-comparesize:N]
+
+Comparison of checking several wikis in a single process (as -live -sites:..., the bots share the process pool,
+the HTTP pool and the iThenticate session) with separate processes per wiki. The corpus is replayed on each of
+N simulated wikis, and the total max RSS and iThenticate logins are printed:
+    python replay.py corpus.jsonl -sites:4 [-processes] [options as above]
+
+Record a corpus from the live recent changes:
+    python replay.py -record:corpus.jsonl [-total:500]
+"""
+import calendar
+import json
+import re
+import subprocess
+import sys
+import threading
+import time
+import zlib
+try:
+    from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from SimpleXMLRPCServer import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+    from SocketServer import ThreadingMixIn
+
+import pywikibot
+from pywikibot.data import api
+
+import plagiabot
+import compare_diff
+from ithenticate_client import PollScheduler
+from revision_store import RevisionStore
+from rollback import RollbackChecker, PageHistory
+
+
+class Corpus(object):
+    def __init__(self, edits):
+        self.edits = edits
+        self.revisions = {}  # revid -> (edit, text)
+        self.current = {}  # title -> revid of the latest revision
+        for edit in edits:
+            self.revisions[edit['new_rev']] = (edit, edit['new_text'])
+            if edit['old_rev']:
+                self.revisions.setdefault(edit['old_rev'], (edit, edit['old_text']))
+        for edit in edits:
+            if edit.get('current_rev'):
+                self.revisions.setdefault(edit['current_rev'], (edit, edit['current_text']))
+                self.current[edit['title']] = max(edit['current_rev'], self.current.get(edit['title'], 0))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls([json.loads(line.decode('utf8')) for line in f if line.strip()])
+
+    @staticmethod
+    def rcinfo(edit):
+        """
+        Recent change entry (as in the stream) of a corpus edit
+        """
+        return {
+            'type': edit.get('type', 'edit'),
+            'bot': edit.get('bot', False),
+            'namespace': edit.get('namespace', 0),
+            'title': edit['title'],
+            'user': edit['user'],
+            'comment': edit.get('comment', ''),
+            'timestamp': calendar.timegm(time.strptime(edit['timestamp'], '%Y-%m-%dT%H:%M:%SZ')),
+            'revision': {'new': edit['new_rev'], 'old': edit['old_rev']},
+            'length': {'new': len(edit['new_text']), 'old': len(edit['old_text'] or '')}
+        }
+
+
+class ReplaySite(object):
+    def __init__(self, lang='en', dbname='enwiki', hostname='en.wikipedia.org'):
+        self.lang = lang
+        self.code = lang
+        self._dbname = dbname
+        self._hostname = hostname
+
+    def dbName(self):
+        return self._dbname
+
+    def hostname(self):
+        return self._hostname
+
+    def logged_in(self):
+        return False
+
+    def has_right(self, right):
+        return False
+
+
+class ReplayPage(object):
+    def __init__(self, site, title, namespace=0):
+        self.site = site
+        self._title = title
+        self._namespace = namespace
+
+    def title(self, withNamespace=True):
+        if withNamespace or ':' not in self._title or self._namespace == 0:
+            return self._title
+        return self._title.split(':', 1)[1]
+
+    def namespace(self):
+        return self._namespace
+
+
+class ReplayRevisionStore(RevisionStore):
+    """
+    Revisions of the corpus. Each fetch takes latency seconds (as an API request)
+    """
+
+    def __init__(self, site, corpus, latency=0.0):
+        super(ReplayRevisionStore, self).__init__(site, batch_size=50)
+        self.corpus = corpus
+        self.latency = latency
+
+    def _fetch(self, revids):
+        self.requests += 1
+        time.sleep(self.latency)
+        for revid in revids:
+            if revid not in self.corpus.revisions:
+                continue
+            edit, text = self.corpus.revisions[revid]
+            self.revisions[revid] = {
+                'title': edit['title'],
+                'user': edit['user'],
+                'comment': edit.get('comment', ''),
+                'timestamp': pywikibot.Timestamp.fromISOformat(edit['timestamp']),
+                'text': text
+            }
+
+
+class ReplayRollbackChecker(RollbackChecker):
+    def __init__(self, site, rollback_summary, corpus):
+        super(ReplayRollbackChecker, self).__init__(site, rollback_summary)
+        self.corpus = corpus
+
+    def _fetch(self, title, revid):
+        self.requests += 1
+        revisions = [{'revid': edit['new_rev'], 'user': edit['user'], 'comment': edit.get('comment', '')}
+                     for edit in self.corpus.edits if edit['title'] == title and edit['new_rev'] >= revid]
+        current_rev = self.corpus.current.get(title, 0)
+        if current_rev > max([rev['revid'] for rev in revisions] + [revid]):
+            revisions.append({'revid': current_rev, 'user': '', 'comment': ''})
+        revisions.sort(key=lambda rev: rev['revid'], reverse=True)
+        return PageHistory(revisions[:self.max_revisions], revid)
+
+
+class _Server(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+
+class _RequestHandler(SimpleXMLRPCRequestHandler):
+    rpc_paths = ('/rpc',)
+    source_page = ('<html><body>Some source page{}</body></html>'.format(
+        ''.join('<a href="/page{0}">link {0}</a>'.format(i) for i in range(20)))).encode('utf8')
+
+    def do_GET(self):
+        # source pages of the reports
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(self.source_page)))
+        self.end_headers()
+        self.wfile.write(self.source_page)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeIThenticate(object):
+    """
+    Local XML-RPC server with the iThenticate API methods used by the bot.
+
+    Each call takes latency seconds, and documents are processed processing_time seconds after their upload.
+    The similarity of a document is derived from the hash of its text (so it is the same in each replay).
+    """
+
+    def __init__(self, latency=0.1, processing_time=2.0, port=0):
+        self.latency = latency
+        self.processing_time = processing_time
+        self.documents = {}  # id -> (upload time, text)
+        self._lock = threading.Lock()
+        self.server = _Server(('127.0.0.1', port), requestHandler=_RequestHandler, logRequests=False,
+                              allow_none=True)
+        self.base_url = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+        self.url = self.base_url + '/rpc'
+        for name, func in [('login', self.login), ('folder.list', self.folder_list),
+                           ('document.add', self.document_add), ('document.get', self.document_get),
+                           ('report.get', self.report_get), ('report.sources', self.report_sources)]:
+            self.server.register_function(func, name)
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='fake-ithenticate')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _score(self, document_id):
+        return 30 + zlib.crc32(self.documents[document_id][1]) % 70
+
+    def login(self, params):
+        time.sleep(self.latency)
+        return {'status': 200, 'sid': 'replay'}
+
+    def folder_list(self, params):
+        time.sleep(self.latency)
+        return {'status': 200, 'folders': [{'id': 1, 'name': 'Wikipedia'}]}
+
+    def document_add(self, params):
+        time.sleep(self.latency)
+        uploaded = []
+        with self._lock:
+            for upload in params['uploads']:
+                document_id = len(self.documents) + 1
+                self.documents[document_id] = (time.time(), upload['upload'].data)
+                uploaded.append({'id': document_id})
+        return {'status': 200, 'uploaded': uploaded}
+
+    def document_get(self, params):
+        time.sleep(self.latency)
+        document_id = params['id']
+        if document_id not in self.documents:
+            return {'status': 404}
+        is_pending = time.time() - self.documents[document_id][0] < self.processing_time
+        return {'status': 200, 'documents': [{'id': document_id, 'is_pending': is_pending,
+                                              'parts': [{'id': document_id, 'score': self._score(document_id)}]}]}
+
+    def report_get(self, params):
+        time.sleep(self.latency)
+        return {'status': 200, 'report_url': '{}/report/{}'.format(self.base_url, params['id'])}
+
+    def report_sources(self, params):
+        time.sleep(self.latency)
+        document_id = params['id']
+        score = self._score(document_id)
+        words = len(self.documents[document_id][1].split())
+        return {'status': 200, 'sources': [{'linkurl': '{}/source/{}'.format(self.base_url, document_id),
+                                            'percent': score, 'word_count': words * score // 100,
+                                            'collection': ['Internet']}]}
+
+
+class ReplayBot(plagiabot.PlagiaBotLive):
+    def __init__(self, corpus, server, site=None, api_latency=0.0, **kwargs):
+        site = ReplaySite() if site is None else site
+        super(ReplayBot, self).__init__(site, **kwargs)
+        self.corpus = corpus
+        self.ithenticate_url = server.url
+        self.revisions = ReplayRevisionStore(site, corpus, api_latency)
+        local_messages = plagiabot.messages[site.lang] if site.lang in plagiabot.messages else plagiabot.messages['en']
+        self.rollback_checker = ReplayRollbackChecker(site, local_messages['rollback_of_summary'], corpus)
+        self.api_latency = api_latency
+        if not all('compare' in edit for edit in corpus.edits if edit['old_rev']):
+            self.compare_size = None  # the corpus has no recorded API diffs
+        self.coalesce_window = 0
+        self.poll_interval = 0.5
+        if self.owns_services:
+            self.poll_scheduler = PollScheduler(default_wait=server.processing_time, min_backoff=0.5, max_backoff=5)
+
+    def compare_revisions(self, prev_rev, new_rev):
+        self.metrics.inc('compare_requests')
+        time.sleep(self.api_latency)
+        return self.corpus.revisions[new_rev][0]['compare']
+
+    def remove_moved_content(self, page, prev_rev, content, comment, check_history=True):
+        return content  # the corpus has no older revisions and linked pages
+
+    def page_tags(self, titles):
+        return dict((title, '') for title in titles)
+
+    def replay(self):
+        """
+        Replay the corpus through the pipeline until all the edits are reported. Returns the elapsed time
+        """
+        return replay_sites([self])
+
+
+def replay_sites(bots):
+    """
+    Replay the corpus through the pipelines of bots of several wikis (the first bot shares its services with
+    the others, as MultiSiteLive) until all the edits are reported. Returns the elapsed time
+    """
+    start = time.time()
+    bots[0].start()
+    for bot in bots[1:]:
+        bot.share_services(bots[0])
+        bot.start()
+    for edit in bots[0].corpus.edits:
+        for bot in bots:
+            page = ReplayPage(bot.site, edit['title'], edit.get('namespace', 0))
+            page._rcinfo = Corpus.rcinfo(edit)
+            bot.pipeline.put(page)
+    for bot in bots:
+        bot.pipeline.stop()
+    return time.time() - start
+
+
+def max_rss():
+    """
+    Max RSS of the process plus the max RSS of its largest worker process in MB
+    """
+    try:
+        import resource
+    except ImportError:
+        return 0
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss +
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) // 1024
+
+
+def compare_processes(args, sites):
+    """
+    Replay with separate processes for each of the sites. Returns the elapsed time, total max RSS and logins
+    """
+    start = time.time()
+    processes = [subprocess.Popen([sys.executable, __file__] + args, stdout=subprocess.PIPE) for _ in range(sites)]
+    outputs = [process.communicate()[0].decode('utf8') for process in processes]
+    elapsed = time.time() - start
+    rss = sum(int(re.search(r'Max RSS: (\d+) MB', output).group(1)) for output in outputs)
+    logins = sum(int(re.search(r'login: (\d+)', output).group(1)) for output in outputs)
+    return elapsed, rss, logins
+
+
+def current_revisions(site, titles):
+    """
+    Dict of title to (revid, text) of the latest revision of the pages
+    """
+    current = {}
+    titles = sorted(set(titles))
+    for i in range(0, len(titles), 50):
+        params = {
+            'action': 'query',
+            'prop': 'revisions',
+            'titles': '|'.join(titles[i:i + 50]),
+            'rvprop': 'ids|content',
+            'rvslots': 'main',
+            'formatversion': 2
+        }
+        data = api.Request(site=site, parameters=params).submit()
+        normalized = dict((entry['to'], entry['from']) for entry in data['query'].get('normalized', []))
+        for page in data['query'].get('pages', []):
+            for rev in page.get('revisions', []):
+                current[normalized.get(page['title'], page['title'])] = (rev['revid'],
+                                                                         rev['slots']['main'].get('content'))
+    return current
+
+
+def record(path, total=500):
+    """
+    Record edits of the live recent changes (with their revision texts) as corpus.
+    The latest revisions of the pages at the end of the recording are recorded as their current revisions
+    """
+    site = pywikibot.Site()
+    revisions = RevisionStore(site)
+    edits = []
+    try:
+        for page in plagiabot.live_rc_generator(site):
+            rcinfo = page._rcinfo
+            if rcinfo['type'] not in ('edit', 'new'):
+                continue
+            new_rev, old_rev = rcinfo['revision']['new'], rcinfo['revision'].get('old', 0)
+            new_revision = revisions.get(new_rev)
+            old_revision = revisions.get(old_rev) if old_rev else None
+            if new_revision is None or new_revision['text'] is None:
+                continue
+            edit = {
+                'title': page.title(),
+                'namespace': rcinfo['namespace'],
+                'user': rcinfo['user'],
+                'comment': rcinfo['comment'],
+                'timestamp': new_revision['timestamp'].strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'type': rcinfo['type'],
+                'bot': rcinfo['bot'],
+                'old_rev': old_rev,
+                'new_rev': new_rev,
+                'old_text': '' if old_revision is None else old_revision['text'],
+                'new_text': new_revision['text']
+            }
+            if old_rev:
+                edit['compare'] = compare_diff.compare(site, old_rev, new_rev)
+            revisions.discard([new_rev, old_rev])
+            edits.append(edit)
+            if len(edits) == total:
+                break
+    except KeyboardInterrupt:
+        pass
+    current = current_revisions(site, [edit['title'] for edit in edits])
+    with open(path, 'ab') as f:
+        for edit in edits:
+            if edit['title'] in current and current[edit['title']][0] > edit['new_rev']:
+                edit['current_rev'], edit['current_text'] = current[edit['title']]
+            f.write(json.dumps(edit).encode('utf8') + b'\n')
+
+
+def main(*args):
+    latency = 0.1
+    processing_time = 2.0
+    api_latency = 0.0
+    concurrency = 4
+    workers = 0
+    compare_size = plagiabot.COMPARE_SIZE
+    corpus_path = None
+    record_path = None
+    total = 500
+    sites = 1
+    processes = False
+    for arg in args:
+        if arg.startswith('-latency:'):
+            latency = float(arg[len('-latency:'):])
+        elif arg.startswith('-processing:'):
+            processing_time = float(arg[len('-processing:'):])
+        elif arg.startswith('-apilatency:'):
+            api_latency = float(arg[len('-apilatency:'):])
+        elif arg.startswith('-concurrency:'):
+            concurrency = int(arg[len('-concurrency:'):])
+        elif arg.startswith('-workers:'):
+            workers = int(arg[len('-workers:'):])
+        elif arg.startswith('-comparesize:'):
+            compare_size = int(arg[len('-comparesize:'):]) or None
+        elif arg.startswith('-record:'):
+            record_path = arg[len('-record:'):]
+        elif arg.startswith('-total:'):
+            total = int(arg[len('-total:'):])
+        elif arg.startswith('-sites:'):
+            sites = int(arg[len('-sites:'):])
+        elif arg.startswith('-processes'):
+            processes = True
+        else:
+            corpus_path = arg
+    if record_path is not None:
+        record(record_path, total)
+        return
+    if corpus_path is None:
+        print(__doc__)
+        return
+
+    if sites > 1 and processes:
+        elapsed, rss, logins = compare_processes(
+            [arg for arg in args if not arg.startswith('-sites:') and not arg.startswith('-processes')], sites)
+        print('{} processes: {:.2f}s, total max RSS {} MB, {} iThenticate logins'.format(sites, elapsed, rss, logins))
+        return
+
+    corpus = Corpus.load(corpus_path)
+    server = FakeIThenticate(latency, processing_time)
+    bots = []
+    for i in range(sites):
+        site = ReplaySite() if i == 0 else ReplaySite('l{}'.format(i), 'l{}wiki'.format(i), 'l{}.wikipedia.org'.format(i))
+        bots.append(ReplayBot(corpus, server, site=site, api_latency=api_latency, concurrency=concurrency,
+                              workers=workers, shared=bots[0] if bots else None))
+        if bots[-1].compare_size is not None:
+            bots[-1].compare_size = compare_size
+    server.start()  # after the process pool of the bot was started
+    elapsed = replay_sites(bots)
+    server.stop()
+    for bot in bots:
+        bot.close()
+    bot = bots[0]
+    if sites > 1:
+        print('1 process, {} wikis: {:.2f}s, total max RSS {} MB, {} iThenticate logins'.format(
+            sites, elapsed, max_rss(), bot.client.rpc_calls['login']))
+        print('Uploads per wiki: {}, stage errors: {}'.format(
+            ', '.join(str(dict((stat['stage'], stat['processed']) for stat in site_bot.pipeline.stats())['upload'])
+                      for site_bot in bots),
+            sum(stat['errors'] for site_bot in bots for stat in site_bot.pipeline.stats())))
+        return
+
+    print('{} edits in {:.2f}s ({:.2f} edits/s)'.format(len(corpus.edits), elapsed, len(corpus.edits) / elapsed))
+    print('{:<10} {:>9} {:>6} {:>9} {:>9} {:>9}'.format('stage', 'processed', 'errors', 'p50 (s)', 'p90 (s)', 'p99 (s)'))
+    for stat in bot.pipeline.stats():
+        print('{stage:<10} {processed:>9} {errors:>6} {p50:>9.3f} {p90:>9.3f} {p99:>9.3f}'.format(**stat))
+    rpc_calls = bot.client.rpc_calls
+    print('iThenticate RPC calls: {} [{}]'.format(sum(rpc_calls.values()), ', '.join(
+        '{}: {}'.format(method, count) for method, count in sorted(rpc_calls.items()))))
+    print('Revision requests: {}, compare requests: {}, rollback history requests: {}'.format(
+        bot.revisions.requests, bot.metrics.counter('compare_requests').value, bot.rollback_checker.requests))
+    print(bot.poll_scheduler.format_stats())
+    print('Max RSS: {} MB'.format(max_rss()))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
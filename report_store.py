@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent store of uploaded texts and their iThenticate reports.
+
+The same added text is often checked more than once (re-added after revert, copied into several drafts).
+Uploads are keyed by hash of the normalized text (lower case words, ignoring punctuation and whitespace),
+so identical or near identical texts reuse the document and report of the first upload instead of
+uploading the text again and waiting for a new report.
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+
+_word_re = re.compile(r'\w+', re.U)
+
+
+def text_hash(text):
+    """
+    Hash of the normalized text
+    """
+    normalized = ' '.join(_word_re.findall(text.lower()))
+    return hashlib.sha1(normalized.encode('utf8')).hexdigest()
+
+
+class ReportStore(object):
+    def __init__(self, path=':memory:', ttl=30 * 24 * 3600):
+        self.ttl = ttl
+        self.reused_uploads = 0
+        self.reused_reports = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS uploads (text_hash TEXT PRIMARY KEY, document_id INTEGER, '
+                         'part TEXT, sources TEXT, updated REAL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS uploads_document_id ON uploads (document_id)')
+        self._db.commit()
+
+    def document_id(self, text):
+        """
+        Document id of a previous upload of text, or None
+        """
+        with self._lock:
+            row = self._db.execute('SELECT document_id, updated FROM uploads WHERE text_hash = ?',
+                                   (text_hash(text),)).fetchone()
+            if row is None or time.time() - row[1] >= self.ttl:
+                return None
+            self.reused_uploads += 1
+            return row[0]
+
+    def put_document(self, text, document_id):
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO uploads (text_hash, document_id, updated) VALUES (?, ?, ?)',
+                             (text_hash(text), document_id, time.time()))
+            self._db.commit()
+
+    def has_report(self, document_id):
+        with self._lock:
+            return self._db.execute('SELECT 1 FROM uploads WHERE document_id = ? AND part IS NOT NULL',
+                                    (document_id,)).fetchone() is not None
+
+    def report(self, document_id):
+        """
+        Tuple of the stored document part and sources of document_id, or None if there is no stored report
+        """
+        with self._lock:
+            row = self._db.execute('SELECT part, sources FROM uploads WHERE document_id = ? AND part IS NOT NULL',
+                                   (document_id,)).fetchone()
+            if row is None:
+                return None
+            self.reused_reports += 1
+            return json.loads(row[0]), json.loads(row[1])
+
+    def put_report(self, document_id, part, sources):
+        with self._lock:
+            self._db.execute('UPDATE uploads SET part = ?, sources = ? WHERE document_id = ?',
+                             (json.dumps(part, default=str), json.dumps(sources, default=str), document_id))
+            self._db.commit()
+
+    def forget(self, document_id):
+        """
+        Remove document that failed, so the text is uploaded again next time
+        """
+        with self._lock:
+            self._db.execute('DELETE FROM uploads WHERE document_id = ?', (document_id,))
+            self._db.commit()
+
+    def purge(self):
+        """
+        Remove expired uploads
+        """
+        with self._lock:
+            self._db.execute('DELETE FROM uploads WHERE updated <= ?', (time.time() - self.ttl,))
+            self._db.commit()
+
+    def format_stats(self):
+        return 'Report store: {} uploads reused, {} reports reused'.format(self.reused_uploads, self.reused_reports)
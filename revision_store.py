@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Store of revisions fetched in bulk from the API.
+
+Revisions of many pages are fetched together using the revids parameter of prop=revisions,
+in as few requests as the API limits allow.
+Cleaned revision texts are cached by revision id, as the same revision is cleaned for several checks.
+"""
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import pywikibot
+from pywikibot.data import api
+
+
+class RevisionStore(object):
+    """
+    Revisions keyed by revision id. Each revision is dict with title, user, comment, timestamp and text
+    """
+
+    def __init__(self, site, batch_size=None):
+        self.site = site
+        if batch_size is None:
+            batch_size = 500 if site.logged_in() and site.has_right('apihighlimits') else 50
+        self.batch_size = batch_size
+        self.revisions = {}
+        self.sizes = {}  # revid -> size in bytes
+        self.requests = 0
+
+    def prefetch(self, revids):
+        """
+        Fetch the revisions that are not already in the store
+        """
+        missing = sorted(set(revid for revid in revids if revid and revid not in self.revisions))
+        for i in range(0, len(missing), self.batch_size):
+            self._fetch(missing[i:i + self.batch_size])
+
+    def _fetch(self, revids):
+        params = {
+            'action': 'query',
+            'prop': 'revisions',
+            'revids': '|'.join(str(revid) for revid in revids),
+            'rvprop': 'ids|timestamp|user|comment|content',
+            'rvslots': 'main',
+            'formatversion': 2
+        }
+        while True:
+            self.requests += 1
+            data = api.Request(site=self.site, parameters=params).submit()
+            for page in data['query'].get('pages', []):
+                for rev in page.get('revisions', []):
+                    if 'slots' in rev:
+                        text = rev['slots']['main'].get('content')
+                    else:
+                        text = rev.get('content')
+                    self.revisions[rev['revid']] = {
+                        'title': page['title'],
+                        'user': rev.get('user'),
+                        'comment': rev.get('comment', ''),
+                        'timestamp': pywikibot.Timestamp.fromISOformat(rev['timestamp']),
+                        'text': text
+                    }
+            if 'continue' not in data:
+                break
+            params.update(data['continue'])
+
+    def prefetch_sizes(self, revids):
+        """
+        Fetch the sizes (without the texts) of the revisions whose size is not already in the store
+        """
+        missing = sorted(set(revid for revid in revids if revid and revid not in self.sizes))
+        for i in range(0, len(missing), self.batch_size):
+            params = {
+                'action': 'query',
+                'prop': 'revisions',
+                'revids': '|'.join(str(revid) for revid in missing[i:i + self.batch_size]),
+                'rvprop': 'ids|size',
+                'formatversion': 2
+            }
+            self.requests += 1
+            data = api.Request(site=self.site, parameters=params).submit()
+            for page in data['query'].get('pages', []):
+                for rev in page.get('revisions', []):
+                    self.sizes[rev['revid']] = rev['size']
+
+    def get(self, revid):
+        """
+        The revision (dict) or None if it doesn't exist. Fetches the revision if it isn't prefetched
+        """
+        if revid not in self.revisions:
+            self.prefetch([revid])
+        return self.revisions.get(revid)
+
+    def discard(self, revids):
+        for revid in revids:
+            self.revisions.pop(revid, None)
+            self.sizes.pop(revid, None)
+
+
+class CleanedTextCache(object):
+    """
+    LRU cache of cleaned revision texts keyed by (site, revid).
+
+    The cache is bounded by number of entries and optionally by total text size (in characters).
+    If path is given, the texts are also stored in SQLite database so a restarted bot doesn't
+    have to clean the recent revisions again.
+    """
+
+    def __init__(self, max_entries=1000, max_size=None, path=None, max_disk_entries=100000):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.max_disk_entries = max_disk_entries
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.RLock()
+        self._db = None
+        self._disk_writes = 0
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS cleaned_text (site TEXT, revid INTEGER, text TEXT, '
+                             'PRIMARY KEY (site, revid))')
+            self._db.commit()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self.entries or self._disk_get(key) is not None
+
+    def _disk_get(self, key):
+        if self._db is None:
+            return None
+        row = self._db.execute('SELECT text FROM cleaned_text WHERE site = ? AND revid = ?', key).fetchone()
+        return None if row is None else row[0]
+
+    def _disk_put(self, key, text):
+        self._db.execute('INSERT OR REPLACE INTO cleaned_text (site, revid, text) VALUES (?, ?, ?)', key + (text,))
+        self._disk_writes += 1
+        if self._disk_writes % 1000 == 0:
+            # keep only the most recent entries
+            self._db.execute('DELETE FROM cleaned_text WHERE rowid <= (SELECT MAX(rowid) FROM cleaned_text) - ?',
+                             (self.max_disk_entries,))
+        self._db.commit()
+
+    def _add(self, key, text):
+        self.entries[key] = text
+        self.size += len(text)
+        while len(self.entries) > self.max_entries or (self.max_size is not None and self.size > self.max_size and
+                                                       len(self.entries) > 1):
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+    def get(self, key):
+        with self._lock:
+            text = self.entries.pop(key, None)
+            if text is not None:
+                self.entries[key] = text  # move to end
+                self.hits += 1
+                return text
+            text = self._disk_get(key)
+            if text is not None:
+                self.hits += 1
+                self._add(key, text)
+                return text
+            self.misses += 1
+            return None
+
+    def put(self, key, text):
+        with self._lock:
+            if key in self.entries:
+                self.size -= len(self.entries.pop(key))
+            self._add(key, text)
+            if self._db is not None:
+                self._disk_put(key, text)
+
+    def get_or_clean(self, key, get_text, clean):
+        """
+        Cleaned text of key. On cache miss the text is cleaned using clean(get_text()) and stored
+        """
+        text = self.get(key)
+        if text is None:
+            text = clean(get_text())
+            self.put(key, text)
+        return text
+
+    def format_stats(self):
+        return 'Cleaned text cache: {} entries ({} chars), {} hits, {} misses, {} evictions'.format(
+            len(self.entries), self.size, self.hits, self.misses, self.evictions)
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
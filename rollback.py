@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Detection of edits that were rolled back (or whose text was kept in the current version).
+
+The revisions made after the edit are fetched (ids, users and comments only, following the continuation
+until the edit is reached, up to max_requests requests) and kept per page for a short time, so several
+edits of the same page are checked with one fetch. An edit older than the fetched revisions of a very
+active page isn't considered rolled back.
+The added text is compared with the current version using shingle fingerprints instead of
+longest common substring search.
+"""
+import re
+import time
+from collections import OrderedDict
+
+from pywikibot.data import api
+
+from shingles import ShingleIndex
+
+
+class PageHistory(object):
+    """
+    Revisions of a page from end_revid (inclusive) to the latest revision, newest first
+    """
+
+    def __init__(self, revisions, end_revid, truncated=False):
+        self.revisions = revisions
+        self.end_revid = end_revid
+        self.truncated = truncated  # revisions older than the last fetched revision weren't fetched
+        self.fetched = time.time()
+        self.current_index = None
+
+    @property
+    def latest_revid(self):
+        return self.revisions[0]['revid'] if self.revisions else None
+
+    def after(self, revid):
+        """
+        Revisions starting at revid (inclusive)
+        """
+        return [rev for rev in self.revisions if rev['revid'] >= revid]
+
+
+class RollbackChecker(object):
+    def __init__(self, site, rollback_summary, max_revisions=50, max_requests=10, ttl=60, max_pages=1000):
+        """
+        max_revisions is the number of revisions fetched per request and max_requests the number of requests
+        per page history
+        """
+        self.site = site
+        self.rollback_summary = rollback_summary
+        self.max_revisions = max_revisions
+        self.max_requests = max_requests
+        self.ttl = ttl
+        self.max_pages = max_pages
+        self.histories = OrderedDict()
+        self.requests = 0
+
+    def history(self, title, revid):
+        """
+        PageHistory of title including revid. Uses the cached history if it is recent enough and includes revid
+        """
+        history = self.histories.get(title)
+        if (history is not None and history.latest_revid is not None and history.end_revid <= revid <= history.latest_revid and
+                time.time() - history.fetched < self.ttl):
+            return history
+        history = self._fetch(title, revid)
+        self.histories.pop(title, None)
+        self.histories[title] = history
+        while len(self.histories) > self.max_pages:
+            self.histories.popitem(last=False)
+        return history
+
+    def _fetch(self, title, revid):
+        params = {
+            'action': 'query',
+            'prop': 'revisions',
+            'titles': title,
+            'rvprop': 'ids|user|comment',
+            'rvdir': 'older',
+            'rvendid': revid,
+            'rvlimit': self.max_revisions,
+            'formatversion': 2
+        }
+        revisions = []
+        for _ in range(self.max_requests):
+            self.requests += 1
+            data = api.Request(site=self.site, parameters=params).submit()
+            for page in data['query'].get('pages', []):
+                for rev in page.get('revisions', []):
+                    revisions.append({'revid': rev['revid'], 'user': rev.get('user', ''),
+                                      'comment': rev.get('comment', '')})
+            if 'continue' not in data:
+                return PageHistory(revisions, revid)
+            params.update(data['continue'])
+        return PageHistory(revisions, revid, truncated=True)
+
+    def was_rolledback(self, title, new_rev, added_lines, current_text):
+        """
+        Whether the edit new_rev should be skipped. current_text(revid) returns the cleaned text of revision revid
+        and is called only once per latest revision of a page.
+        """
+        history = self.history(title, new_rev)
+        if history.latest_revid is None:
+            return False
+
+        # check whether the added lines exists in the current version or not
+        if history.current_index is None or history.current_index[0] != history.latest_revid:
+            index = ShingleIndex()
+            index.add(current_text(history.latest_revid))
+            history.current_index = (history.latest_revid, index)
+        if history.current_index[1].coverage(added_lines) > 0.8:
+            return True
+
+        # alternatively, look for rollback of that revision
+        revisions = history.after(new_rev)
+        if len(revisions) == 0 or revisions[-1]['revid'] != new_rev:
+            return False  # the revision is missing (e.g deleted) or older than the fetched revisions
+        editor = revisions[-1]['user']
+        try:
+            reverted_edit = re.compile(self.rollback_summary.format(editor, new_rev))
+        except re.error:
+            return False
+        return any(editor in rev['comment'] and reverted_edit.match(rev['comment']) for rev in revisions)
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+Content fingerprints using hashed word shingles.
+
+Checking whether each added line exists in old texts with substring search costs
+O(lines x text size) per text. ShingleIndex hashes the word shingles (sequences of SHINGLE_SIZE
+words) of the old texts once with their positions, and a line is considered to exist in the old
+texts if its shingles are consecutive in a line of an old text. This is the same as substring
+search of the line, except that whitespace is normalized and a line that starts or ends with part
+of a word of the old text is not considered as existing. Lines shorter than a shingle are checked
+with substring search.
+
+RecentContentIndex is a compact index of shingles of recently changed wiki pages, used to
+skip text copied from other pages of the wiki before sending it to the server. Only the content
+that existed before an edit is indexed, and shingles indexed from the page itself are not considered
+as existing, so text that was removed and re-added to a page is still checked. It doesn't keep positions,
+so a line is considered to exist if each of its shingles was indexed, even if not consecutively.
+
+Benchmark and comparison with substring search:
+    python shingles.py old1.txt [old2.txt ...] new.txt
+"""
+import os
+import sys
+import threading
+import time
+import zlib
+from array import array
+
+SHINGLE_SIZE = 5
+
+
+def shingle_hash(shingle):
+    """
+    Stable 64 bit hash of text
+    """
+    data = shingle.encode('utf8')
+    return (zlib.crc32(data) & 0xffffffff) << 32 | (zlib.adler32(data) & 0xffffffff)
+
+
+def title_hash(title):
+    """
+    Non zero 32 bit hash of page title
+    """
+    return (zlib.crc32(title.encode('utf8')) & 0xffffffff) or 1
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """
+    Hashes of the word shingles of text
+    """
+    words = text.split()
+    return [shingle_hash(' '.join(words[i:i + size])) for i in range(len(words) - size + 1)]
+
+
+class ShingleIndex(object):
+    def __init__(self, size=SHINGLE_SIZE):
+        self.size = size
+        self.positions = {}  # shingle -> set of positions
+        self.texts = []
+        self._next = 0
+
+    def add(self, text):
+        for line in text.split(u'\n'):
+            line_shingles = shingles(line, self.size)
+            for i, shingle in enumerate(line_shingles):
+                self.positions.setdefault(shingle, set()).add(self._next + i)
+            self._next += len(line_shingles) + 1  # shingles of different lines are not consecutive
+        self.texts.append(text)
+
+    def contains(self, line):
+        """
+        Whether line exists in the indexed texts: its shingles are consecutive in a line of an indexed text
+        """
+        if len(line.split()) < self.size:
+            return any(line in text for text in self.texts)
+        line_shingles = shingles(line, self.size)
+        starts = self.positions.get(line_shingles[0], ())
+        for i, shingle in enumerate(line_shingles[1:], 1):
+            if not starts:
+                break
+            positions = self.positions.get(shingle, ())
+            starts = [start for start in starts if start + i in positions]
+        return len(starts) > 0
+
+    def coverage(self, text):
+        """
+        Fraction of the shingles of text that exist in the indexed texts (shingles of each line, as indexed)
+        """
+        text_shingles = [shingle for line in text.split(u'\n') for shingle in shingles(line, self.size)]
+        if len(text_shingles) == 0:
+            return 1.0 if self.contains(text) else 0.0
+        return float(sum(1 for shingle in text_shingles if shingle in self.positions)) / len(text_shingles)
+
+    def remove_existing_lines(self, content):
+        """
+        Remove the lines of content that exist in the indexed texts
+        """
+        return u'\n'.join([line for line in content.split(u'\n') if not self.contains(line)])
+
+
+class RecentContentIndex(object):
+    """
+    Memory compact index of shingle hashes of recent wiki content.
+
+    The hashes are stored in open addressing hash tables backed by array('Q'), with the hash of the title
+    of the page each shingle was indexed from in a parallel array('I') (12 bytes per shingle, title hash 0
+    marks shingle of several pages). When the current table is half full it replaces the previous table,
+    so the index holds the shingles of the most recent content. The tables can be saved to file and loaded
+    on restart.
+    """
+
+    def __init__(self, capacity=2 ** 21, path=None, size=SHINGLE_SIZE):
+        self.capacity = capacity  # must be power of 2
+        self.size = size
+        self.path = path
+        self.current = array('Q', [0]) * capacity
+        self.current_titles = array('I', [0]) * capacity
+        self.previous = None
+        self.previous_titles = None
+        self.count = 0
+        self._lock = threading.Lock()  # the index is fed from several threads
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def _insert(self, table, titles, value, title):
+        mask = self.capacity - 1
+        i = (value >> 32) & mask  # the crc32 part of the hash
+        while table[i] != 0:
+            if table[i] == value:
+                if titles[i] != title:
+                    titles[i] = 0  # shingle of several pages
+                return False
+            i = (i + 1) & mask
+        table[i] = value
+        titles[i] = title
+        return True
+
+    @staticmethod
+    def _find(table, value, mask):
+        """
+        Slot of value in table, or -1
+        """
+        i = (value >> 32) & mask  # the crc32 part of the hash
+        while table[i] != 0:
+            if table[i] == value:
+                return i
+            i = (i + 1) & mask
+        return -1
+
+    def add(self, text, title=None):
+        """
+        Index the shingles of text of the page title
+        """
+        title = 0 if title is None else title_hash(title)
+        text_shingles = shingles(text, self.size)
+        with self._lock:
+            for shingle in text_shingles:
+                shingle = shingle or 1  # 0 marks empty slot
+                if self._insert(self.current, self.current_titles, shingle, title):
+                    self.count += 1
+                    if self.count > self.capacity // 2:
+                        self.previous, self.previous_titles = self.current, self.current_titles
+                        self.current = array('Q', [0]) * self.capacity
+                        self.current_titles = array('I', [0]) * self.capacity
+                        self.count = 0
+
+    def _exists(self, shingle, title):
+        """
+        Whether shingle is indexed from a page other than title (title hash, or 0 for any page)
+        """
+        shingle = shingle or 1
+        mask = self.capacity - 1
+        for table, titles in ((self.current, self.current_titles), (self.previous, self.previous_titles)):
+            if table is None:
+                continue
+            i = self._find(table, shingle, mask)
+            if i >= 0 and (title == 0 or titles[i] != title):
+                return True
+        return False
+
+    def __contains__(self, shingle):
+        return self._exists(shingle, 0)
+
+    def contains(self, line, title=None):
+        """
+        Whether line exists in the indexed content (of pages other than title, if given).
+        Lines shorter than a shingle are never considered as existing
+        """
+        title = 0 if title is None else title_hash(title)
+        line_shingles = shingles(line, self.size)
+        return len(line_shingles) > 0 and all(self._exists(shingle, title) for shingle in line_shingles)
+
+    def remove_existing_lines(self, content, title=None):
+        """
+        Remove the lines of content that exist in the indexed content (of pages other than title, if given)
+        """
+        return u'\n'.join([line for line in content.split(u'\n') if not self.contains(line, title)])
+
+    def save(self):
+        with self._lock, open(self.path, 'wb') as f:
+            array('Q', [self.count, 1 if self.previous is not None else 0]).tofile(f)
+            self.current.tofile(f)
+            self.current_titles.tofile(f)
+            if self.previous is not None:
+                self.previous.tofile(f)
+                self.previous_titles.tofile(f)
+
+    def load(self):
+        with open(self.path, 'rb') as f:
+            header = array('Q')
+            header.fromfile(f, 2)
+            self.count = header[0]
+            self.current = array('Q')
+            self.current.fromfile(f, self.capacity)
+            self.current_titles = array('I')
+            self.current_titles.fromfile(f, self.capacity)
+            if header[1]:
+                self.previous = array('Q')
+                self.previous.fromfile(f, self.capacity)
+                self.previous_titles = array('I')
+                self.previous_titles.fromfile(f, self.capacity)
+
+
+def main(*args):
+    """
+    Compare removing lines of new text found in old texts using substring search and using the index
+    """
+    if len(args) < 2:
+        print(__doc__)
+        return
+    texts = []
+    for file_name in args:
+        with open(file_name, 'rb') as f:
+            texts.append(f.read().decode('utf8'))
+    old_texts, new_text = texts[:-1], texts[-1]
+
+    start = time.time()
+    expected = new_text
+    for old_text in old_texts:
+        expected = u'\n'.join([line for line in expected.split(u'\n') if line not in old_text])
+    substring_time = time.time() - start
+
+    start = time.time()
+    index = ShingleIndex()
+    for old_text in old_texts:
+        index.add(old_text)
+    result = index.remove_existing_lines(new_text)
+    index_time = time.time() - start
+
+    expected_lines = set(expected.split(u'\n'))
+    result_lines = set(result.split(u'\n'))
+    print('substring search: {:.3f}s, index: {:.3f}s'.format(substring_time, index_time))
+    print('kept lines: {} (substring), {} (index), {} different'.format(
+        len(expected_lines), len(result_lines), len(expected_lines.symmetric_difference(result_lines))))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
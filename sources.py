@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+Fetching of source pages found by iThenticate.
+
+Source pages are fetched concurrently through a pooled HTTP session, with a limit of connections
+per host, a total time limit for each page (a slow server can't hold a worker by sending the body
+byte by byte) and a maximal size of downloaded body.
+The classifications of sources are cached, as the same sources (mostly mirrors) are found again and again.
+
+Benchmark of page classification:
+    python sources.py page1.html [page2.html ...]
+"""
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import defaultdict
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+try:
+    from urlparse import urlparse
+    from urllib import quote as urllib_quote
+except ImportError:
+    from urllib.parse import urlparse, quote as urllib_quote  # python3 compatibility
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError, ProtocolError
+
+
+class SourcePage(object):
+    def __init__(self, url, status_code, text, truncated=False):
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+        self.truncated = truncated
+
+
+class SourceFetcher(object):
+    def __init__(self, workers=10, per_host=2, timeout=15, max_bytes=2 * 1024 * 1024):
+        self.per_host = per_host
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=per_host)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self._host_limits = defaultdict(lambda: threading.Semaphore(self.per_host))
+        self._lock = threading.Lock()
+
+    def _host_limit(self, url):
+        with self._lock:
+            return self._host_limits[urlparse(url).netloc]
+
+    @staticmethod
+    def _chunks(response, chunk_size=64 * 1024):
+        """
+        Chunks of the response body, as soon as they are received (without waiting for full chunk_size)
+        """
+        raw = response.raw
+        if not hasattr(raw, 'read1'):  # urllib3 < 2
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                yield chunk
+            return
+        while True:
+            try:
+                chunk = raw.read1(chunk_size, decode_content=True)
+            except ReadTimeoutError as e:
+                raise requests.exceptions.ReadTimeout(e)
+            except ProtocolError as e:
+                raise requests.exceptions.ConnectionError(e)
+            if not chunk:
+                break
+            yield chunk
+
+    def fetch(self, url):
+        """
+        Fetch url and returns SourcePage. The body is truncated to max_bytes.
+        Raises requests.exceptions.Timeout if fetching takes more than timeout seconds (each read is limited
+        by timeout as well, so the total time is at most twice the timeout)
+        """
+        with self._host_limit(url):
+            deadline = time.time() + self.timeout
+            response = self.session.get(url, timeout=self.timeout, stream=True)
+            try:
+                chunks = []
+                size = 0
+                truncated = False
+                for chunk in self._chunks(response):
+                    chunks.append(chunk)
+                    size += len(chunk)
+                    if size >= self.max_bytes:
+                        truncated = True
+                        break
+                    if time.time() > deadline:
+                        raise requests.exceptions.Timeout('Fetching {} took more than {}s'.format(url, self.timeout))
+                content = b''.join(chunks)[:self.max_bytes]
+            finally:
+                response.close()
+        try:
+            text = content.decode(response.encoding or 'utf-8', 'replace')
+        except LookupError:  # unknown encoding
+            text = content.decode('utf-8', 'replace')
+        return SourcePage(url, response.status_code, text, truncated)
+
+    def _fetch_or_error(self, url):
+        try:
+            return self.fetch(url)
+        except Exception as e:
+            return e
+
+    def fetch_all(self, urls):
+        """
+        Fetch urls concurrently. Returns dict of url to SourcePage, or to the exception raised fetching it
+        """
+        urls = list(set(urls))
+        return dict(zip(urls, self.executor.map(self._fetch_or_error, urls)))
+
+
+class PageClassifier(object):
+    """
+    Classify source pages as mirrors, CC licensed or low quality sites.
+
+    The patterns are compiled once (the mirror pattern of an article title is compiled once per title),
+    and each check stops at the first match instead of finding all the matches.
+    """
+    MIRROR_HINT = '<span class="success">Mirror?</span>'
+    CC_HINT = '<span class="success">(CC-{})</span>'
+    CC_UNKNOWN_HINT = '<span class="success">(CC) (is it NC?)</span>'
+    LOW_QUALITY_HINT = '<span class="error">Low quality site</span>'
+    MIN_LINKS = 10
+
+    _mirror_re = re.compile('material from the Wikipedia article|From Wikipedia|source: wikipedia', re.I)
+    _cc_re = re.compile('under the terms of the Creative Commons Attribution License', re.I)
+    _cc_type_re = re.compile('<a href="http://creativecommons.org/licenses/(.+?)/', re.I)
+    _parked_re = re.compile('domain is for sale|buy this domain|get your domain name', re.I)
+    _html_re = re.compile('<html', re.I)
+    _link_re = re.compile('<a [^>]*>', re.I)
+
+    def __init__(self, max_titles=1000):
+        self.max_titles = max_titles
+        self._title_res = {}
+
+    def _title_mirror_re(self, article_title):
+        title_re = self._title_res.get(article_title)
+        if title_re is None:
+            if len(self._title_res) >= self.max_titles:
+                self._title_res.clear()
+            title_re = re.compile('wikipedia.org/w(?:iki/|/index.php\\?title=)(?:%s|%s)' % (
+                re.sub('[ _]', '[ _]', re.escape(article_title)), urllib_quote(article_title.encode('utf8'))), re.I)
+            self._title_res[article_title] = title_re
+        return title_re
+
+    def classify(self, page, article_title):
+        """
+        Returns tuple of verdict (source or skip), hint text and the level the classification applies to
+        (domain, url or page - specific for the article, or None if it shouldn't be cached)
+        """
+        if page.status_code != 200:
+            if page.status_code == 429 or page.status_code >= 500:
+                # transient error - not cached
+                return 'skip' if page.status_code == 500 else 'source', '', None
+            if page.status_code in [403, 404]:
+                return 'skip', '', 'url'  # low quality source
+            return 'source', '', 'url'
+        text = page.text
+        if self._mirror_re.search(text) or self._title_mirror_re(article_title).search(text):
+            return 'source', self.MIRROR_HINT, 'page'
+        if self._cc_re.search(text):
+            cc_type = self._cc_type_re.search(text)
+            if cc_type:
+                return 'source', self.CC_HINT.format(cc_type.group(1)), 'page'
+            return 'source', self.CC_UNKNOWN_HINT, 'page'
+        if self._parked_re.search(text):
+            return 'skip', self.LOW_QUALITY_HINT, 'url'
+        if len(text) < 5 or (self._html_re.search(text) and
+                             len(list(islice(self._link_re.finditer(text), self.MIN_LINKS))) < self.MIN_LINKS):
+            return 'skip', self.LOW_QUALITY_HINT, 'page'
+        return 'source', '', 'page'
+
+
+class SourceClassificationCache(object):
+    """
+    Persistent cache of source classifications (verdict and hint text) with expiry.
+
+    Classifications are kept per domain, per url (e.g not found, parked domain) or per url
+    and article (e.g mirror of the article). Transient errors (5xx, 429) aren't cached.
+    """
+
+    def __init__(self, path=':memory:', ttl=7 * 24 * 3600):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS source_classification (cache_key TEXT PRIMARY KEY, '
+                         'verdict TEXT, hint TEXT, updated REAL)')
+        self._db.commit()
+
+    @staticmethod
+    def _keys(url, title):
+        return ['domain:' + urlparse(url).netloc, 'url:' + url, 'page:{}|{}'.format(title, url)]
+
+    def get(self, url, title):
+        """
+        Returns tuple of (verdict, hint text), or None if there is no valid classification for the url
+        """
+        with self._lock:
+            for key in self._keys(url, title):
+                row = self._db.execute('SELECT verdict, hint, updated FROM source_classification WHERE cache_key = ?',
+                                       (key,)).fetchone()
+                if row is not None and time.time() - row[2] < self.ttl:
+                    self.hits += 1
+                    return row[0], row[1]
+            self.misses += 1
+            return None
+
+    def put(self, url, title, verdict, hint, level):
+        """
+        Store classification of url. level is one of domain, url or page
+        """
+        key = self._keys(url, title)[['domain', 'url', 'page'].index(level)]
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO source_classification (cache_key, verdict, hint, updated) '
+                             'VALUES (?, ?, ?, ?)', (key, verdict, hint, time.time()))
+            self._db.commit()
+
+    def purge(self):
+        """
+        Remove expired classifications
+        """
+        with self._lock:
+            self._db.execute('DELETE FROM source_classification WHERE updated < ?', (time.time() - self.ttl,))
+            self._db.commit()
+
+
+def main(*args):
+    """
+    Measure classification time of html pages given as files
+    """
+    if len(args) == 0:
+        print(__doc__)
+        return
+    pages = []
+    for file_name in args:
+        with open(file_name, 'rb') as f:
+            pages.append(SourcePage(file_name, 200, f.read().decode('utf8', 'replace')))
+    classifier = PageClassifier()
+    start = time.time()
+    for page in pages:
+        classifier.classify(page, 'Example article')
+    elapsed = time.time() - start
+    print('{} pages ({} chars) classified in {:.3f}s'.format(len(pages), sum(len(page.text) for page in pages), elapsed))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
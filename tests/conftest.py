@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import plagiabot_config
+except ImportError:
+    # the credentials of the deployment aren't needed by the tests
+    plagiabot_config = types.ModuleType('plagiabot_config')
+    plagiabot_config.ithenticate_user = 'test'
+    plagiabot_config.ithenticate_password = 'test'
+    sys.modules['plagiabot_config'] = plagiabot_config
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import random
+import re
+
+import pytest
+
+from blacklist import BlacklistMatcher
+
+LITERALS = [r'example\.com', r'mirror\.org', r'mirror\.org\.uk', r'wiki', r'he-free.info', r'\bfoo\.net\b',
+            r'\bbar', r'baz\.io\b', r'a\-b\.com', r'c\\b']
+REGEXES = [r'[a-z]+pedia\.com', r'copy(cat|dog)\.net', r'site\d+\.biz', r'\bmir+or\b', r'(?:ww\d)?\.old\.org',
+           r'^https?://short', r'\.(info|xyz)/$', r'mirror|clone']
+SEPARATE = [r'(\w)\1\.net', r'(?P<x>ab)(?P=x)\.com', r'(?i)UPPER\.com', r'(?s)line.end']
+
+HOSTS = [u'example.com', u'examplexcom', u'mirror.org', u'mirror.org.uk', u'mirror.orgx', u'xmirror.org',
+         u'wiki.net', u'he-free.info', u'hexfree.info', u'foo.net', u'xfoo.net', u'foo.netx', u'barb.com',
+         u'xbar.com', u'baz.io', u'baz.iox', u'a-b.com', u'c\\b', u'wookiepedia.com', u'pedia.com',
+         u'copycat.net', u'copycow.net', u'site12.biz', u'site.biz', u'mirror', u'mirrror', u'ww1.old.org',
+         u'old.org', u'aa.net', u'ab.net', u'abab.com', u'ab.com', u'upper.com', u'UPPER.com', u'clone.com',
+         u'other.com', u'shortener.com']
+
+
+def naive_search(patterns, url):
+    return any(re.search(pattern, url) for pattern in patterns)
+
+
+def _urls():
+    for host in HOSTS:
+        yield u'http://{}/'.format(host)
+        yield u'https://{}/page?id=1'.format(host)
+        yield u'http://www.{}/{}'.format(host, host)
+    yield u'short'
+    yield u'http://short.com/line\nend'
+    yield u''
+
+
+@pytest.mark.parametrize('patterns', [LITERALS, REGEXES, SEPARATE, LITERALS + REGEXES + SEPARATE])
+def test_same_as_naive_search(patterns):
+    matcher = BlacklistMatcher(patterns)
+    assert len(matcher) == len(patterns)
+    for url in _urls():
+        assert matcher.search(url) == naive_search(patterns, url), url
+
+
+def test_random_patterns():
+    rnd = random.Random(1)
+    patterns = LITERALS + REGEXES + SEPARATE
+    for _ in range(200):
+        sample = rnd.sample(patterns, rnd.randint(1, len(patterns)))
+        matcher = BlacklistMatcher(sample)
+        for url in _urls():
+            assert matcher.search(url) == naive_search(sample, url), (sample, url)
+
+
+def test_single_patterns():
+    # each pattern alone, so a wrong match can't hide behind another pattern
+    for pattern in LITERALS + REGEXES + SEPARATE:
+        matcher = BlacklistMatcher([pattern])
+        for url in _urls():
+            assert matcher.search(url) == naive_search([pattern], url), (pattern, url)
+
+
+def test_fallback_to_separate_regexes():
+    matcher = BlacklistMatcher(LITERALS + REGEXES + SEPARATE)
+    # back references and inline flags aren't merged into the alternation
+    assert sorted(regex.pattern for regex in matcher.separate) == sorted(SEPARATE)
+    assert matcher.literals_re is not None and matcher.regexes_re is not None
+
+
+def test_empty():
+    matcher = BlacklistMatcher([])
+    assert not matcher.search(u'http://example.com/')
+    assert len(matcher) == 0
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+
+import pytest
+
+pytest.importorskip('pywikibot')
+
+import compare_diff
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+def _body(name):
+    with open(os.path.join(DATA, name), 'rb') as f:
+        return json.loads(f.read().decode('utf8'))['compare']['body']
+
+
+def test_markup_context():
+    body = _body('compare_markup.json')
+    assert compare_diff.inserted_segments(body, skip_markup=True) == [
+        u'In 2019 the town was used as a location of a film, which brought many visitors to the town.',
+        u'The population grew {{convert|2|km}} around the centre of the town.'
+    ]
+    # without skip_markup every inserted line is kept (upper estimate of the prefilter)
+    assert len(compare_diff.inserted_segments(body)) == 10
+
+
+def test_rows():
+    body = _body('compare_rows.json')
+    segments = [
+        # added line (unescaped)
+        u'The town was founded in the twelfth century by merchants travelling along the river & its tributaries.',
+        # changed lines: only the inserted parts
+        u'a growing',
+        u'John since the last election'
+    ]
+    # context lines, deleted lines and the moved paragraph are skipped
+    assert compare_diff.inserted_segments(body) == segments
+    assert compare_diff.inserted_segments(body, skip_markup=True) == segments
+
+
+def test_empty():
+    assert compare_diff.inserted_segments('') == []
+
+
+def test_load_compared_edit():
+    pytest.importorskip('MySQLdb')
+    import plagiabot
+    from replay import ReplaySite, ReplayPage
+
+    with open(os.path.join(DATA, 'compare_markup.json'), 'rb') as f:
+        comparison = json.loads(f.read().decode('utf8'))['compare']
+    bot = plagiabot.PlagiaBot(ReplaySite(), [])
+    bot.compare_revisions = lambda prev_rev, new_rev: comparison
+    edit = bot.load_compared_edit(ReplayPage(bot.site, 'Example'), 101, 100)
+    assert edit['editor'] == 'Example user'
+    assert edit['comment'] == 'expand'
+    assert edit['old'] == ''
+    assert 'leader_name' not in edit['new'] and 'Smith' not in edit['new']
+    assert edit['new'].startswith(u'In 2019 the town was used as a location of a film')
+
+
+def test_compared_edit_without_full_texts():
+    pytest.importorskip('MySQLdb')
+    import plagiabot
+    from replay import ReplaySite, ReplayPage
+
+    class _Site(ReplaySite):
+        def __init__(self):
+            super(_Site, self).__init__()
+            self.loads = []
+
+        def loadrevisions(self, page, **kwargs):
+            self.loads.append(kwargs)
+            page._revisions = {}
+
+    row = (u'<tr><td colspan="2" class="diff-empty diff-side-deleted"></td><td class="diff-marker" data-marker="+">'
+           u'</td><td class="diff-addedline diff-side-added"><div>{}</div></td></tr>')
+    paragraph = (u'Paragraph {} of the new section describes the history of the town, its churches, mills and '
+                 u'markets, and the families that lived there during the long medieval period.')
+    comparison = {'body': u'\n'.join(row.format(paragraph.format(i)) for i in range(5)), 'touser': 'Example user',
+                  'tocomment': 'expand', 'totimestamp': '2017-01-01T00:00:00Z'}
+    site = _Site()
+    bot = plagiabot.PlagiaBot(site, [])
+    bot.compare_revisions = lambda prev_rev, new_rev: comparison
+    bot.was_rolledback = lambda page, new_rev, added_lines: False
+    edit = bot.load_compared_edit(ReplayPage(site, 'Example'), 101, 100)
+    bot.find_added_text(edit)
+    assert not any(load.get('getText') for load in site.loads)
+
+    del edit['compared']  # a fully loaded edit checks the older revisions of the page
+    bot.find_added_text(edit)
+    assert any(load.get('getText') for load in site.loads)
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import random
+
+import pytest
+
+from diff_engine import line_opcodes, get_diff_engine
+
+P1 = u'The river rises in the northern hills and flows south through a wide valley of farms and forests.'
+P2 = u'The first bridge over the river was built by the monks of the abbey in the thirteenth century.'
+P3 = u'In the nineteenth century the valley became a centre of the textile industry with many mills.'
+P4 = u'The railway reached the town in 1862, and the population doubled within twenty years after that.'
+NEW = u'Archaeologists found the remains of a Roman fort near the mouth of the river during the dredging works.'
+
+# (old, new) revision texts
+PAIRS = [
+    (u'\n'.join([P1, P2, P3]), u'\n'.join([P1, NEW, P2, P3])),  # inserted paragraph
+    (u'\n'.join([P1, P2, P3, P4]), u'\n'.join([P1, P4, P2, P3])),  # moved paragraph
+    (u'\n'.join([P1, P2, P3, P4]), u'\n'.join([P3, P4, NEW, P1, P2])),  # moved block and inserted paragraph
+    (u'', u'\n'.join([P1, P2])),  # new page
+    (u'\n'.join([P1, P2]), u''),  # blanked page
+    (u'', u''),
+    (u'\n'.join([P1, u'', P2, u'', P3]), u'\n'.join([P1, u'', NEW, u'', P2, u'', P3, u'', NEW])),  # repeated lines
+]
+
+
+def _check_opcodes(a, b, opcodes):
+    i = j = 0
+    rebuilt = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        assert (i1, j1) == (i, j)  # contiguous
+        assert i1 <= i2 and j1 <= j2
+        if tag == 'equal':
+            assert a[i1:i2] == b[j1:j2] and i2 > i1
+        elif tag == 'insert':
+            assert i1 == i2 and j2 > j1
+        elif tag == 'delete':
+            assert j1 == j2 and i2 > i1
+        else:
+            assert tag == 'replace' and i2 > i1 and j2 > j1
+        if tag != 'delete':
+            rebuilt += a[i1:i2] if tag == 'equal' else b[j1:j2]
+        i, j = i2, j2
+    assert (i, j) == (len(a), len(b))
+    assert rebuilt == b
+
+
+@pytest.mark.parametrize('old, new', PAIRS)
+def test_line_opcodes_samples(old, new):
+    a, b = old.split(u'\n'), new.split(u'\n')
+    _check_opcodes(a, b, line_opcodes(a, b))
+
+
+def test_line_opcodes_random():
+    rnd = random.Random(1)
+    for _ in range(500):
+        vocabulary = [u'line {}'.format(k) for k in range(rnd.randint(1, 12))]
+        a = [rnd.choice(vocabulary) for _ in range(rnd.randint(0, 30))]
+        b = list(a)
+        for _ in range(rnd.randint(0, 6)):  # edits: insert, delete, move
+            kind = rnd.randrange(3)
+            if kind == 0 or not b:
+                b.insert(rnd.randint(0, len(b)), rnd.choice(vocabulary + [u'new line']))
+            elif kind == 1:
+                del b[rnd.randrange(len(b))]
+            else:
+                start = rnd.randrange(len(b))
+                block = b[start:start + rnd.randint(1, 4)]
+                del b[start:start + len(block)]
+                position = rnd.randint(0, len(b))
+                b[position:position] = block
+        _check_opcodes(a, b, line_opcodes(a, b))
+
+
+def _inserted_lines(engine, old, new):
+    """
+    The lines of the new text that aren't in the old text and contain inserted text
+    """
+    pieces = [piece.strip() for segment in get_diff_engine(engine).inserted(old, new) for piece in segment.split(u'\n')]
+    pieces = [piece for piece in pieces if len(piece) > 20]
+    return set(line for line in new.split(u'\n') if line not in old and any(piece in line for piece in pieces))
+
+
+@pytest.mark.parametrize('old, new', PAIRS)
+def test_line_and_char_inserted_text(old, new):
+    # the engines may align moved text differently, but both find the new content
+    expected = set(line for line in new.split(u'\n') if line.strip() and line not in old)
+    assert _inserted_lines('line', old, new) == expected
+    assert _inserted_lines('char', old, new) == expected
+
+
+def test_moved_block():
+    old = u'\n'.join([P1, P2, P3, P4])
+    new = u'\n'.join([P3, P4, P1, P2])
+    # the line engine reports whole moved lines, which the old text contains
+    for segment in get_diff_engine('line').inserted(old, new):
+        assert segment in old
+
+
+def test_empty_texts():
+    text = u'\n'.join([P1, P2])
+    for engine in ('line', 'char'):
+        assert get_diff_engine(engine).inserted(u'', text) == [text]
+        assert get_diff_engine(engine).inserted(text, u'') == []
+        assert get_diff_engine(engine).inserted(u'', u'') == []
+
+
+def test_changed_line():
+    old = u'\n'.join([P1, P2])
+    new = u'\n'.join([P1, P2.replace(u'monks', u'wealthy monks and merchants')])
+    inserted = get_diff_engine('line').inserted(old, new)
+    assert u''.join(inserted).split() == [u'wealthy', u'and', u'merchants']
+    assert u'wealthy' in u''.join(get_diff_engine('char').inserted(old, new))
+
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        get_diff_engine('word')
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+pytest.importorskip('pywikibot')
+
+import edit_worker
+
+PAIRS = [
+    (u'', u'A new article about a town.\n\nThe town has a river, a bridge and a market square.'),
+    (u"'''Town''' is a town.<ref>Some source</ref>\n\n== History ==\nFounded long ago.",
+     u"'''Town''' is a town.<ref>Some source</ref>\n\n== History ==\nFounded long ago by merchants travelling "
+     u"along the river.\nThe [[bridge|old bridge]] was built in the twelfth century and is still in use today.\n"
+     u"{{cite book|title=A book}}"),
+    (u'Unchanged text of the page.\n* list item', u'Unchanged text of the page.\n* list item\n* another list item'),
+]
+
+
+def test_process_pool_equivalence():
+    expected = [edit_worker.clean_and_diff(old_text, new_text) for old_text, new_text in PAIRS]
+    pool = edit_worker.process_pool(2)
+    try:
+        result = list(pool.map(edit_worker.clean_and_diff, [old for old, _ in PAIRS], [new for _, new in PAIRS]))
+    finally:
+        pool.shutdown()
+    assert result == expected
+    assert expected[1][2]  # some text is added
+
+
+def test_load_edits_equivalence():
+    pytest.importorskip('MySQLdb')
+    import plagiabot
+    from replay import Corpus, ReplaySite, ReplayPage, ReplayRevisionStore
+
+    corpus = Corpus([{'title': 'Page {}'.format(i), 'user': 'Someone', 'timestamp': '2017-01-01T00:00:00Z',
+                      'old_rev': 2 * i + 1 if old_text else 0, 'new_rev': 2 * i + 2,
+                      'old_text': old_text, 'new_text': new_text}
+                     for i, (old_text, new_text) in enumerate(PAIRS)])
+    site = ReplaySite()
+    changes = [(ReplayPage(site, edit['title']), edit['new_rev'], edit['old_rev']) for edit in corpus.edits]
+    results = []
+    for workers in [0, 2]:
+        bot = plagiabot.PlagiaBot(site, [], workers=workers)
+        bot.revisions = ReplayRevisionStore(site, corpus)
+        bot.compare_size = None
+        try:
+            edits = bot.load_edits(changes)
+            # the process pool finds the added text as well
+            results.append([(edit['old'], edit['new'], edit.get('added', edit_worker.added_text(edit['old'], edit['new'])))
+                            for edit in edits])
+        finally:
+            bot.close()
+    assert results[0] == results[1]
+    assert bot.clean_cache.get(('enwiki', 4)) == results[0][1][1]  # cleaned texts of the workers are cached
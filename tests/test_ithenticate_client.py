@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+try:
+    from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from SimpleXMLRPCServer import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+    from SocketServer import ThreadingMixIn
+
+import pytest
+
+from ithenticate_client import IThenticateClient, IThenticateError, DocumentStatusTracker, PollScheduler
+
+LATENCY = 0.2
+PROCESSING_TIME = 0.5
+
+
+class _Server(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+
+class _RequestHandler(SimpleXMLRPCRequestHandler):
+    rpc_paths = ('/rpc',)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubIThenticate(object):
+    """
+    iThenticate XML-RPC API stub. Each call takes LATENCY seconds and documents are processed
+    PROCESSING_TIME seconds after their upload
+    """
+
+    def __init__(self):
+        self.documents = {}
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+        self.server = _Server(('127.0.0.1', 0), requestHandler=_RequestHandler, logRequests=False, allow_none=True)
+        self.url = 'http://127.0.0.1:{}/rpc'.format(self.server.server_address[1])
+        for name, func in [('login', self.login), ('folder.list', self.folder_list),
+                           ('document.add', self.document_add), ('document.get', self.document_get),
+                           ('report.get', self.report_get), ('report.sources', self.report_sources)]:
+            self.server.register_function(self._slow(func), name)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def _slow(self, func):
+        def call(params):
+            with self._lock:
+                self.active += 1
+                self.max_active = max(self.max_active, self.active)
+            try:
+                time.sleep(LATENCY)
+                return func(params)
+            finally:
+                with self._lock:
+                    self.active -= 1
+        return call
+
+    def login(self, params):
+        if params['password'] != 'secret':
+            return {'status': 401}
+        return {'status': 200, 'sid': 'session'}
+
+    def folder_list(self, params):
+        assert params['sid'] == 'session'
+        return {'status': 200, 'folders': [{'id': 7, 'name': 'Other'}, {'id': 1, 'name': 'Wikipedia'}]}
+
+    def document_add(self, params):
+        assert params['folder'] == 1
+        with self._lock:
+            document_id = len(self.documents) + 1
+            self.documents[document_id] = time.time()
+        return {'status': 200, 'uploaded': [{'id': document_id}]}
+
+    def document_get(self, params):
+        if params['id'] not in self.documents:
+            return {'status': 404}
+        is_pending = time.time() - self.documents[params['id']] < PROCESSING_TIME
+        return {'status': 200, 'documents': [{'id': params['id'], 'is_pending': is_pending,
+                                              'parts': [{'id': params['id'], 'score': 50}]}]}
+
+    def report_get(self, params):
+        return {'status': 200, 'report_url': 'http://example.com/report/{}'.format(params['id'])}
+
+    def report_sources(self, params):
+        return {'status': 200, 'sources': [{'linkurl': 'http://example.com/{}'.format(params['id']), 'percent': 50}]}
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    server = StubIThenticate()
+    yield server
+    server.close()
+
+
+def test_login(stub):
+    client = IThenticateClient('user', 'secret', url=stub.url)
+    client.login()
+    assert client.sid == 'session'
+    assert client.folder['id'] == 1
+    with pytest.raises(IThenticateError):
+        IThenticateClient('user', 'wrong', url=stub.url).login()
+    client.close()
+
+
+def test_concurrent_pipeline(stub):
+    client = IThenticateClient('user', 'secret', url=stub.url, concurrency=4)
+    client.login()
+    stub.max_active = 0
+
+    start = time.time()
+    futures = [client.submit(client.upload, 'text {}'.format(i).encode('utf8'), 'Page', '/{}'.format(i))
+               for i in range(8)]
+    document_ids = [future.result() for future in futures]
+    assert sorted(document_ids) == list(range(1, 9))
+    assert time.time() - start < 8 * LATENCY * 0.75  # not serial
+    assert stub.max_active == 4  # bounded by the concurrency
+
+    tracker = DocumentStatusTracker(client)
+    for document_id in document_ids:
+        tracker.add(document_id)
+    polls = 0
+    while not tracker.ready():
+        tracker.poll()
+        polls += 1
+        assert polls < 20
+    documents = [tracker.document(document_id) for document_id in document_ids]
+    assert all(not document['is_pending'] for document in documents)
+
+    start = time.time()
+    reports = client.map(client.report, [document['parts'][0]['id'] for document in documents])
+    assert time.time() - start < 8 * 2 * LATENCY * 0.75
+    assert [sources['sources'][0]['linkurl'] for _, sources in reports] == [
+        'http://example.com/{}'.format(document_id) for document_id in document_ids]
+    assert client.rpc_calls['document.add'] == 8
+    assert client.rpc_calls['report.sources'] == 8
+    client.close()
+
+
+def test_invalid_status(stub):
+    client = IThenticateClient('user', 'secret', url=stub.url)
+    client.login()
+    tracker = DocumentStatusTracker(client)
+    tracker.add(100)  # unknown document
+    assert tracker.poll() == [100]  # retried on the next poll
+    assert tracker.failed([100]) == [100]
+    assert tracker.document(100) is None
+    assert tracker.poll() == [100]
+    assert tracker.poll() == []  # failed max_errors times
+    with pytest.raises(IThenticateError):
+        tracker.document(100)
+    client.close()
+
+
+class _FakeClient(object):
+    """
+    Client whose documents are processed or failing by the test
+    """
+
+    def __init__(self):
+        self.documents = {}  # document id -> document dict or exception
+
+    def document(self, document_id):
+        document = self.documents[document_id]
+        if isinstance(document, Exception):
+            raise document
+        return document
+
+    def map(self, func, items):
+        return [func(item) for item in items]
+
+
+def test_first_poll_delay():
+    scheduler = PollScheduler(default_wait=30)
+    scheduler.add(1, 1000, upload_time=100)
+    assert scheduler.due(now=129) == []
+    assert scheduler.due(now=130) == [1]
+    scheduler.polled([1], [], now=130)  # processed between upload and the poll
+    assert list(scheduler.processing_times[PollScheduler.bucket(1000)]) == [15]
+
+    scheduler.add(2, 1000, upload_time=200)  # the median processing time of the size bucket
+    assert scheduler.next_poll() == 215
+    scheduler.add(3, 10 ** 6, upload_time=200)  # other bucket
+    assert scheduler.next_poll([3]) == 230
+    assert scheduler.due([2, 3, 4], now=215) == [2, 4]  # not scheduled documents are always due
+
+
+def test_backoff():
+    scheduler = PollScheduler(default_wait=30, min_backoff=5, max_backoff=30)
+    scheduler.add(1, 1000, upload_time=0)
+    now = 30
+    delays = []
+    for _ in range(5):
+        scheduler.polled([1], [1], now=now)
+        delays.append(scheduler.next_poll() - now)
+        now = scheduler.next_poll()
+    assert delays == [5, 10, 20, 30, 30]
+    assert (scheduler.polls, scheduler.wasted_polls) == (5, 5)
+    scheduler.polled([1], [], now=now)
+    # processed between the last pending poll and the last poll
+    assert list(scheduler.processing_times[PollScheduler.bucket(1000)]) == [now - 15]
+    assert scheduler.scheduled == {}
+    assert list(scheduler.ready_times) == [now]
+
+
+def test_poll_errors():
+    client = _FakeClient()
+    tracker = DocumentStatusTracker(client, max_errors=2)
+    scheduler = PollScheduler(default_wait=30, min_backoff=5)
+    client.documents = {1: IThenticateError('timeout'), 2: {'is_pending': True}}
+    for document_id in (1, 2):
+        tracker.add(document_id)
+        scheduler.add(document_id, 1000, upload_time=0)
+
+    def poll(now):
+        due = scheduler.due(tracker.pending([1, 2]), now=now)
+        pending = tracker.poll(due)
+        scheduler.polled(due, pending, tracker.failed(due), now=now)
+        return due
+
+    assert poll(30) == [1, 2]
+    assert scheduler.due(now=30) == [1]  # the failed document is due for the next poll, without backoff
+    assert scheduler.next_poll([2]) == 35
+    assert scheduler.processing_times == {}
+
+    client.documents[1] = {'is_pending': False}  # recovered
+    assert poll(31) == [1]
+    assert tracker.document(1) == {'is_pending': False}
+    assert tracker.failed([1]) == []
+    # the processing time isn't affected by the failed poll
+    assert list(scheduler.processing_times[PollScheduler.bucket(1000)]) == [15.5]
+
+    client.documents[2] = IThenticateError('timeout')
+    assert poll(35) == [2]
+    assert poll(35) == [2]  # failed max_errors times
+    assert tracker.pending([2]) == [] and scheduler.scheduled == {}
+    with pytest.raises(IThenticateError):
+        tracker.document(2)
+    assert list(scheduler.processing_times[PollScheduler.bucket(1000)]) == [15.5]
+    assert scheduler.wasted_polls == 1
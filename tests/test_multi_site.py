@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+pywikibot = pytest.importorskip('pywikibot')
+pytest.importorskip('MySQLdb')
+
+import edit_worker
+import plagiabot
+from replay import ReplaySite
+
+
+def test_shared_services(monkeypatch):
+    pools = []
+    monkeypatch.setattr(edit_worker, 'process_pool', lambda workers: pools.append(workers) or object())
+    sites = [ReplaySite(), ReplaySite('he', 'hewiki', 'he.wikipedia.org')]
+    bots = []
+    for site in sites:
+        bots.append(plagiabot.PlagiaBotLive(site, workers=2, shared=bots[0] if bots else None))
+    assert pools == [2]  # a single process pool
+    for name in ('process_pool', 'poll_scheduler', 'source_fetcher', 'page_classifier'):
+        assert getattr(bots[1], name) is getattr(bots[0], name)
+    assert bots[1].revisions is not bots[0].revisions  # revisions are fetched from the wiki of the bot
+    assert bots[1].metrics is not bots[0].metrics
+
+
+class _Pool(object):
+    def __init__(self):
+        self.running = True
+
+    def shutdown(self, wait=True):
+        self.running = False
+
+
+class _StoppingBot(object):
+    def __init__(self, bot, pool, stopped):
+        self.bot = bot
+        self.site = bot.site
+        self.pool = pool
+        self.stopped = stopped
+
+    def stop(self):
+        assert self.pool.running  # the other bots may still use the pool while a bot drains its pipeline
+        self.bot.save_state()
+        self.stopped.append(self.site.dbName())
+
+    def close(self):
+        self.bot.close()
+
+
+def test_shared_pool_closed_after_all_bots_stopped(monkeypatch):
+    pool = _Pool()
+    monkeypatch.setattr(edit_worker, 'process_pool', lambda workers: pool)
+    sites = [ReplaySite(), ReplaySite('he', 'hewiki', 'he.wikipedia.org'), ReplaySite('fr', 'frwiki', 'fr.wikipedia.org')]
+    bots = []
+    for site in sites:
+        bots.append(plagiabot.PlagiaBotLive(site, workers=2, shared=bots[0] if bots else None))
+    stopped = []
+    multi_site = plagiabot.MultiSiteLive([_StoppingBot(bot, pool, stopped) for bot in bots])
+    multi_site.stop()
+    assert sorted(stopped) == ['enwiki', 'frwiki', 'hewiki']
+    assert not pool.running
+
+    pool.running = True
+    bots[1].close()  # a bot that doesn't own the services doesn't shut them down
+    assert pool.running
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+pywikibot = pytest.importorskip('pywikibot')
+
+import page_tags
+from page_tags import PageTagResolver
+
+TEMPLATES_PER_RESPONSE = 3
+
+
+class FakePage(object):
+    def __init__(self, site, title):
+        self._title = title
+
+    def toggleTalkPage(self):
+        return FakePage(None, 'Talk:' + self._title)
+
+    def title(self):
+        return self._title
+
+
+class FakeApi(object):
+    """
+    prop=templates of talk pages, with normalization of titles, redirects and continuation
+    """
+
+    def __init__(self, templates, redirects=None):
+        self.templates = templates  # talk page title -> template names
+        self.redirects = redirects or {}
+        self.requests = []
+
+    def Request(self, site, parameters):
+        self.requests.append(dict(parameters))
+        return FakeRequest(self, dict(parameters))
+
+
+class FakeRequest(object):
+    def __init__(self, fake_api, parameters):
+        self.api = fake_api
+        self.parameters = parameters
+
+    def submit(self):
+        titles = self.parameters['titles'].split('|')
+        assert len(titles) <= 50  # the API limit of titles
+        assert self.parameters['redirects'] == 1
+        query = {'normalized': [], 'redirects': [], 'pages': []}
+        pages = {}
+        pairs = []
+        for title in titles:
+            normalized = title.replace('_', ' ')
+            if normalized != title:
+                query['normalized'].append({'from': title, 'to': normalized})
+            target = self.api.redirects.get(normalized, normalized)
+            if target != normalized:
+                query['redirects'].append({'from': normalized, 'to': target})
+            if target in pages:
+                continue
+            page = pages[target] = {'title': target, 'ns': 1}
+            query['pages'].append(page)
+            pairs += [(page, template) for template in self.api.templates.get(target, [])]
+        offset = int(self.parameters.get('tlcontinue', 0))
+        for page, template in pairs[offset:offset + TEMPLATES_PER_RESPONSE]:
+            page.setdefault('templates', []).append({'ns': 10, 'title': 'Template:' + template})
+        data = {'batchcomplete': True, 'query': query}
+        if offset + TEMPLATES_PER_RESPONSE < len(pairs):
+            data = {'continue': {'tlcontinue': str(offset + TEMPLATES_PER_RESPONSE), 'continue': '||'},
+                    'query': query}
+        return data
+
+
+@pytest.fixture
+def fake_api(monkeypatch):
+    fake = FakeApi({
+        'Talk:Paris': ['WikiProject France', 'WikiProject Cities', 'Talk header', 'WikiProject France/Paris'],
+        'Talk:Lyon': ['WikiProject France'],
+        'Talk:Rome': ['WikiProject Italy', 'WikiProject Cities', 'WikiProject Europe', 'WikiProject Italy'],
+        'Talk:Roma (city)': ['WikiProject Italy'],
+    }, redirects={'Talk:Old Paris': 'Talk:Paris'})
+    monkeypatch.setattr(page_tags, 'api', fake)
+    monkeypatch.setattr(page_tags.pywikibot, 'Page', FakePage, raising=False)
+    return fake
+
+
+def test_tags(fake_api):
+    resolver = PageTagResolver(site=None)
+    assert resolver.tags(['Paris', 'Lyon', 'Rome', 'Nowhere']) == {
+        'Paris': ['WikiProject France', 'WikiProject Cities'],
+        'Lyon': ['WikiProject France'],
+        'Rome': ['WikiProject Italy', 'WikiProject Cities', 'WikiProject Europe', 'WikiProject Italy'],
+        'Nowhere': []
+    }
+    # 9 templates in the batch, 3 templates per response
+    assert len(fake_api.requests) == 3
+    assert fake_api.requests[1]['tlcontinue'] == '3' and fake_api.requests[2]['tlcontinue'] == '6'
+
+
+def test_normalized_and_redirects(fake_api):
+    resolver = PageTagResolver(site=None)
+    assert resolver.tags(['Roma_(city)', 'Old Paris', 'Old_Paris']) == {
+        'Roma_(city)': ['WikiProject Italy'],
+        'Old Paris': ['WikiProject France', 'WikiProject Cities'],
+        'Old_Paris': ['WikiProject France', 'WikiProject Cities'],
+    }
+
+
+def test_batches(fake_api):
+    resolver = PageTagResolver(site=None, batch_size=50)
+    titles = ['Page {}'.format(i) for i in range(120)] + ['Lyon']
+    tags = resolver.tags(titles)
+    assert tags['Lyon'] == ['WikiProject France']
+    assert all(tags[title] == [] for title in titles[:-1])
+    batches = [request['titles'].split('|') for request in fake_api.requests]
+    assert [len(batch) for batch in batches] == [50, 50, 21]
+    assert sorted(title for batch in batches for title in batch) == sorted('Talk:' + title for title in titles)
+
+
+def test_cache_ttl(fake_api, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(page_tags.time, 'time', lambda: now[0])
+    resolver = PageTagResolver(site=None, ttl=60)
+    assert resolver.tags(['Lyon']) == {'Lyon': ['WikiProject France']}
+    assert len(fake_api.requests) == 1
+
+    now[0] += 59
+    fake_api.templates['Talk:Lyon'] = ['WikiProject Rhône']
+    assert resolver.tags(['Lyon', 'Lyon']) == {'Lyon': ['WikiProject France']}  # cached
+    assert len(fake_api.requests) == 1
+    assert (resolver.lookups, resolver.hits) == (2, 1)
+
+    now[0] += 1  # expired
+    assert resolver.tags(['Lyon']) == {'Lyon': ['WikiProject Rhône']}
+    assert len(fake_api.requests) == 2
+    assert resolver.requests == 2
+
+
+def test_max_titles(fake_api):
+    resolver = PageTagResolver(site=None, max_titles=2)
+    resolver.tags(['Paris'])
+    resolver.tags(['Lyon'])
+    resolver.tags(['Rome'])
+    assert list(resolver._tags) == ['Lyon', 'Rome']  # the oldest title is evicted
+    requests = len(fake_api.requests)
+    resolver.tags(['Lyon'])
+    assert len(fake_api.requests) == requests
+
+
+def test_api_error(fake_api, monkeypatch):
+    def submit(self):
+        raise Exception('API error')
+    monkeypatch.setattr(FakeRequest, 'submit', submit)
+    resolver = PageTagResolver(site=None)
+    assert resolver.tags(['Paris']) == {'Paris': []}
+    assert resolver._tags == {}  # not cached, looked up again on the next report
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+pywikibot = pytest.importorskip('pywikibot')
+
+from metrics import MetricsRegistry
+from pipeline import Pipeline, Stage
+
+
+def _check(item):
+    if item % 3 == 0:
+        raise ValueError('bad item {}'.format(item))
+    return [item]
+
+
+def test_stage_errors(monkeypatch):
+    errors = []
+    monkeypatch.setattr(pywikibot, 'error', errors.append)
+    results = []
+    pipeline = Pipeline([Stage('check', _check, workers=2), Stage('collect', results.extend, batch=10, timeout=0.1)])
+    metrics = MetricsRegistry()
+    metrics.register('stage_check_errors', pipeline.stage('check').errors)
+    pipeline.start()
+    for item in range(1, 10):
+        pipeline.put(item)
+    pipeline.stop()
+
+    assert sorted(results) == [1, 2, 4, 5, 7, 8]
+    stats = dict((stat['stage'], stat) for stat in pipeline.stats())
+    assert stats['check']['errors'] == 3 and stats['check']['processed'] == 9
+    assert stats['collect']['errors'] == 0
+    assert 'errors 3' in pipeline.format_stats()
+    assert metrics.to_dict()['counters']['stage_check_errors'] == 3
+    assert len(errors) == 3
+    assert all('Error in stage check: bad item' in error and 'Traceback' in error for error in errors)
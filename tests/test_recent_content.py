@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+pytest.importorskip('pywikibot')
+pytest.importorskip('MySQLdb')
+
+import plagiabot
+from replay import Corpus, ReplayPage, ReplayRevisionStore, ReplaySite
+from shingles import RecentContentIndex
+
+CONTENT = u'The old town hall was built in the fifteenth century and rebuilt after the great fire of 1702.'
+
+
+def _corpus():
+    edits = []
+    for i, (title, namespace, bot) in enumerate([('Town', 0, False), ('Village', 0, True), ('Talk:Town', 1, False)]):
+        edits.append({'title': title, 'namespace': namespace, 'bot': bot, 'user': 'Someone', 'comment': 'typo',
+                      'timestamp': '2017-01-01T00:00:00Z', 'old_rev': 10 * i + 1, 'new_rev': 10 * i + 2,
+                      'old_text': u'{} {}'.format(title, CONTENT), 'new_text': u'{} {}.'.format(title, CONTENT)})
+    return Corpus(edits)
+
+
+def test_index_unchecked_edits():
+    corpus = _corpus()
+    site = ReplaySite()
+    bot = plagiabot.PlagiaBotLive(site, recent_content=RecentContentIndex(capacity=2 ** 12))
+    bot.index_revisions = ReplayRevisionStore(site, corpus)
+    bot.index_pipeline = bot.build_index_pipeline()
+    bot.index_pipeline.start()
+    for edit in corpus.edits:
+        page = ReplayPage(site, edit['title'], edit['namespace'])
+        page._rcinfo = Corpus.rcinfo(edit)
+        assert bot.filter_stage(page) is None  # small edits are not checked
+    bot.index_pipeline.stop()
+
+    assert bot.metrics.counter('recent_indexed_pages').value == 1  # bot edits and other namespaces are skipped
+    assert bot.index_revisions.requests == 1
+    assert bot.recent_content.contains(u'Town ' + CONTENT, 'Other page')
+    assert not bot.recent_content.contains(u'Town ' + CONTENT, 'Town')
+    assert not bot.recent_content.contains(u'Village ' + CONTENT, 'Other page')
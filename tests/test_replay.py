@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+pytest.importorskip('pywikibot')
+pytest.importorskip('MySQLdb')
+
+from replay import Corpus, FakeIThenticate, ReplayBot
+
+PARAGRAPH = (u'The {0} river valley was settled in the early medieval period by farmers who cleared the forests '
+             u'along the banks, built mills and small churches, and traded timber and grain with the towns '
+             u'downstream. In the nineteenth century the arrival of the railway turned the valley of the {0} '
+             u'into a centre of the textile industry, and the population of the villages grew rapidly as workers '
+             u'moved from the surrounding hills to the new factories and the terraced houses built next to them.')
+
+
+def _corpus(current):
+    edits = []
+    for i, name in enumerate(['Alder', 'Birch', 'Cedar']):
+        old_text = u'{} is a river.'.format(name)
+        edit = {'title': name, 'user': 'Someone', 'comment': 'history', 'timestamp': '2017-01-01T00:00:00Z',
+                'old_rev': 10 * i + 1, 'new_rev': 10 * i + 2, 'old_text': old_text,
+                'new_text': old_text + u'\n\n' + PARAGRAPH.format(name) + u'\n\n' + PARAGRAPH.format('North ' + name)}
+        if current:
+            edit['current_rev'] = 10 * i + 5
+            edit['current_text'] = old_text + u'\n\nThe article was rewritten.'
+        edits.append(edit)
+    return Corpus(edits)
+
+
+def _replay(corpus):
+    server = FakeIThenticate(latency=0, processing_time=0.1)
+    bot = ReplayBot(corpus, server, concurrency=2)
+    server.start()
+    try:
+        bot.replay()
+    finally:
+        server.stop()
+    return dict((stat['stage'], stat['processed']) for stat in bot.pipeline.stats()), bot
+
+
+def test_replay_reaches_ithenticate():
+    processed, bot = _replay(_corpus(current=True))
+    assert processed['upload'] == 3
+    assert processed['report'] == 3
+    assert bot.client.rpc_calls['document.add'] == 3
+
+
+def test_replay_without_current_revision():
+    # the latest revision is the edit itself, which contains the added text
+    processed, bot = _replay(_corpus(current=False))
+    assert processed['upload'] == 0
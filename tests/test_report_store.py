@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import report_store
+from report_store import ReportStore, text_hash
+
+TEXT = u'The bridge was built in 1850 by the city council, and rebuilt after the flood of 1910.'
+PART = {'id': 11, 'score': 40}
+SOURCES = [{'linkurl': 'http://example.com/bridge', 'percent': 40}]
+
+
+def test_text_hash():
+    assert text_hash(TEXT) == text_hash(u'  the Bridge was built in 1850, by the city council and\nrebuilt after the '
+                                        u'flood of 1910 ')
+    assert text_hash(TEXT) != text_hash(TEXT.replace(u'1850', u'1851'))
+
+
+def test_reuse_upload_and_report():
+    store = ReportStore()
+    assert store.document_id(TEXT) is None
+    store.put_document(TEXT, 5)
+    assert store.document_id(TEXT.upper() + u'!') == 5  # normalized text
+    assert not store.has_report(5)
+    assert store.report(5) is None
+
+    store.put_report(5, PART, SOURCES)
+    assert store.has_report(5)
+    assert store.report(5) == (PART, SOURCES)
+    assert (store.reused_uploads, store.reused_reports) == (1, 1)
+
+
+def test_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(report_store.time, 'time', lambda: now[0])
+    store = ReportStore(ttl=60)
+    store.put_document(TEXT, 5)
+    now[0] += 59
+    assert store.document_id(TEXT) == 5
+    now[0] += 1  # expired
+    assert store.document_id(TEXT) is None
+    store.put_document(TEXT, 6)  # uploaded again
+    assert store.document_id(TEXT) == 6
+
+
+def test_forget():
+    store = ReportStore()
+    store.put_document(TEXT, 5)
+    store.put_report(5, PART, SOURCES)
+    store.put_document(u'other text', 6)
+    store.forget(5)
+    assert store.document_id(TEXT) is None
+    assert store.report(5) is None
+    assert store.document_id(u'other text') == 6
+
+
+def test_purge(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(report_store.time, 'time', lambda: now[0])
+    store = ReportStore(ttl=60)
+    store.put_document(TEXT, 5)
+    store.put_report(5, PART, SOURCES)
+    now[0] += 30
+    store.put_document(u'other text', 6)
+    now[0] += 30
+    store.purge()
+    assert not store.has_report(5)
+    store.ttl = 3600
+    assert store.document_id(TEXT) is None  # removed, not only expired
+    assert store.document_id(u'other text') == 6
+
+
+def test_persistent(tmp_path):
+    path = str(tmp_path / 'reports.db')
+    store = ReportStore(path)
+    store.put_document(TEXT, 5)
+    store.put_report(5, PART, SOURCES)
+    store = ReportStore(path)
+    assert store.document_id(TEXT) == 5
+    assert store.report(5) == (PART, SOURCES)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+pytest.importorskip('pywikibot')
+
+import revision_store
+from revision_store import RevisionStore, CleanedTextCache
+
+
+class _Site(object):
+    def logged_in(self):
+        return False
+
+    def has_right(self, right):
+        return False
+
+
+class _Request(object):
+    """
+    prop=revisions by revids. Revisions with even ids are on page A, odd on page B, and at most
+    max_content revisions have content per response (as the API limits content size)
+    """
+    max_content = 3
+    requests = []
+
+    def __init__(self, site, parameters):
+        self.params = dict(parameters)
+        _Request.requests.append(self.params)
+
+    def submit(self):
+        revids = [int(revid) for revid in self.params['revids'].split('|')]
+        start = int(self.params.get('rvcontinue', revids[0]))
+        pages = {}
+        returned = [revid for revid in revids if revid >= start and revid != 404][:self.max_content]
+        for revid in returned:
+            title = 'A' if revid % 2 == 0 else 'B'
+            rev = {'revid': revid, 'user': 'User {}'.format(revid), 'comment': 'edit {}'.format(revid),
+                   'timestamp': '2017-01-01T00:00:00Z'}
+            if 'content' in self.params['rvprop']:
+                rev['slots'] = {'main': {'content': 'text {}'.format(revid)}}
+            if 'size' in self.params['rvprop']:
+                rev['size'] = 1000 * revid
+            pages.setdefault(title, []).append(rev)
+        data = {'query': {'pages': [{'title': title, 'revisions': revs} for title, revs in sorted(pages.items())]}}
+        remaining = [revid for revid in revids if revid > returned[-1]] if returned else []
+        if remaining:
+            data['continue'] = {'rvcontinue': str(remaining[0]), 'continue': '||'}
+        return data
+
+
+@pytest.fixture
+def requests_log(monkeypatch):
+    _Request.requests = []
+    monkeypatch.setattr(revision_store.api, 'Request', _Request)
+    return _Request.requests
+
+
+def test_prefetch_batches(requests_log):
+    store = RevisionStore(_Site(), batch_size=4)
+    store.prefetch([1, 2, 3, 4, 5, 6, 2, 0])
+    # two batches (4 + 2 revids); the first batch needs continuation
+    assert [params['revids'] for params in requests_log] == ['1|2|3|4', '1|2|3|4', '5|6']
+    assert store.requests == 3
+    assert sorted(store.revisions) == [1, 2, 3, 4, 5, 6]
+    assert store.get(4) == {'title': 'A', 'user': 'User 4', 'comment': 'edit 4',
+                            'timestamp': store.revisions[4]['timestamp'], 'text': 'text 4'}
+    assert store.revisions[3]['title'] == 'B'
+
+
+def test_prefetch_only_missing(requests_log):
+    store = RevisionStore(_Site(), batch_size=50)
+    store.prefetch([1, 2])
+    store.prefetch([2, 3])
+    assert [params['revids'] for params in requests_log] == ['1|2', '3']
+    assert store.get(404) is None  # missing revision
+    store.discard([1, 2])
+    assert sorted(store.revisions) == [3]
+
+
+def test_prefetch_sizes(requests_log):
+    store = RevisionStore(_Site(), batch_size=50)
+    store.prefetch_sizes([5, 6])
+    assert store.sizes == {5: 5000, 6: 6000}
+    assert requests_log[0]['rvprop'] == 'ids|size'
+    assert store.revisions == {}
+
+
+def test_cleaned_text_cache(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    cache = CleanedTextCache(max_entries=2, path=path)
+    calls = []
+    clean = lambda text: calls.append(text) or text.upper()
+    assert cache.get_or_clean(('enwiki', 1), lambda: 'one', clean) == 'ONE'
+    assert cache.get_or_clean(('enwiki', 1), lambda: 'one', clean) == 'ONE'
+    assert calls == ['one']
+    cache.get_or_clean(('enwiki', 2), lambda: 'two', clean)
+    cache.get_or_clean(('enwiki', 3), lambda: 'three', clean)
+    assert ('enwiki', 1) in cache  # evicted from memory, kept on disk
+    assert CleanedTextCache(path=path).get(('enwiki', 1)) == 'ONE'
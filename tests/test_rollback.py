@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+pytest.importorskip('pywikibot')
+
+import rollback
+from rollback import RollbackChecker
+
+SUMMARY = 'Reverted .*?edits? by (\\[\\[User:)?{0}|Undid revision {1}'
+ADDED = u'some text that was added in the edit and then removed by a later edit of the page'
+
+
+class _Request(object):
+    """
+    prop=revisions of a page with revisions 1..latest, rvlimit revisions per response
+    """
+    latest = 120
+    reverted_by = None  # revid of the revision that undid revision 10
+    requests = []
+
+    def __init__(self, site, parameters):
+        self.params = dict(parameters)
+        _Request.requests.append(self.params)
+
+    def submit(self):
+        start = int(self.params.get('rvcontinue', self.latest))
+        end = max(self.params['rvendid'], start - self.params['rvlimit'] + 1)
+        revisions = []
+        for revid in range(start, end - 1, -1):
+            comment = 'Undid revision 10 by [[User:Someone]]' if revid == self.reverted_by else 'edit'
+            revisions.append({'revid': revid, 'user': 'Someone' if revid == 10 else 'Other', 'comment': comment})
+        data = {'query': {'pages': [{'title': self.params['titles'], 'revisions': revisions}]}}
+        if end > self.params['rvendid']:
+            data['continue'] = {'rvcontinue': str(end - 1), 'continue': '||'}
+        return data
+
+
+@pytest.fixture
+def request_class(monkeypatch):
+    _Request.requests = []
+    monkeypatch.setattr(rollback.api, 'Request', _Request)
+    return _Request
+
+
+def test_history_continuation(request_class):
+    checker = RollbackChecker(None, SUMMARY)
+    history = checker.history('Page', 10)
+    assert len(request_class.requests) == 3
+    assert [rev['revid'] for rev in history.revisions] == list(range(120, 9, -1))
+    assert checker.history('Page', 50) is history  # cached
+
+
+def test_history_cap(request_class):
+    request_class.reverted_by = 115
+    checker = RollbackChecker(None, SUMMARY, max_requests=2)
+    history = checker.history('Page', 10)
+    assert len(request_class.requests) == 2
+    assert history.truncated
+    assert [rev['revid'] for rev in history.revisions] == list(range(120, 20, -1))
+    # the edit is older than the fetched revisions: not rolled back, although revision 115 undid it
+    assert not checker.was_rolledback('Page', 10, ADDED, lambda revid: u'unrelated current text of the page')
+    assert checker.history('Page', 30) is history  # within the fetched revisions
+    assert len(request_class.requests) == 2
+
+
+@pytest.mark.parametrize('reverted_by', [11, 115])
+def test_rollback_after_many_revisions(request_class, reverted_by):
+    request_class.reverted_by = reverted_by
+    checker = RollbackChecker(None, SUMMARY)
+    assert checker.was_rolledback('Page', 10, ADDED, lambda revid: u'unrelated current text of the page')
+
+
+def test_not_rolledback(request_class):
+    request_class.reverted_by = None
+    checker = RollbackChecker(None, SUMMARY)
+    assert not checker.was_rolledback('Page', 10, ADDED, lambda revid: u'unrelated current text of the page')
+    checker = RollbackChecker(None, SUMMARY)
+    assert checker.was_rolledback('Page', 10, ADDED, lambda revid: ADDED)  # the added text is kept
+
+
+def test_added_lines_in_current_text(request_class):
+    request_class.reverted_by = None
+    added = u'\n'.join(u'short line number {} of the text added in the edit'.format(i) for i in range(20))
+    checker = RollbackChecker(None, SUMMARY)
+    assert checker.was_rolledback('Page', 10, added, lambda revid: u'lead of the page\n' + added + u'\nfooter')
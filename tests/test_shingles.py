@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+import random
+
+from shingles import ShingleIndex, RecentContentIndex, shingles
+
+WORDS = [u'w{:02d}'.format(i) for i in range(12)]  # words of the same length: no word is part of another
+TEXT = u'the quick brown fox jumps over the lazy dog near the river bank'
+
+
+def test_recent_content_other_page():
+    index = RecentContentIndex(capacity=2 ** 10)
+    index.add(TEXT, 'Other page')
+    assert index.contains(TEXT, 'Page')
+    assert index.remove_existing_lines(TEXT + u'\nsomething new', 'Page') == u'something new'
+
+
+def test_recent_content_same_page():
+    index = RecentContentIndex(capacity=2 ** 10)
+    index.add(TEXT, 'Page')
+    assert not index.contains(TEXT, 'Page')  # e.g re-added after revert
+    assert index.contains(TEXT)
+    index.add(TEXT, 'Other page')
+    assert index.contains(TEXT, 'Page')  # the text exists in another page as well
+
+
+def test_recent_content_short_line():
+    index = RecentContentIndex(capacity=2 ** 10)
+    index.add(TEXT, 'Other page')
+    assert not index.contains(u'quick brown fox', 'Page')
+
+
+def test_recent_content_rotation_and_save(tmp_path):
+    path = str(tmp_path / 'index')
+    index = RecentContentIndex(capacity=2 ** 6, path=path)
+    index.add(TEXT, 'Old page')
+    for i in range(40):
+        index.add(u'filler text number {} of the index'.format(i), 'Filler')
+    assert index.previous is not None
+    index.save()
+
+    loaded = RecentContentIndex(capacity=2 ** 6, path=path)
+    assert loaded.count == index.count
+    for line in [TEXT, u'filler text number 39 of the index']:
+        assert loaded.contains(line, 'Page') == index.contains(line, 'Page')
+    assert not loaded.contains(u'filler text number 39 of the index', 'Filler')
+
+
+def _old_texts(rnd):
+    return [u'\n'.join(u' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(0, 30))) for _ in range(20))
+            for _ in range(3)]
+
+
+def _new_lines(rnd, texts):
+    old_lines = [line.split() for text in texts for line in text.split(u'\n')]
+    old_lines = [words for words in old_lines if len(words) > 1]
+    lines = []
+    for _ in range(300):
+        words = rnd.choice(old_lines)
+        start = rnd.randrange(len(words))
+        part = words[start:start + rnd.randint(1, 15)]
+        kind = rnd.randrange(4)
+        if kind == 1:  # stitched from pieces of the old texts
+            other = rnd.choice(old_lines)
+            start = rnd.randrange(len(other))
+            part += other[start:start + rnd.randint(1, 15)]
+        elif kind == 2:
+            part = [rnd.choice(WORDS) for _ in range(rnd.randint(1, 10))]
+        elif kind == 3:  # continues to the next line of the old text
+            part = words[start:] + rnd.choice(old_lines)[:rnd.randint(1, 5)]
+        lines.append(u' '.join(part))
+    return lines
+
+
+def test_shingle_index_equals_substring_search():
+    rnd = random.Random(1)
+    stitched = 0
+    for _ in range(20):
+        texts = _old_texts(rnd)
+        index = ShingleIndex()
+        for text in texts:
+            index.add(text)
+        for line in _new_lines(rnd, texts):
+            expected = any(line in text for text in texts)
+            assert index.contains(line) == expected, line
+            if not expected and all(shingle in index.positions for shingle in shingles(line)):
+                stitched += 1
+    assert stitched > 0  # lines with all shingles in the index but not consecutively
+
+
+def test_shingle_index_stitched_line():
+    index = ShingleIndex()
+    index.add(TEXT)
+    assert index.contains(u'brown fox jumps over the lazy')
+    assert not index.contains(u'the quick brown fox jumps over the river bank')
+    assert index.remove_existing_lines(u'quick brown fox jumps over\nthe lazy dog the quick brown') == \
+        u'the lazy dog the quick brown'
+
+
+def test_shingle_index_lines():
+    index = ShingleIndex()
+    index.add(u'one two three four five\nsix seven eight nine ten')
+    assert index.contains(u'six seven eight nine ten')
+    assert not index.contains(u'four five six seven eight')
+    assert index.contains(u'  one two  three four five ')  # whitespace is normalized
+    assert not index.contains(u'ne two three four five')  # part of a word
+    assert index.contains(u'two three')  # shorter than a shingle: substring search
+
+
+def test_shingle_index_coverage_short_lines():
+    rnd = random.Random(3)
+    text = u'\n'.join(u' '.join(rnd.choice(WORDS) for _ in range(6)) for _ in range(20))
+    index = ShingleIndex()
+    index.add(u'intro line of the page\n' + text + u'\nlast line of the page')
+    assert index.coverage(text) == 1.0
+    assert index.coverage(text + u'\n' + u'some new text added to the page here') < 1.0
+    assert index.coverage(u'x01 x02') == 0.0
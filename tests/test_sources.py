@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+
+requests = pytest.importorskip('requests')
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+from sources import SourcePage, PageClassifier, SourceClassificationCache, SourceFetcher
+
+URL = 'http://example.com/page'
+LINKS = ''.join('<a href="/{0}">link {0}</a>'.format(i) for i in range(20))
+
+
+@pytest.mark.parametrize('status_code, verdict, level', [
+    (404, 'skip', 'url'),
+    (403, 'skip', 'url'),
+    (410, 'source', 'url'),
+    (500, 'skip', None),
+    (503, 'source', None),
+    (429, 'source', None),
+])
+def test_classify_status(status_code, verdict, level):
+    result = PageClassifier().classify(SourcePage(URL, status_code, ''), 'Example')
+    assert result[0] == verdict and result[2] == level
+
+
+def test_classify_page():
+    classifier = PageClassifier()
+    mirror = SourcePage(URL, 200, '<html>material from the Wikipedia article Example' + LINKS)
+    assert classifier.classify(mirror, 'Example') == ('source', PageClassifier.MIRROR_HINT, 'page')
+    parked = SourcePage(URL, 200, '<html>This domain is for sale' + LINKS)
+    assert classifier.classify(parked, 'Example') == ('skip', PageClassifier.LOW_QUALITY_HINT, 'url')
+    assert classifier.classify(SourcePage(URL, 200, '<html>Some text' + LINKS), 'Example') == ('source', '', 'page')
+
+
+def test_cache_levels():
+    cache = SourceClassificationCache()
+    cache.put(URL, 'Example', 'source', 'hint', 'page')
+    assert cache.get(URL, 'Example') == ('source', 'hint')
+    assert cache.get(URL, 'Other') is None
+    cache.put(URL, 'Example', 'skip', '', 'url')
+    assert cache.get(URL, 'Other') == ('skip', '')
+    assert cache.get('http://example.com/other', 'Example') is None
+
+
+def test_cache_purge():
+    cache = SourceClassificationCache(ttl=0.05)
+    cache.put(URL, 'Example', 'skip', '', 'url')
+    time.sleep(0.1)
+    assert cache.get(URL, 'Example') is None
+    cache.purge()
+    assert cache._db.execute('SELECT COUNT(*) FROM source_classification').fetchone()[0] == 0
+
+
+class _Handler(BaseHTTPRequestHandler):
+    active = 0
+    max_active = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if not self.path.startswith('/slow'):
+            self._respond()
+            return
+        with _Handler.lock:  # concurrent requests of slow pages
+            _Handler.active += 1
+            _Handler.max_active = max(_Handler.max_active, _Handler.active)
+        try:
+            self._respond()
+        finally:
+            with _Handler.lock:
+                _Handler.active -= 1
+
+    def _respond(self):
+        if self.path == '/missing':
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.end_headers()
+        try:
+            if self.path == '/drip':  # a byte every 0.1s for 10s
+                for _ in range(100):
+                    self.wfile.write(b'x')
+                    self.wfile.flush()
+                    time.sleep(0.1)
+            elif self.path == '/large':
+                for _ in range(100):
+                    self.wfile.write(b'y' * 64 * 1024)
+            elif self.path.startswith('/slow'):
+                time.sleep(0.2)
+                self.wfile.write(b'<html>slow')
+            else:
+                self.wfile.write(b'<html>ok')
+        except (IOError, OSError):  # the client closed the connection
+            pass
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+@pytest.fixture(scope='module')
+def server():
+    httpd = _Server(('127.0.0.1', 0), _Handler)
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield 'http://127.0.0.1:{}'.format(httpd.server_address[1])
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_fetch(server):
+    fetcher = SourceFetcher()
+    page = fetcher.fetch(server + '/page')
+    assert page.status_code == 200 and page.text == '<html>ok' and not page.truncated
+    assert fetcher.fetch(server + '/missing').status_code == 404
+
+
+def test_fetch_deadline(server):
+    fetcher = SourceFetcher(timeout=0.5)
+    start = time.time()
+    with pytest.raises(requests.exceptions.Timeout):
+        fetcher.fetch(server + '/drip')
+    assert time.time() - start < 1.5
+
+
+def test_fetch_truncated(server):
+    fetcher = SourceFetcher(max_bytes=100 * 1024)
+    page = fetcher.fetch(server + '/large')
+    assert page.truncated and len(page.text) == 100 * 1024
+
+
+def test_fetch_all(server):
+    fetcher = SourceFetcher(workers=8, per_host=2, timeout=0.5)
+    _Handler.max_active = 0
+    urls = [server + '/slow{}'.format(i) for i in range(6)] + [server + '/drip']
+    pages = fetcher.fetch_all(urls)
+    assert sorted(pages) == sorted(urls)
+    assert isinstance(pages[server + '/drip'], requests.exceptions.Timeout)
+    assert all(pages[url].text == '<html>slow' for url in urls[:-1])
+    assert _Handler.max_active == 2
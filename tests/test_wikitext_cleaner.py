@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+import os
+import random
+import re
+
+import pytest
+
+pywikibot = pytest.importorskip('pywikibot')
+
+import wikitext_cleaner
+from wikitext_cleaner import remove_templates, remove_wikitext, remove_short_refs, WORDS_QUOTE
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'wikitext')
+FRAGMENTS = [u'{{', u'}}', u'{', u'}', u'{{cite|a=b}}', u'text ', u'\n', u'|', u'| x = 1\n', u'[[a|b]]', u'[[c]]',
+             u"'''b'''", u"''i''", u'<ref>short ref</ref>', u'<ref name="n">ref</ref>', u'<ref name="n"/>',
+             u'\n{| class="wikitable"', u'\n|-', u'\n|}', u'\n! h |', u'\n== T ==', u'[http://x.org y]',
+             u'File:a b.jpg', u'<div>', u'</div>', u'ref', u'short']
+REF_FRAGMENTS = [u'<ref>', u'</ref>', u'<ref name="a">', u'<ref name=b>', u'a', u'b', u'ab', u' ', u'a b', u'ref',
+                 u'>', u'<', u'/', u'x y z w', u'name', u'"', u'=']
+
+
+def legacy_remove_wikitext(text):
+    """
+    The cleaning of wikitext before the cleaner module (PlagiaBot.remove_wikitext)
+    """
+    if text is None or len(text) == 0: return ''
+    refs = re.findall('<ref(?: .+?)?>(.*?)</ref>', text)
+    for ref in refs:
+        if ref.count(' ') < WORDS_QUOTE:
+            text = text.replace(ref, '')
+    clean_text = pywikibot.textlib.removeHTMLParts(text, keeptags=[])
+    clean_text  =re.sub("\[\[Category:.+?\]\]", "", clean_text)  # categories
+    clean_text = re.sub("\[\[[^\[\]]+\|([^\[\]]+)\]\]", "\\1", clean_text)  # [[link|textlink]]
+    clean_text = re.sub("\[\[(.+?)\]\]", "\\1", clean_text)  # [[links]]
+    clean_text = re.sub("\n(==+)\s*([^=]+)\s*\\1","\n\\2", clean_text) # remove == from titles
+    clean_text = re.sub("'''([^']+)'''","\\1", clean_text) # remove ''' bold
+    clean_text = re.sub("''([^']+)''","\\1", clean_text) # remove '' italics
+    clean_text = re.sub("(align|class|style)\s*=\s*(\".+?\"|[^\"].+? )", "", clean_text)  # common in wikitables (align|class|style) etc
+    clean_text = re.sub("\n\\|-.{0,20}","", clean_text) # clean wikitables new lines
+    clean_text = re.sub("(\n\\|}|\n\\{\\| *[^\n]*)","", clean_text) # clean open/end of wikitables
+    clean_text = re.sub("\n![^\\|]+\\|","\n", clean_text) # clean table headers
+    clean_text = re.sub("\s*\\| *\w+ *= *(\"?#?[A-Za-z0-9]+\"?|\n)","", clean_text) # clean technical definitions (in templates and tables)
+    clean_text = re.sub("(?:\\| *)+","|", clean_text) # compact
+    clean_text = re.sub("\\n\\| *","\\n", clean_text) # trim |
+    clean_text = re.sub("(File|Image):[^\\.]+?\\.(jpg|png|pdf|svg)","", clean_text, re.I) # file names
+
+    orig = clean_text
+    same = False
+    while not same:
+        clean_text = re.sub("\{\{[^\{]*?\}\}", "", clean_text, re.M)  # templates
+        same = clean_text == orig
+        orig = clean_text
+    clean_text = re.sub("\[https?:.*?\]", "", clean_text)  # external links
+
+    return clean_text
+
+
+def legacy_remove_templates(text):
+    same = False
+    while not same:
+        orig = text
+        text = re.sub("\{\{[^\{]*?\}\}", "", text)
+        same = text == orig
+    return text
+
+
+def _corpus():
+    for file_name in sorted(os.listdir(CORPUS)):
+        with open(os.path.join(CORPUS, file_name), 'rb') as f:
+            yield file_name, f.read().decode('utf8')
+
+
+def _random_texts(count, seed=1, fragments=FRAGMENTS):
+    rnd = random.Random(seed)
+    for _ in range(count):
+        yield u''.join(rnd.choice(fragments) for _ in range(rnd.randint(0, 40)))
+
+
+def legacy_remove_short_refs(text, words_quote):
+    for ref in re.findall('<ref(?: .+?)?>(.*?)</ref>', text):
+        if ref.count(' ') < words_quote:
+            text = text.replace(ref, '')
+    return text
+
+
+@pytest.mark.parametrize('file_name, text', list(_corpus()))
+def test_corpus(file_name, text):
+    assert remove_wikitext(text) == legacy_remove_wikitext(text)
+
+
+def test_corpus_concatenated():
+    text = u'\n'.join(text for _, text in _corpus())
+    assert remove_wikitext(text) == legacy_remove_wikitext(text)
+
+
+def test_random_texts():
+    for text in _random_texts(2000):
+        assert remove_wikitext(text) == legacy_remove_wikitext(text), text
+
+
+def test_remove_templates():
+    for _, text in _corpus():
+        assert remove_templates(text) == legacy_remove_templates(text)
+    for text in _random_texts(2000, seed=2):
+        assert remove_templates(text) == legacy_remove_templates(text), text
+
+
+def test_remove_short_refs():
+    for text in _random_texts(20000, seed=3, fragments=REF_FRAGMENTS):
+        assert remove_short_refs(text, 3) == legacy_remove_short_refs(text, 3), text
+
+
+def test_remove_short_refs_single_scan(monkeypatch):
+    def replace_short_refs(text, words_quote):
+        raise AssertionError('replacing each ref in the whole text')
+    monkeypatch.setattr(wikitext_cleaner, '_replace_short_refs', replace_short_refs)
+    text = u''.join(u'Sentence {0}.<ref name="r{0}">Author {0}, Book {0}, p. {0}</ref> '.format(i) for i in range(100))
+    assert remove_short_refs(text) == legacy_remove_short_refs(text, WORDS_QUOTE)
+    with pytest.raises(AssertionError):  # the text of a ref is in the text as well
+        remove_short_refs(text + u'Author 5, Book 5, p. 5')
+
+
+def test_empty():
+    assert remove_wikitext(None) == ''
+    assert remove_wikitext(u'') == ''
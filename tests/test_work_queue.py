@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+pywikibot = pytest.importorskip('pywikibot')
+pytest.importorskip('MySQLdb')
+
+from pywikibot.site import Namespace
+
+import plagiabot
+from replay import ReplaySite, ReplayPage
+from work_queue import WorkQueue
+
+
+class _Page(ReplayPage):
+    def namespace(self):
+        return Namespace(0, '')  # as pywikibot.Page.namespace()
+
+
+def _upload():
+    bot = plagiabot.PlagiaBot(ReplaySite(), [])
+    bot.upload_diff = lambda text, title, diff_id: 42
+    edit = {
+        'page': _Page(bot.site, 'Example'),
+        'new_rev': 2,
+        'prev_rev': 1,
+        'editor': 'Someone',
+        'diff_date': pywikibot.Timestamp(2017, 1, 1, 12, 30)
+    }
+    return bot.upload_edit(edit, 'Some added text')
+
+
+def test_upload_round_trip(tmp_path):
+    queue = WorkQueue(str(tmp_path / 'queue.db'))
+    upload = _upload()
+    queue.add_edit('Example', 2, 1)
+    queue.add_upload(upload)
+    assert queue.pending_edits() == []
+
+    [(stored, upload_time)] = queue.uploads()
+    rev_details, upload_id, added_lines = stored
+    assert upload_id == 42
+    assert added_lines == 'Some added text'
+    assert rev_details['ns'] == 0
+    assert rev_details['diff_date'] == upload[0]['diff_date']
+    assert dict(rev_details, diff_date=None) == dict(upload[0], diff_date=None)
+
+    queue.remove_uploads([stored])
+    assert queue.uploads() == []
+
+
+def test_pending_edits_and_checkpoint(tmp_path):
+    queue = WorkQueue(str(tmp_path / 'queue.db'))
+    queue.add_edit('A', 5, 4, timestamp=1000)
+    queue.add_edit('B', 3, 0)
+    assert queue.pending_edits() == [('B', 3, 0), ('A', 5, 4)]
+    assert queue.checkpoint() == (1000, 5)
+    queue.remove_edit(3)
+    assert queue.pending_edits() == [('A', 5, 4)]
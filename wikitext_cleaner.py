@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Cleaning of wikitext before diffing and sending text to the server.
+
+The patterns are compiled once, short refs are removed in a single scan instead of replacing each
+ref in the whole text, nested templates are removed in a single scan instead of repeating the template
+regex until nothing changes, and patterns are skipped for text without their markup (e.g the table
+patterns for text without tables).
+
+Benchmark (and comparison with the previous cleaning):
+    python wikitext_cleaner.py page1.txt [page2.txt ...]
+"""
+import re
+import sys
+import time
+from collections import OrderedDict
+
+import pywikibot
+
+WORDS_QUOTE = 50
+
+_ref_re = re.compile('<ref(?: .+?)?>(.*?)</ref>')
+_word_re = re.compile('\w+', re.U)
+# (pattern, replacement, markup) - the pattern is applied only if the text contains one of the markup strings
+_substitutions = [
+    (re.compile("\[\[Category:.+?\]\]"), "", ("[[Category:",)),  # categories
+    (re.compile("\[\[[^\[\]]+\|([^\[\]]+)\]\]"), "\\1", ("[[",)),  # [[link|textlink]]
+    (re.compile("\[\[(.+?)\]\]"), "\\1", ("[[",)),  # [[links]]
+    (re.compile("\n(==+)\s*([^=]+)\s*\\1"), "\n\\2", ("\n==",)),  # remove == from titles
+    (re.compile("'''([^']+)'''"), "\\1", ("'''",)),  # remove ''' bold
+    (re.compile("''([^']+)''"), "\\1", ("''",)),  # remove '' italics
+    (re.compile("(align|class|style)\s*=\s*(\".+?\"|[^\"].+? )"), "", ("align", "class", "style")),  # common in wikitables (align|class|style) etc
+    (re.compile("\n\\|-.{0,20}"), "", ("\n|-",)),  # clean wikitables new lines
+    (re.compile("(\n\\|}|\n\\{\\| *[^\n]*)"), "", ("\n|}", "\n{|")),  # clean open/end of wikitables
+    (re.compile("\n![^\\|]+\\|"), "\n", ("\n!",)),  # clean table headers
+    (re.compile("\s*\\| *\w+ *= *(\"?#?[A-Za-z0-9]+\"?|\n)"), "", ("|",)),  # clean technical definitions (in templates and tables)
+    (re.compile("(?:\\| *)+"), "|", ("|",)),  # compact
+    (re.compile("\\n\\| *"), "\\n", ("\n|",)),  # trim |
+]
+_file_re = re.compile("(File|Image):[^\\.]+?\\.(jpg|png|pdf|svg)")
+_external_link_re = re.compile("\[https?:.*?\]")
+
+
+def remove_templates(text):
+    """
+    Remove templates (including nested templates) in a single scan.
+
+    Equivalent to removing the innermost {{...}} (without { inside) until nothing changes.
+    """
+    if '{{' not in text:
+        return text
+    out = []
+    braces = []  # positions in out of '{' characters
+    i = 0
+    n = len(text)
+    while i < n:
+        c = text[i]
+        if c == '{':
+            braces.append(len(out))
+            out.append(c)
+        elif c == '}' and out and out[-1] == '}' and len(braces) > 1 and braces[-1] == braces[-2] + 1:
+            # the last '{' is part of '{{' with no '{' after it - this closes a template
+            start = braces[-2]
+            if len(out) - 1 > start + 1:  # the '}}' must follow the '{{'
+                del out[start:]
+                del braces[-2:]
+            else:
+                out.append(c)
+        else:
+            out.append(c)
+        i += 1
+    return ''.join(out)
+
+
+def _replace_short_refs(text, words_quote):
+    """
+    Previous removal of short refs: the text of each short ref is replaced in the whole text
+    """
+    for ref in _ref_re.findall(text):
+        if ref.count(' ') < words_quote and ref and ref in text:
+            text = text.replace(ref, '')
+    return text
+
+
+def remove_short_refs(text, words_quote=WORDS_QUOTE):
+    """
+    Remove the text of refs with less than words_quote words, in a single scan of the refs.
+
+    Equivalent to replacing the text of each short ref in the whole text: if the text of a ref is found
+    elsewhere after the scan, is part of the text of another ref or has markup, the replacement is used.
+    The text of a ref can be found elsewhere only if its inner words (the first and last may be partial)
+    are words of the text, so most refs are ruled out by a set of the words of the text
+    """
+    short_refs = []
+
+    def remove(match):
+        ref = match.group(1)
+        if ref and ref.count(' ') < words_quote:
+            short_refs.append(ref)
+            return match.group(0).replace(ref, '')
+        return match.group(0)
+
+    clean_text = _ref_re.sub(remove, text)
+    if len(short_refs) == 0:
+        return clean_text
+    short_refs = list(OrderedDict.fromkeys(short_refs))
+    joined = '\0'.join(short_refs)
+    if '<' in joined or '>' in joined or any(joined.count(ref) > 1 for ref in short_refs):
+        return _replace_short_refs(text, words_quote)
+    words = set(_word_re.findall(clean_text))
+    for ref in short_refs:
+        if all(word in words for word in _word_re.findall(ref)[1:-1]) and ref in clean_text:
+            return _replace_short_refs(text, words_quote)
+    return clean_text
+
+
+def remove_wikitext(text, words_quote=WORDS_QUOTE):
+    """
+    Clean some html/wikitext from the text
+    """
+    # you may use mwparserfromhell to get cleaner text (but this requires dependency...)
+    if text is None or len(text) == 0:
+        return ''
+    text = remove_short_refs(text, words_quote)
+    clean_text = pywikibot.textlib.removeHTMLParts(text, keeptags=[])
+    for pattern, replacement, markup in _substitutions:
+        if any(part in clean_text for part in markup):
+            clean_text = pattern.sub(replacement, clean_text)
+    clean_text = _file_re.sub("", clean_text, 2)  # file names
+    clean_text = remove_templates(clean_text)
+    clean_text = _external_link_re.sub("", clean_text)  # external links
+    return clean_text
+
+
+def previous_remove_wikitext(text, words_quote=WORDS_QUOTE):
+    """
+    The cleaning before this module (PlagiaBot.remove_wikitext), for comparison
+    """
+    if text is None or len(text) == 0: return ''
+    refs = re.findall('<ref(?: .+?)?>(.*?)</ref>', text)
+    for ref in refs:
+        if ref.count(' ') < words_quote:
+            text = text.replace(ref, '')
+    clean_text = pywikibot.textlib.removeHTMLParts(text, keeptags=[])
+    clean_text  =re.sub("\[\[Category:.+?\]\]", "", clean_text)  # categories
+    clean_text = re.sub("\[\[[^\[\]]+\|([^\[\]]+)\]\]", "\\1", clean_text)  # [[link|textlink]]
+    clean_text = re.sub("\[\[(.+?)\]\]", "\\1", clean_text)  # [[links]]
+    clean_text = re.sub("\n(==+)\s*([^=]+)\s*\\1","\n\\2", clean_text) # remove == from titles
+    clean_text = re.sub("'''([^']+)'''","\\1", clean_text) # remove ''' bold
+    clean_text = re.sub("''([^']+)''","\\1", clean_text) # remove '' italics
+    clean_text = re.sub("(align|class|style)\s*=\s*(\".+?\"|[^\"].+? )", "", clean_text)  # common in wikitables (align|class|style) etc
+    clean_text = re.sub("\n\\|-.{0,20}","", clean_text) # clean wikitables new lines
+    clean_text = re.sub("(\n\\|}|\n\\{\\| *[^\n]*)","", clean_text) # clean open/end of wikitables
+    clean_text = re.sub("\n![^\\|]+\\|","\n", clean_text) # clean table headers
+    clean_text = re.sub("\s*\\| *\w+ *= *(\"?#?[A-Za-z0-9]+\"?|\n)","", clean_text) # clean technical definitions (in templates and tables)
+    clean_text = re.sub("(?:\\| *)+","|", clean_text) # compact
+    clean_text = re.sub("\\n\\| *","\\n", clean_text) # trim |
+    clean_text = re.sub("(File|Image):[^\\.]+?\\.(jpg|png|pdf|svg)","", clean_text, re.I) # file names
+
+    orig = clean_text
+    same = False
+    while not same:
+        clean_text = re.sub("\{\{[^\{]*?\}\}", "", clean_text, re.M)  # templates
+        same = clean_text == orig
+        orig = clean_text
+    clean_text = re.sub("\[https?:.*?\]", "", clean_text)  # external links
+
+    return clean_text
+
+
+def main(*args):
+    """
+    Measure cleaning time of page texts given as files, compared to the previous cleaning
+    """
+    if len(args) == 0:
+        print(__doc__)
+        return
+    texts = []
+    for file_name in args:
+        with open(file_name, 'rb') as f:
+            texts.append(f.read().decode('utf8'))
+    start = time.time()
+    previous = [previous_remove_wikitext(text) for text in texts]
+    previous_time = time.time() - start
+    start = time.time()
+    cleaned = [remove_wikitext(text) for text in texts]
+    cleaning_time = time.time() - start
+    print('{} pages cleaned in {:.3f}s (previous cleaning: {:.3f}s), {} different'.format(
+        len(texts), cleaning_time, previous_time, sum(1 for a, b in zip(previous, cleaned) if a != b)))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
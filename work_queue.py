@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Durable queue of the live bot work.
+
+Pending edits (changes that weren't checked yet), in-flight uploads (waiting for iThenticate report)
+and a checkpoint of the last recorded recent change are stored in SQLite database (WAL mode),
+so a restarted bot resumes polling the existing uploads and continues the recent changes stream
+from where it stopped.
+"""
+import json
+import sqlite3
+import threading
+import time
+
+import pywikibot
+
+
+class WorkQueue(object):
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS pending_edits (new_rev INTEGER PRIMARY KEY, title TEXT, '
+                         'prev_rev INTEGER, added REAL)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS uploads (upload_id INTEGER, new_rev INTEGER PRIMARY KEY, '
+                         'rev_details TEXT, added_lines TEXT, added REAL)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS checkpoint (name TEXT PRIMARY KEY, timestamp INTEGER, '
+                         'revid INTEGER)')
+        self._db.commit()
+
+    def add_edit(self, title, new_rev, prev_rev, timestamp=None):
+        """
+        Record pending edit. If timestamp is given, it is also the new checkpoint of the stream
+        """
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO pending_edits (new_rev, title, prev_rev, added) VALUES (?, ?, ?, ?)',
+                             (new_rev, title, prev_rev, time.time()))
+            if timestamp is not None:
+                self._db.execute('INSERT OR REPLACE INTO checkpoint (name, timestamp, revid) VALUES (?, ?, ?)',
+                                 ('rc', timestamp, new_rev))
+            self._db.commit()
+
+    def remove_edit(self, new_rev):
+        with self._lock:
+            self._db.execute('DELETE FROM pending_edits WHERE new_rev = ?', (new_rev,))
+            self._db.commit()
+
+    def pending_edits(self):
+        """
+        List of (title, new_rev, prev_rev) of the pending edits, oldest first
+        """
+        with self._lock:
+            return self._db.execute('SELECT title, new_rev, prev_rev FROM pending_edits ORDER BY new_rev').fetchall()
+
+    def add_upload(self, upload):
+        """
+        Record upload entry (revision details, upload id, added text), replacing its pending edit
+        """
+        rev_details, upload_id, added_lines = upload
+        rev_details = dict(rev_details, diff_date=rev_details['diff_date'].isoformat())
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO uploads (upload_id, new_rev, rev_details, added_lines, added) '
+                             'VALUES (?, ?, ?, ?, ?)',
+                             (upload_id, rev_details['new'], json.dumps(rev_details), added_lines, time.time()))
+            self._db.execute('DELETE FROM pending_edits WHERE new_rev = ?', (rev_details['new'],))
+            self._db.commit()
+
+    def remove_uploads(self, uploads):
+        with self._lock:
+            self._db.executemany('DELETE FROM uploads WHERE new_rev = ?',
+                                 [(rev_details['new'],) for rev_details, _, _ in uploads])
+            self._db.commit()
+
+    def uploads(self):
+        """
+        List of the in-flight upload entries (revision details, upload id, added text) and their upload times
+        """
+        with self._lock:
+            rows = self._db.execute('SELECT rev_details, upload_id, added_lines, added FROM uploads '
+                                    'ORDER BY new_rev').fetchall()
+        uploads = []
+        for rev_details, upload_id, added_lines, added in rows:
+            rev_details = json.loads(rev_details)
+            rev_details['diff_date'] = pywikibot.Timestamp.fromISOformat(rev_details['diff_date'])
+            uploads.append(((rev_details, upload_id, added_lines), added))
+        return uploads
+
+    def checkpoint(self):
+        """
+        Tuple of (timestamp, revid) of the last recorded recent change, or None
+        """
+        with self._lock:
+            return self._db.execute('SELECT timestamp, revid FROM checkpoint WHERE name = ?', ('rc',)).fetchone()
+
+    def format_stats(self):
+        with self._lock:
+            edits = self._db.execute('SELECT COUNT(*) FROM pending_edits').fetchone()[0]
+            uploads = self._db.execute('SELECT COUNT(*) FROM uploads').fetchone()[0]
+        return 'Work queue: {} pending edits, {} uploads in flight'.format(edits, uploads)
+
+    def close(self):
+        with self._lock:
+            self._db.close()